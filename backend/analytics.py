@@ -0,0 +1,108 @@
+"""
+Intrusion analytics
+
+Answers trend and heatmap queries from the rollup tables that
+Database.log_intrusion keeps up to date (intrusion_hourly, intrusion_daily,
+intrusion_hour_of_week), so no query scans intrusion_logs. Rollups are
+bucketed in UTC; tz_offset (minutes east of UTC) shifts results to the
+viewer's local time in whole hours.
+"""
+from datetime import datetime, timedelta
+
+HOUR_FORMAT = '%Y-%m-%d %H:00'
+
+
+def _placeholders(values):
+    return ','.join('?' * len(values))
+
+
+class Analytics:
+    """Read-side of the intrusion rollups"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _query(self, sql, params):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+
+    def summary(self, camera_ids, days=7):
+        """Alert totals and peak person count per camera over the last `days` days"""
+        if not camera_ids:
+            return []
+        since = (datetime.utcnow() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        return self._query(f'''
+            SELECT c.id AS camera_id, c.name AS camera_name,
+                   COALESCE(SUM(d.alerts), 0) AS alerts,
+                   COALESCE(SUM(d.persons), 0) AS persons,
+                   COALESCE(MAX(d.peak_persons), 0) AS peak_persons
+            FROM cameras c
+            LEFT JOIN intrusion_daily d ON d.camera_id = c.id AND d.day >= ?
+            WHERE c.id IN ({_placeholders(camera_ids)})
+            GROUP BY c.id
+            ORDER BY alerts DESC
+        ''', (since, *camera_ids))
+
+    def trends(self, camera_ids, granularity='day', days=7, tz_offset=0):
+        """Alert series per hour or day over the last `days` days, all cameras combined"""
+        if not camera_ids:
+            return []
+        shift = timedelta(hours=round(tz_offset / 60))
+
+        if granularity == 'day' and not shift:
+            since = (datetime.utcnow() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+            return self._query(f'''
+                SELECT day AS bucket, SUM(alerts) AS alerts, SUM(persons) AS persons,
+                       MAX(peak_persons) AS peak_persons
+                FROM intrusion_daily
+                WHERE camera_id IN ({_placeholders(camera_ids)}) AND day >= ?
+                GROUP BY day ORDER BY day
+            ''', (*camera_ids, since))
+
+        # Local days don't line up with UTC days: regroup the hourly rollup instead
+        since = (datetime.utcnow() - timedelta(days=days)).strftime(HOUR_FORMAT)
+        rows = self._query(f'''
+            SELECT hour, SUM(alerts) AS alerts, SUM(persons) AS persons,
+                   MAX(peak_persons) AS peak_persons
+            FROM intrusion_hourly
+            WHERE camera_id IN ({_placeholders(camera_ids)}) AND hour >= ?
+            GROUP BY hour ORDER BY hour
+        ''', (*camera_ids, since))
+
+        series = {}
+        for row in rows:
+            local = datetime.strptime(row['hour'], HOUR_FORMAT) + shift
+            bucket = local.strftime(HOUR_FORMAT if granularity == 'hour' else '%Y-%m-%d')
+            entry = series.setdefault(bucket, {'bucket': bucket, 'alerts': 0, 'persons': 0, 'peak_persons': 0})
+            entry['alerts'] += row['alerts']
+            entry['persons'] += row['persons']
+            entry['peak_persons'] = max(entry['peak_persons'], row['peak_persons'])
+        return list(series.values())
+
+    def heatmap(self, camera_ids, tz_offset=0, top=3):
+        """Alerts by weekday (0 = Monday, as in schedules) x hour of day, plus the busiest hours of day"""
+        cells = [[0] * 24 for _ in range(7)]
+        if camera_ids:
+            rows = self._query(f'''
+                SELECT weekday, hour, SUM(alerts) AS alerts
+                FROM intrusion_hour_of_week
+                WHERE camera_id IN ({_placeholders(camera_ids)})
+                GROUP BY weekday, hour
+            ''', tuple(camera_ids))
+            shift = round(tz_offset / 60)
+            for row in rows:
+                # Stored as SQLite's %w (0 = Sunday)
+                weekday = (row['weekday'] + 6) % 7
+                slot = (weekday * 24 + row['hour'] + shift) % 168
+                cells[slot // 24][slot % 24] += row['alerts']
+
+        by_hour = [sum(day[hour] for day in cells) for hour in range(24)]
+        busiest = sorted((hour for hour in range(24) if by_hour[hour]), key=lambda h: -by_hour[h])[:top]
+        return {
+            'heatmap': cells,
+            'busiest_hours': [{'hour': hour, 'alerts': by_hour[hour]} for hour in busiest]
+        }
@@ -1,32 +1,104 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
+import atexit
+import logging
+import threading
 import jwt
 from functools import wraps
-import threading
-import time
-import cv2
-import base64
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.image import MIMEImage
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 
+from analytics import Analytics
+from auth import AuthBusy, TokenCache
 from config import Config
 from database import Database
-from detection import IntrusionDetector, CameraStream
+from detection import IntrusionDetector
+from engine import CameraEngine
+import export
+import journal
+from replay import SETTINGS as REPLAY_SETTINGS, ReplayManager, in_worker_process
+from cluster import ClusterCoordinator, create_membership
+from schedules import parse_days, parse_time
+from streaming import StreamHub
+from logs import setup_logging, stop_logging
+from metrics import metrics
+import profiler
+from ratelimit import RateLimiter
+
+log = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config.from_object(Config)
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*",
+                    message_queue=Config.SOCKETIO_MESSAGE_QUEUE or None)
 
 db = Database()
-detector = IntrusionDetector()
-
-active_streams = {}
-stream_threads = {}
+detector = None
+analytics = Analytics(db)
+hub = StreamHub()
+token_cache = TokenCache(Config.SECRET_KEY)
+ip_limiter = RateLimiter(Config.AUTH_RATE_PER_IP, Config.AUTH_BURST_PER_IP)
+username_limiter = RateLimiter(Config.AUTH_RATE_PER_USERNAME, Config.AUTH_BURST_PER_USERNAME)
+engine = None  # Built on first use by get_engine()
+engine_factory = None  # Selected by the runtime (asgi.py installs the asyncio engine)
+engine_lock = threading.Lock()
+coordinator = None
+socket_users = {}  # Socket session id -> authenticated user id
+export_slots = threading.BoundedSemaphore(Config.EXPORT_MAX_CONCURRENT)
+replays = None
+
+
+def create_runtime():
+    """Logging, the model and the replay manager; the camera engine is built on first use"""
+    global detector, replays
+    setup_logging()
+    atexit.register(stop_logging)
+    detector = IntrusionDetector()
+    replays = ReplayManager(db)
+
+
+# Replay workers re-import this module as their __main__ and need none of it
+if not in_worker_process():
+    create_runtime()
+
+
+def threaded_engine():
+    """Default camera runtime: one thread per camera"""
+    return CameraEngine(db, detector, emit=socketio.emit, hub=hub)
+
+
+def use_engine_factory(factory):
+    """Select how the camera runtime is built; must run before its first use"""
+    global engine_factory
+    with engine_lock:
+        if engine is not None:
+            raise RuntimeError('Camera engine already built')
+        engine_factory = factory
+
+
+def get_engine():
+    """The camera runtime, built by the selected factory on first use"""
+    global engine
+    if engine is None:
+        with engine_lock:
+            if engine is None:
+                engine = (engine_factory or threaded_engine)()
+    return engine
+
+
+def start_detection():
+    """Start camera workers: every active camera, or this node's share in cluster mode"""
+    global coordinator
+    engine = get_engine()
+    atexit.register(engine.shutdown)
+    if Config.CLUSTER_MODE:
+        coordinator = ClusterCoordinator(engine, create_membership(db))
+        coordinator.start()
+        atexit.register(coordinator.stop)
+        engine.start_reconciler()
+    else:
+        engine.start_all_cameras()
 
 
 def token_required(f):
@@ -41,8 +113,7 @@ def token_required(f):
             if token.startswith('Bearer '):
                 token = token[7:]
 
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = data['user_id']
+            current_user = token_cache.verify(token)
         except:
             return jsonify({'error': 'Token is invalid'}), 401
 
@@ -51,156 +122,58 @@ def token_required(f):
     return decorated
 
 
-def send_email_alert(camera_name, image_path, detection_count):
-    """Send email alert with image"""
-    try:
-        if not Config.EMAIL_ADDRESS or not Config.EMAIL_PASSWORD:
-            print("Email not configured. Skipping email alert.")
-            return
+def camera_owner_required(f):
+    """Reject camera routes for cameras that don't exist or belong to someone else
 
-        msg = MIMEMultipart()
-        msg['From'] = Config.EMAIL_ADDRESS
-        msg['To'] = Config.EMAIL_ADDRESS
-        msg['Subject'] = f"SmartSurveil Alert - {camera_name}"
+    Use below @token_required. Both cases answer 404 so other users' camera
+    ids aren't revealed.
+    """
+    @wraps(f)
+    def decorated(current_user, camera_id, *args, **kwargs):
+        if not db.user_owns_camera(current_user, camera_id):
+            return jsonify({'error': 'Camera not found'}), 404
 
-        body = f"""
-        INTRUSION DETECTED!
+        return f(current_user, camera_id, *args, **kwargs)
 
-        Camera: {camera_name}
-        Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        Persons Detected: {detection_count}
+    return decorated
 
-        Please check your dashboard for more details.
-        """
-        msg.attach(MIMEText(body, 'plain'))
 
-        with open(image_path, 'rb') as f:
-            img = MIMEImage(f.read())
-            img.add_header('Content-Disposition', 'attachment', filename='intrusion.jpg')
-            msg.attach(img)
+def is_admin(user_id):
+    user = db.get_user(user_id)
+    return bool(user) and user['username'] in Config.ADMIN_USERNAMES
 
-        server = smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT)
-        server.starttls()
-        server.login(Config.EMAIL_ADDRESS, Config.EMAIL_PASSWORD)
-        server.send_message(msg)
-        server.quit()
 
-        print(f"Alert email sent for camera {camera_name}")
-    except Exception as e:
-        print(f"Error sending email: {e}")
+def admin_required(f):
+    """Restrict a route to Config.ADMIN_USERNAMES; use below @token_required"""
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        if not is_admin(current_user):
+            return jsonify({'error': 'Admin access required'}), 403
 
+        return f(current_user, *args, **kwargs)
 
-def process_camera_stream(camera_id):
-    """Process camera stream and detect intrusions"""
-    camera = db.get_camera(camera_id)
-    if not camera:
-        return
+    return decorated
 
-    stream = CameraStream(camera['url'])
-    if not stream.connect():
-        print(f"Failed to connect to camera {camera_id}")
-        return
 
-    active_streams[camera_id] = stream
-    last_detection_time = 0
-    detection_was_enabled = None  # Track detection state changes
+def rate_limited(username=None):
+    """429 response if the client IP or username is over its auth rate, else None"""
+    checks = [(ip_limiter, request.remote_addr)]
+    if username:
+        checks.append((username_limiter, str(username).lower()))
 
-    try:
-        while active_streams.get(camera_id) == stream:
-            camera = db.get_camera(camera_id)
-
-            if not camera['is_active']:
-                time.sleep(1)
-                continue
-
-            frame = stream.read_frame()
-            if frame is None:
-                time.sleep(0.1)
-                continue
-
-            frame = detector.preprocess_frame(frame)
-
-            person_count = 0
-            if camera['detection_enabled']:
-                # Print message when detection is re-enabled
-                if detection_was_enabled != True:
-                    print(f"[DEBUG] Detection enabled for camera {camera['name']} (ID: {camera_id})")
-                    detection_was_enabled = True
-                
-                roi = {
-                    'x': camera['roi_x'],
-                    'y': camera['roi_y'],
-                    'width': camera['roi_width'],
-                    'height': camera['roi_height']
-                }
-
-                # Use per-camera settings for detection
-                camera_confidence = camera.get('confidence_threshold', Config.CONFIDENCE_THRESHOLD)
-                person_count, annotated_frame, alert_image = detector.detect_persons_in_roi(
-                    frame, roi, confidence_threshold=camera_confidence
-                )
-
-                if person_count > 0:
-                    current_time = time.time()
-                    time_since_last = current_time - last_detection_time
-                    print(f"[DEBUG] Person detected! Count: {person_count}, Time since last alert: {time_since_last:.1f}s")
-                    
-                    # Use per-camera alert interval
-                    camera_alert_interval = camera.get('alert_interval', Config.DETECTION_INTERVAL)
-                    if current_time - last_detection_time > camera_alert_interval:
-                        last_detection_time = current_time
-                        print(f"[DEBUG] Sending alert for camera {camera['name']}")
-
-                        image_path = detector.save_alert_image(alert_image, camera_id)
-                        log_id = db.log_intrusion(camera_id, image_path, person_count)
-
-                        threading.Thread(
-                            target=send_email_alert,
-                            args=(camera['name'], image_path, person_count)
-                        ).start()
-
-                        # Emit to frontend if clients are connected (optional)
-                        try:
-                            socketio.emit('intrusion_detected', {
-                                'camera_id': camera_id,
-                                'camera_name': camera['name'],
-                                'person_count': person_count,
-                                'timestamp': datetime.now().isoformat(),
-                                'log_id': log_id
-                            })
-                            print(f"[DEBUG] Alert sent via WebSocket for log_id: {log_id}")
-                        except Exception as e:
-                            print(f"[DEBUG] No WebSocket clients connected, alert logged: {log_id}")
-                    else:
-                        camera_alert_interval = camera.get('alert_interval', Config.DETECTION_INTERVAL)
-                        print(f"[DEBUG] Alert suppressed - waiting {camera_alert_interval - time_since_last:.1f}s more")
-
-                frame = annotated_frame
-            else:
-                # Only print message when detection state changes
-                if detection_was_enabled != False:
-                    print(f"[DEBUG] Detection disabled for camera {camera['name']} (ID: {camera_id})")
-                    detection_was_enabled = False
-
-            # Only emit frames if there are connected clients (optional for monitoring)
-            try:
-                _, buffer = cv2.imencode('.jpg', frame)
-                frame_data = base64.b64encode(buffer).decode('utf-8')
-
-                socketio.emit(f'camera_frame_{camera_id}', {
-                    'frame': frame_data,
-                    'timestamp': time.time()
-                })
-            except Exception as e:
-                # No clients connected, continue detection without streaming
-                pass
+    for limiter, key in checks:
+        allowed, retry_after = limiter.allow(key)
+        if not allowed:
+            response = jsonify({'error': 'Too many attempts, try again later'})
+            response.headers['Retry-After'] = str(int(retry_after) + 1)
+            return response, 429
+    return None
 
-            time.sleep(0.033)
 
-    finally:
-        stream.release()
-        if camera_id in active_streams:
-            del active_streams[camera_id]
+def auth_busy():
+    response = jsonify({'error': 'Server busy, try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 
 @app.route('/api/register', methods=['POST'])
@@ -211,10 +184,17 @@ def register():
     email = data.get('email')
     password = data.get('password')
 
+    limited = rate_limited(username)
+    if limited:
+        return limited
+
     if not all([username, email, password]):
         return jsonify({'error': 'Missing required fields'}), 400
 
-    result = db.create_user(username, email, password)
+    try:
+        result = db.create_user(username, email, password)
+    except AuthBusy:
+        return auth_busy()
 
     if result['success']:
         return jsonify({'message': 'User created successfully'}), 201
@@ -229,10 +209,17 @@ def login():
     username = data.get('username')
     password = data.get('password')
 
+    limited = rate_limited(username)
+    if limited:
+        return limited
+
     if not all([username, password]):
         return jsonify({'error': 'Missing credentials'}), 400
 
-    result = db.verify_user(username, password)
+    try:
+        result = db.verify_user(username, password)
+    except AuthBusy:
+        return auth_busy()
 
     if result['success']:
         token = jwt.encode({
@@ -273,11 +260,7 @@ def add_camera(current_user):
         return jsonify({'error': 'Missing required fields'}), 400
 
     camera_id = db.add_camera(current_user, name, url)
-
-    thread = threading.Thread(target=process_camera_stream, args=(camera_id,))
-    thread.daemon = True
-    thread.start()
-    stream_threads[camera_id] = thread
+    get_engine().request_reconcile()
 
     return jsonify({
         'message': 'Camera added successfully',
@@ -285,30 +268,183 @@ def add_camera(current_user):
     }), 201
 
 
+# Camera settings accepted by /api/cameras/bulk: column -> (type, check)
+BULK_CAMERA_FIELDS = {
+    'name': (str, lambda v: bool(v.strip())),
+    'url': (str, lambda v: bool(v.strip())),
+    'substream_url': (str, None),
+    'is_active': (bool, None),
+    'detection_enabled': (bool, None),
+    'headless': (bool, None),
+    'tiled_inference': (bool, None),
+    'roi_x': (int, lambda v: v >= 0),
+    'roi_y': (int, lambda v: v >= 0),
+    'roi_width': (int, lambda v: v >= 0),
+    'roi_height': (int, lambda v: v >= 0),
+    'confidence_threshold': (float, lambda v: 0.0 <= v <= 1.0),
+    'alert_interval': (int, lambda v: v >= 0),
+    'confirm_hits': (int, lambda v: v >= 1),
+    'confirm_frames': (int, lambda v: 1 <= v <= Config.CONFIRM_MAX_FRAMES),
+    'verify_alerts': (bool, None),
+    'inference_size': (int, lambda v: v == 0 or 32 <= v <= 1280),
+    'capture_width': (int, lambda v: v >= 0),
+    'capture_height': (int, lambda v: v >= 0),
+    'inference_priority': (int, None),
+    'inference_weight': (float, lambda v: v > 0),
+    'inference_max_share': (float, lambda v: 0.0 < v <= 1.0),
+}
+
+
+def bulk_camera_fields(item):
+    """Validated {column: value} for one camera in a bulk request; raises ValueError"""
+    if not isinstance(item, dict):
+        raise ValueError('Each camera must be an object')
+    item = dict(item)
+    roi = item.pop('roi', None)
+    if roi is not None:
+        if not isinstance(roi, dict):
+            raise ValueError("Invalid value for 'roi'")
+        # Same shape as POST /api/cameras/{id}/roi
+        for key in ('x', 'y', 'width', 'height'):
+            if key in roi:
+                item[f'roi_{key}'] = roi[key]
+
+    fields = {}
+    for key, value in item.items():
+        if key == 'id':
+            continue
+        if key not in BULK_CAMERA_FIELDS:
+            raise ValueError(f"Unknown camera field '{key}'")
+        kind, check = BULK_CAMERA_FIELDS[key]
+        if value is None and key == 'substream_url':
+            fields[key] = None
+            continue
+        # Only JSON true/false for flags (bool("false") is True), and never for numbers
+        if (kind is bool) != isinstance(value, bool):
+            raise ValueError(f"Invalid value for '{key}'")
+        try:
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for '{key}'")
+        if check and not check(value):
+            raise ValueError(f"Invalid value for '{key}'")
+        fields[key] = value
+    return fields
+
+
+def check_bulk_confirmation(fields, camera=None):
+    """K-of-M check of bulk fields merged with the stored camera; raises ValueError"""
+    camera = camera or {}
+    confirm_hits = fields.get('confirm_hits', camera.get('confirm_hits', 1))
+    confirm_frames = fields.get('confirm_frames', camera.get('confirm_frames', 1))
+    if confirm_hits > confirm_frames:
+        raise ValueError('Confirmation hits must be between 1 and the number of frames')
+
+
+@app.route('/api/cameras/bulk', methods=['POST'])
+@token_required
+def bulk_cameras(current_user):
+    """Add, update and delete many cameras in one transaction
+
+    Streams are then started/stopped as one diff against the running workers.
+    """
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected an object with add, update and delete lists'}), 400
+    add_items = data.get('add', [])
+    update_items = data.get('update', [])
+    delete_ids = data.get('delete', [])
+    if not all(isinstance(items, list) for items in (add_items, update_items, delete_ids)):
+        return jsonify({'error': 'add, update and delete must be lists'}), 400
+
+    if len(add_items) + len(update_items) + len(delete_ids) > Config.BULK_MAX_CAMERAS:
+        return jsonify({'error': f'At most {Config.BULK_MAX_CAMERAS} cameras per request'}), 400
+
+    try:
+        add = []
+        for index, item in enumerate(add_items):
+            fields = bulk_camera_fields(item)
+            if not fields.get('name') or not fields.get('url'):
+                raise ValueError(f'add[{index}]: name and url are required')
+            check_bulk_confirmation(fields)
+            add.append(fields)
+        update = [(int(item['id']), bulk_camera_fields(item)) for item in update_items]
+        delete = [int(camera_id) for camera_id in delete_ids]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e) or 'Invalid request'}), 400
+
+    touched = {camera_id for camera_id, _ in update} | set(delete)
+    if len(db.owned_camera_ids(current_user, touched)) != len(touched):
+        return jsonify({'error': 'Camera not found'}), 404
+
+    # Partial updates are checked against the stored row, like /advanced
+    for camera_id, fields in update:
+        if 'confirm_hits' in fields or 'confirm_frames' in fields:
+            try:
+                check_bulk_confirmation(fields, db.get_camera(camera_id))
+            except ValueError as e:
+                return jsonify({'error': f'Camera {camera_id}: {e}'}), 400
+
+    added, updated, deleted = db.bulk_update_cameras(current_user, add, update, delete)
+
+    # Apply all stream changes as one diff against the running workers
+    engine = get_engine()
+    started, stopped = engine.reconcile()
+    for camera_id in deleted:
+        engine.occupancy.discard(camera_id)
+        engine.journal.discard(camera_id)
+
+    return jsonify({
+        'added': added,
+        'updated': updated,
+        'deleted': deleted,
+        'started': started,
+        'stopped': stopped
+    }), 200
+
+
 @app.route('/api/cameras/<int:camera_id>/toggle', methods=['POST'])
 @token_required
+@camera_owner_required
 def toggle_camera(current_user, camera_id):
     """Toggle camera active status"""
     data = request.json
     is_active = data.get('is_active', True)
 
     db.update_camera_status(camera_id, is_active)
+    get_engine().request_reconcile()
     return jsonify({'message': 'Camera status updated'}), 200
 
 
 @app.route('/api/cameras/<int:camera_id>/detection', methods=['POST'])
 @token_required
+@camera_owner_required
 def toggle_detection(current_user, camera_id):
     """Toggle detection for camera"""
     data = request.json
     enabled = data.get('enabled', True)
 
     db.toggle_detection(camera_id, enabled)
+    get_engine().request_reconcile()
     return jsonify({'message': 'Detection status updated'}), 200
 
 
+@app.route('/api/cameras/<int:camera_id>/headless', methods=['POST'])
+@token_required
+@camera_owner_required
+def set_headless(current_user, camera_id):
+    """Switch detection-only mode for camera (takes effect on the next frame)"""
+    data = request.json
+    enabled = bool(data.get('enabled', True))
+
+    db.set_headless(camera_id, enabled)
+    get_engine().request_reconcile()
+    return jsonify({'message': 'Headless mode updated', 'headless': enabled}), 200
+
+
 @app.route('/api/cameras/<int:camera_id>/roi', methods=['POST'])
 @token_required
+@camera_owner_required
 def set_roi(current_user, camera_id):
     """Set ROI for camera"""
     data = request.json
@@ -318,16 +454,23 @@ def set_roi(current_user, camera_id):
     height = data.get('height', 480)
 
     db.update_roi(camera_id, x, y, width, height)
+    get_engine().request_reconcile()
     return jsonify({'message': 'ROI updated'}), 200
 
 
 @app.route('/api/cameras/<int:camera_id>/advanced', methods=['POST'])
 @token_required
+@camera_owner_required
 def update_advanced_settings(current_user, camera_id):
     """Update advanced detection settings for camera"""
     data = request.json
     confidence_threshold = data.get('confidence_threshold')
     alert_interval = data.get('alert_interval')
+    inference_size = data.get('inference_size')
+    tiled_inference = data.get('tiled_inference')
+    confirm_hits = data.get('confirm_hits')
+    confirm_frames = data.get('confirm_frames')
+    verify_alerts = data.get('verify_alerts')
     
     # Validate inputs
     if confidence_threshold is not None:
@@ -343,49 +486,228 @@ def update_advanced_settings(current_user, camera_id):
             return jsonify({'error': 'Alert interval must be non-negative'}), 400
     else:
         alert_interval = 30
+
+    if inference_size is not None:
+        inference_size = int(inference_size)
+        if inference_size != 0 and not 32 <= inference_size <= 1280:
+            return jsonify({'error': 'Inference size must be 0 (auto) or between 32 and 1280'}), 400
     
-    # Check if camera belongs to user
-    camera = db.get_camera(camera_id)
-    if not camera:
-        return jsonify({'error': 'Camera not found'}), 404
-    
-    user_cameras = db.get_user_cameras(current_user)
-    if not any(c['id'] == camera_id for c in user_cameras):
-        return jsonify({'error': 'Unauthorized'}), 403
-    
-    db.update_advanced_settings(camera_id, confidence_threshold, alert_interval)
+    if tiled_inference is not None:
+        tiled_inference = bool(tiled_inference)
+
+    # K-of-M alert confirmation: K hits within the last M detection frames
+    if confirm_hits is not None or confirm_frames is not None:
+        camera = db.get_camera(camera_id)
+        confirm_hits = int(confirm_hits if confirm_hits is not None else camera['confirm_hits'])
+        confirm_frames = int(confirm_frames if confirm_frames is not None else camera['confirm_frames'])
+        if not 1 <= confirm_frames <= Config.CONFIRM_MAX_FRAMES:
+            return jsonify({'error': f'Confirmation frames must be between 1 and {Config.CONFIRM_MAX_FRAMES}'}), 400
+        if not 1 <= confirm_hits <= confirm_frames:
+            return jsonify({'error': 'Confirmation hits must be between 1 and the number of frames'}), 400
+
+    if verify_alerts is not None:
+        verify_alerts = bool(verify_alerts)
+
+    db.update_advanced_settings(camera_id, confidence_threshold, alert_interval, inference_size,
+                                tiled_inference, confirm_hits, confirm_frames, verify_alerts)
+    get_engine().request_reconcile()
     return jsonify({'message': 'Advanced settings updated'}), 200
 
 
+@app.route('/api/cameras/<int:camera_id>/capture', methods=['POST'])
+@token_required
+@camera_owner_required
+def update_capture_settings(current_user, camera_id):
+    """Update decode source and capture resolution for camera"""
+    data = request.json
+    substream_url = data.get('substream_url') or None
+    capture_width = int(data.get('capture_width') or 0)
+    capture_height = int(data.get('capture_height') or 0)
+
+    if capture_width < 0 or capture_height < 0:
+        return jsonify({'error': 'Capture resolution must be non-negative'}), 400
+    if bool(capture_width) != bool(capture_height):
+        return jsonify({'error': 'Set both capture width and height, or neither'}), 400
+
+    db.update_capture_settings(camera_id, substream_url, capture_width, capture_height)
+    get_engine().request_reconcile()
+    return jsonify({'message': 'Capture settings updated'}), 200
+
+
+@app.route('/api/cameras/<int:camera_id>/scheduling', methods=['POST'])
+@token_required
+@camera_owner_required
+def update_scheduling(current_user, camera_id):
+    """Update the camera's share of the inference model"""
+    data = request.json
+    try:
+        priority = int(data.get('inference_priority', 0))
+        weight = float(data.get('inference_weight', 1.0))
+        max_share = float(data.get('inference_max_share', 1.0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Priority must be an integer, weight and max share numbers'}), 400
+
+    if weight <= 0:
+        return jsonify({'error': 'Weight must be positive'}), 400
+    if not 0.0 < max_share <= 1.0:
+        return jsonify({'error': 'Max share must be greater than 0 and at most 1'}), 400
+
+    db.update_scheduling(camera_id, priority, weight, max_share)
+    get_engine().request_reconcile()
+    return jsonify({'message': 'Scheduling updated'}), 200
+
+
+def schedule_fields(item):
+    """Validated schedule profile from a request item; raises ValueError"""
+    if not isinstance(item, dict):
+        raise ValueError('Each schedule must be an object')
+    name = str(item.get('name') or '').strip()
+    if not name:
+        raise ValueError('Each schedule needs a name')
+
+    days = item.get('days', list(range(7)))
+    if isinstance(days, (list, tuple)):
+        days = ','.join(str(day) for day in days)
+    try:
+        days = ','.join(str(day) for day in parse_days(days))
+        start, end = parse_time(item.get('start_time')), parse_time(item.get('end_time'))
+        priority = int(item.get('priority') or 0)
+    except (TypeError, ValueError):
+        raise ValueError(f"Schedule '{name}': days must be 0 (Monday) to 6, times HH:MM, priority an integer")
+
+    # bool("false") is True, so only JSON true/false may disarm a profile
+    armed = item.get('armed', True)
+    if not isinstance(armed, bool):
+        raise ValueError(f"Schedule '{name}': armed must be true or false")
+
+    fields = {
+        'name': name,
+        'days': days,
+        'start_time': f'{start // 60:02d}:{start % 60:02d}',
+        'end_time': f'{end // 60:02d}:{end % 60:02d}',
+        'armed': armed,
+        'priority': priority,
+    }
+    checks = {
+        'confidence_threshold': (float, lambda v: 0.0 <= v <= 1.0),
+        'alert_interval': (int, lambda v: v >= 0),
+        'detection_fps': (float, lambda v: v > 0),
+    }
+    for key, (kind, check) in checks.items():
+        value = item.get(key)
+        if value is not None:
+            try:
+                value = kind(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Schedule '{name}': invalid value for '{key}'")
+            if not check(value):
+                raise ValueError(f"Schedule '{name}': invalid value for '{key}'")
+        fields[key] = value
+    return fields
+
+
+@app.route('/api/cameras/<int:camera_id>/schedules', methods=['GET'])
+@token_required
+@camera_owner_required
+def get_schedules(current_user, camera_id):
+    """Camera's schedule profiles and the one in effect now"""
+    active = get_engine().schedules.active(camera_id)
+    return jsonify({
+        'schedules': db.get_camera_schedules(camera_id),
+        'active': active['id'] if active else None
+    }), 200
+
+
+@app.route('/api/cameras/<int:camera_id>/schedules', methods=['PUT'])
+@token_required
+@camera_owner_required
+def replace_schedules(current_user, camera_id):
+    """Replace the camera's schedule profiles"""
+    data = request.json or {}
+    items = data.get('schedules') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return jsonify({'error': 'schedules must be a list'}), 400
+    try:
+        schedules = [schedule_fields(item) for item in items]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db.replace_camera_schedules(camera_id, schedules)
+    get_engine().request_reconcile()
+    return jsonify({'message': 'Schedules updated', 'schedules': db.get_camera_schedules(camera_id)}), 200
+
+
 @app.route('/api/cameras/<int:camera_id>', methods=['DELETE'])
 @token_required
+@camera_owner_required
 def delete_camera(current_user, camera_id):
     """Delete camera"""
-    # Check if camera belongs to user
-    camera = db.get_camera(camera_id)
-    if not camera:
-        return jsonify({'error': 'Camera not found'}), 404
-    
-    # Verify ownership (get user cameras and check if this camera is in the list)
-    user_cameras = db.get_user_cameras(current_user)
-    if not any(c['id'] == camera_id for c in user_cameras):
-        return jsonify({'error': 'Unauthorized'}), 403
-    
-    # Stop the camera stream if it's active
-    if camera_id in active_streams:
-        stream = active_streams[camera_id]
-        stream.release()
-        del active_streams[camera_id]
-        print(f"[DEBUG] Stopped stream for camera {camera_id}")
-    
-    # Delete from database
     if db.delete_camera(camera_id):
-        print(f"[DEBUG] Camera {camera_id} deleted successfully")
+        # The reconciler stops the worker; it releases the stream itself
+        engine = get_engine()
+        _, stopped = engine.reconcile()
+        if camera_id in stopped:
+            log.info("Stopped stream for camera %s", camera_id, extra={'camera_id': camera_id})
+        engine.occupancy.discard(camera_id)
+        engine.journal.discard(camera_id)
+        log.info("Camera %s deleted successfully", camera_id, extra={'camera_id': camera_id})
         return jsonify({'message': 'Camera deleted successfully'}), 200
     else:
         return jsonify({'error': 'Failed to delete camera'}), 500
 
 
+@app.route('/api/cameras/<int:camera_id>/occupancy.png', methods=['GET'])
+@token_required
+@camera_owner_required
+def get_occupancy_overlay(current_user, camera_id):
+    """Occupancy heatmap as a transparent PNG to lay over the camera feed"""
+    window = request.args.get('window', 'day')
+    if window not in Config.OCCUPANCY_WINDOWS:
+        return jsonify({'error': f"Window must be one of: {', '.join(Config.OCCUPANCY_WINDOWS)}"}), 400
+
+    width = min(max(request.args.get('width', Config.FRAME_WIDTH, type=int), 16), 1920)
+    default_height = width * Config.OCCUPANCY_GRID_HEIGHT // Config.OCCUPANCY_GRID_WIDTH
+    height = min(max(request.args.get('height', default_height, type=int), 16), 1080)
+
+    # Cameras running on another cluster node are read from their last save
+    engine = get_engine()
+    png = engine.occupancy.render_png(camera_id, window, width, height,
+                                      reload=camera_id not in engine.active_streams)
+    return Response(png, mimetype='image/png', headers={'Cache-Control': 'no-store'})
+
+
+@app.route('/api/cameras/<int:camera_id>/detections', methods=['GET'])
+@token_required
+@camera_owner_required
+def get_detections(current_user, camera_id):
+    """Per-frame detections from the camera's journal (default: the last hour)"""
+    try:
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.utcnow()
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(hours=1)
+    except ValueError:
+        return jsonify({'error': 'start/end must be ISO dates or times in UTC'}), 400
+    # Naive times are UTC, like the rest of the history API
+    start, end = (t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in (start, end))
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), Config.JOURNAL_MAX_RECORDS)
+    # Every day in the range is looked up, so bound it
+    start = max(start, end - timedelta(days=Config.JOURNAL_MAX_DAYS))
+
+    detection_journal = get_engine().journal
+    records = detection_journal.read_range(camera_id, start.timestamp(), end.timestamp(), limit)
+    frames, frames_with_persons, max_persons = detection_journal.summarize_range(
+        camera_id, start.timestamp(), end.timestamp())
+    return jsonify({
+        'camera_id': camera_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'frames': frames,
+        'frames_with_persons': frames_with_persons,
+        'max_persons': max_persons,
+        'truncated': len(records) > limit,
+        'records': journal.to_dicts(records[:limit]),
+    }), 200
+
+
 @app.route('/api/logs', methods=['GET'])
 @token_required
 def get_logs(current_user):
@@ -395,79 +717,347 @@ def get_logs(current_user):
     return jsonify({'logs': logs}), 200
 
 
+def analytics_scope(current_user):
+    """Camera ids an analytics request covers (?camera_id= narrows to one), or None if not owned"""
+    camera_id = request.args.get('camera_id', type=int)
+    if camera_id is not None:
+        return [camera_id] if db.user_owns_camera(current_user, camera_id) else None
+    return [c['id'] for c in db.get_user_cameras(current_user)]
+
+
+def parse_timestamp(value, end=False):
+    """ISO date/time query parameter -> the 'YYYY-MM-DD HH:MM:SS' form stored in the logs
+
+    A date-only `end` is the exclusive bound after that whole day, so
+    end=2024-01-31 includes the 31st.
+    """
+    if not value:
+        return None
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+    else:
+        moment = datetime.combine(day + timedelta(days=1) if end else day, datetime.min.time())
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+@app.route('/api/logs/export', methods=['GET'])
+@token_required
+def export_logs(current_user):
+    """Stream the intrusion history as NDJSON, CSV or a ZIP with images"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv', 'zip'):
+        return jsonify({'error': "Format must be 'ndjson', 'csv' or 'zip'"}), 400
+
+    try:
+        start = parse_timestamp(request.args.get('start'))
+        end = parse_timestamp(request.args.get('end'), end=True)
+    except ValueError:
+        return jsonify({'error': 'start/end must be ISO dates, e.g. 2024-01-31 or 2024-01-31T12:00'}), 400
+
+    camera_id = request.args.get('camera_id', type=int)
+    if camera_id is not None and not db.user_owns_camera(current_user, camera_id):
+        return jsonify({'error': 'Camera not found'}), 404
+
+    if not export_slots.acquire(blocking=False):
+        return jsonify({'error': 'Too many exports running, try again later'}), 429
+
+    def make_rows():
+        return export.iter_logs(db, current_user, camera_id, start, end)
+
+    if export_format == 'zip':
+        chunks = export.stream_zip(make_rows)
+    elif export_format == 'csv':
+        chunks = export.stream_csv(make_rows())
+    else:
+        chunks = export.stream_ndjson(make_rows())
+
+    mimetypes = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv', 'zip': 'application/zip'}
+    filename = f"intrusions_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    response = Response(chunks, mimetype=mimetypes[export_format],
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    # Runs when the transfer ends, including when the client goes away mid-download
+    response.call_on_close(export_slots.release)
+    return response
+
+
+@app.route('/api/replay/sources', methods=['GET'])
+@token_required
+def list_replay_sources(current_user):
+    """Recordings available for replay"""
+    return jsonify({'sources': replays.list_sources()}), 200
+
+
+@app.route('/api/replay', methods=['POST'])
+@token_required
+def start_replay(current_user):
+    """Queue a re-analysis of recordings with candidate settings for one camera"""
+    data = request.json or {}
+    camera_id = data.get('camera_id')
+    if not isinstance(camera_id, int) or not db.user_owns_camera(current_user, camera_id):
+        return jsonify({'error': 'Camera not found'}), 404
+
+    names = data.get('sources')
+    if not isinstance(names, list) or not names:
+        return jsonify({'error': 'sources must be a non-empty list of recordings'}), 400
+    try:
+        sources = [replays.resolve_source(str(name)) for name in names]
+        overrides = bulk_camera_fields(data.get('settings') or {})
+        unknown = set(overrides) - set(REPLAY_SETTINGS)
+        if unknown:
+            raise ValueError(f"Setting '{sorted(unknown)[0]}' can't be replayed")
+        start = datetime.fromisoformat(data['start']) if data.get('start') else None
+        if start is not None and start.tzinfo is not None:
+            # Logs are stored in naive UTC
+            start = start.astimezone(timezone.utc).replace(tzinfo=None)
+        sample_fps = float(data.get('sample_fps') or Config.REPLAY_SAMPLE_FPS)
+        if not 0 < sample_fps <= 30:
+            raise ValueError('sample_fps must be between 0 and 30')
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    job = replays.submit(current_user, db.get_camera(camera_id), sources, overrides, start, sample_fps)
+    return jsonify({'message': 'Replay queued', 'job_id': job.id}), 202
+
+
+@app.route('/api/replay/<job_id>', methods=['GET'])
+@token_required
+def get_replay(current_user, job_id):
+    """Replay progress, and the report once done"""
+    job = replays.get(job_id, current_user)
+    if job is None:
+        return jsonify({'error': 'Replay not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@app.route('/api/replay/<job_id>', methods=['DELETE'])
+@token_required
+def cancel_replay(current_user, job_id):
+    """Cancel a queued or running replay"""
+    job = replays.get(job_id, current_user)
+    if job is None:
+        return jsonify({'error': 'Replay not found'}), 404
+    replays.cancel(job)
+    return jsonify({'message': 'Replay cancelled'}), 200
+
+
+@app.route('/api/analytics/summary', methods=['GET'])
+@token_required
+def get_analytics_summary(current_user):
+    """Alert totals per camera over the last N days"""
+    camera_ids = analytics_scope(current_user)
+    if camera_ids is None:
+        return jsonify({'error': 'Camera not found'}), 404
+
+    days = min(max(request.args.get('days', 7, type=int), 1), 366)
+    return jsonify({'days': days, 'cameras': analytics.summary(camera_ids, days)}), 200
+
+
+@app.route('/api/analytics/trends', methods=['GET'])
+@token_required
+def get_analytics_trends(current_user):
+    """Alert counts per hour or day"""
+    camera_ids = analytics_scope(current_user)
+    if camera_ids is None:
+        return jsonify({'error': 'Camera not found'}), 404
+
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ('hour', 'day'):
+        return jsonify({'error': "Granularity must be 'hour' or 'day'"}), 400
+    days = min(max(request.args.get('days', 7, type=int), 1), 366)
+    tz_offset = request.args.get('tz_offset', 0, type=int)
+
+    series = analytics.trends(camera_ids, granularity, days, tz_offset)
+    return jsonify({'granularity': granularity, 'days': days, 'series': series}), 200
+
+
+@app.route('/api/analytics/heatmap', methods=['GET'])
+@token_required
+def get_analytics_heatmap(current_user):
+    """Alerts by weekday x hour of day, and the busiest hours"""
+    camera_ids = analytics_scope(current_user)
+    if camera_ids is None:
+        return jsonify({'error': 'Camera not found'}), 404
+
+    tz_offset = request.args.get('tz_offset', 0, type=int)
+    return jsonify(analytics.heatmap(camera_ids, tz_offset)), 200
+
+
+@app.route('/api/cluster', methods=['GET'])
+@token_required
+def get_cluster_status(current_user):
+    """Show which node runs each of the user's cameras"""
+    if coordinator is None:
+        return jsonify({'cluster': False}), 200
+
+    camera_ids = [c['id'] for c in db.get_user_cameras(current_user)]
+    return jsonify({'cluster': True, **coordinator.status(camera_ids)}), 200
+
+
+@app.route('/api/metrics', methods=['GET'])
+@token_required
+def get_metrics(current_user):
+    """Runtime metrics: the user's cameras; process-wide sections for admins only
+
+    Process-wide counters add up every user's cameras, so only admins
+    (ADMIN_USERNAMES) get them, along with every camera's section.
+    """
+    if is_admin(current_user):
+        engine = get_engine()
+        snapshot = metrics.snapshot()
+        snapshot['overload'] = engine.overload.status()
+        snapshot['sinks'] = engine.sinks.status()
+        snapshot['scheduler'] = engine.scheduler.status()
+        return jsonify(snapshot), 200
+
+    camera_ids = {c['id'] for c in db.get_user_cameras(current_user)}
+    snapshot = metrics.snapshot(camera_ids)
+    return jsonify({'uptime': snapshot['uptime'], 'cameras': snapshot['cameras']}), 200
+
+
+def profile_seconds():
+    """?seconds= for a profile request, clamped to PROFILE_MAX_SECONDS"""
+    return min(max(request.args.get('seconds', 10, type=float), 0.1), Config.PROFILE_MAX_SECONDS)
+
+
+@app.route('/api/admin/profile', methods=['POST'])
+@token_required
+@admin_required
+def sample_profile(current_user):
+    """Sample every thread's stack for a while; returns collapsed stacks for a flamegraph"""
+    interval = request.args.get('interval_ms', type=float)
+    try:
+        stacks = profiler.sample_stacks(profile_seconds(), interval / 1000 if interval else None,
+                                        request.args.get('threads'))
+    except profiler.ProfilerBusy:
+        return jsonify({'error': 'A profile is already running'}), 409
+
+    filename = f"profile_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.collapsed"
+    return Response(stacks, mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@app.route('/api/admin/profile/cameras/<int:camera_id>', methods=['POST'])
+@token_required
+@admin_required
+def profile_camera(current_user, camera_id):
+    """cProfile one camera's pipeline stages for a while"""
+    engine = get_engine()
+    if camera_id not in engine.active_streams:
+        return jsonify({'error': 'Camera is not running on this node'}), 404
+    try:
+        report = profiler.profile_camera(engine, camera_id, profile_seconds())
+    except profiler.ProfilerBusy:
+        return jsonify({'error': 'A profile is already running'}), 409
+    return jsonify(report), 200
+
+
 @app.route('/api/alerts/<path:filename>')
 def get_alert_image(filename):
     """Serve alert images"""
     return send_from_directory(Config.ALERT_IMAGES_PATH, filename)
 
 
+def socket_user(token):
+    """User id of a socket client's JWT, or None"""
+    if not token:
+        return None
+    if token.startswith('Bearer '):
+        token = token[7:]
+    try:
+        return token_cache.verify(token)
+    except Exception:
+        return None
+
+
+def authenticate_socket(sid, auth):
+    """Remember the user behind a socket from the token sent on connect (`auth: {token}`)"""
+    user_id = socket_user((auth or {}).get('token'))
+    if user_id is not None:
+        socket_users[sid] = user_id
+
+
+def disconnect_socket(sid):
+    hub.disconnect(sid)
+    socket_users.pop(sid, None)
+
+
 @socketio.on('connect')
-def handle_connect():
-    print('Client connected')
+def handle_connect(auth=None):
+    authenticate_socket(request.sid, auth)
+    log.debug('Client connected')
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
+    disconnect_socket(request.sid)
+    log.debug('Client disconnected')
 
 
 @socketio.on('start_camera')
 def handle_start_camera(data):
-    """Start camera stream (frontend request)"""
+    """Make sure a camera's worker is running (frontend request)
+
+    Active cameras already run; this only asks the reconciler to catch up
+    sooner, e.g. right after the camera was added or switched on.
+    """
     camera_id = data.get('camera_id')
-    if camera_id and camera_id not in active_streams:
-        thread = threading.Thread(target=process_camera_stream, args=(camera_id,))
-        thread.daemon = True
-        thread.start()
-        stream_threads[camera_id] = thread
-        print(f"[DEBUG] Camera {camera_id} started via frontend request")
-
-
-def start_all_cameras():
-    """Start all active cameras on backend startup"""
-    print("\n" + "="*60)
-    print("Starting all active cameras for autonomous detection...")
-    print("="*60)
-    
-    # Get all cameras from database
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, name, is_active FROM cameras')
-    cameras = cursor.fetchall()
-    conn.close()
-    
-    started_count = 0
-    for camera in cameras:
-        camera_id = camera['id']
-        camera_name = camera['name']
-        is_active = camera['is_active']
-        
-        if is_active and camera_id not in active_streams:
-            thread = threading.Thread(target=process_camera_stream, args=(camera_id,))
-            thread.daemon = True
-            thread.start()
-            stream_threads[camera_id] = thread
-            started_count += 1
-            print(f"✓ Started camera: {camera_name} (ID: {camera_id})")
-        elif not is_active:
-            print(f"○ Skipped inactive camera: {camera_name} (ID: {camera_id})")
-    
-    print("="*60)
-    print(f"Total cameras started: {started_count}/{len(cameras)}")
-    print("Backend is now running autonomous intrusion detection!")
-    print("="*60 + "\n")
+    engine = get_engine()
+    if camera_id and camera_id not in engine.running_camera_ids():
+        engine.request_reconcile()
+
+
+def subscribe_viewer(sid, data):
+    """Register a viewer for a camera's frames; returns (rooms to leave, rooms to join)
+
+    Only the camera's owner may subscribe: the socket must have sent a valid
+    token on connect, or send one as `token` with the subscription.
+    """
+    camera_id = data.get('camera_id')
+    if not camera_id:
+        return [], []
+    user_id = socket_user(data.get('token')) or socket_users.get(sid)
+    if user_id is None or not db.user_owns_camera(user_id, camera_id):
+        log.warning("Refused frame subscription to camera %s", camera_id, extra={'camera_id': camera_id})
+        return [], []
+
+    leave, join = hub.subscribe(
+        sid, camera_id,
+        max_fps=data.get('max_fps'), width=data.get('width'), quality=data.get('quality')
+    )
+    # Subscribing implies the viewer wants the camera running
+    handle_start_camera({'camera_id': camera_id})
+    return leave, join
+
+
+@socketio.on('subscribe_camera')
+def handle_subscribe_camera(data):
+    """Receive a camera's frames at the requested max fps, width and JPEG quality"""
+    leave, join = subscribe_viewer(request.sid, data)
+    for room in leave:
+        leave_room(room)
+    for room in join:
+        join_room(room)
+
+
+@socketio.on('unsubscribe_camera')
+def handle_unsubscribe_camera(data):
+    """Stop receiving a camera's frames"""
+    for room in hub.unsubscribe(request.sid, data.get('camera_id')):
+        leave_room(room)
 
 
 if __name__ == '__main__':
     print("=" * 60)
     print("SmartSurveil Backend Starting...")
     print("=" * 60)
-    print(f"Server running on http://localhost:5000")
-    print(f"API endpoints available at http://localhost:5000/api")
+    print(f"Server running on http://localhost:{Config.PORT}")
+    print(f"API endpoints available at http://localhost:{Config.PORT}/api")
     print("Press CTRL+C to stop the server")
     print("=" * 60)
     
     # Start all active cameras for autonomous detection
-    start_all_cameras()
+    start_detection()
     
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    socketio.run(app, debug=True, host='0.0.0.0', port=Config.PORT)
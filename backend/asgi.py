@@ -0,0 +1,96 @@
+"""
+Asyncio runtime for SmartSurveil
+
+Serves the same API and WebSocket events as app.py, but camera workers run
+as coroutines on one event loop with decode/inference offloaded to bounded
+executors instead of one OS thread per camera.
+
+    python asgi.py
+    uvicorn asgi:asgi_app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import logging
+
+import socketio
+from a2wsgi import WSGIMiddleware
+
+import app as flask_app
+from config import Config
+from engine import AsyncCameraEngine
+from replay import in_worker_process
+
+log = logging.getLogger(__name__)
+
+client_manager = None
+if Config.SOCKETIO_MESSAGE_QUEUE:
+    # Fan events out through the queue so viewers on any node see every camera
+    client_manager = socketio.AsyncRedisManager(Config.SOCKETIO_MESSAGE_QUEUE)
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins=Config.SOCKETIO_CORS_ALLOWED_ORIGINS,
+                           client_manager=client_manager)
+
+
+def async_engine():
+    """Camera runtime for this server: coroutines on the event loop"""
+    return AsyncCameraEngine(flask_app.db, flask_app.detector, emit=sio.emit, hub=flask_app.hub)
+
+
+if not in_worker_process():  # See app.py
+    flask_app.use_engine_factory(async_engine)
+
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    flask_app.authenticate_socket(sid, auth)
+    log.debug('Client connected')
+
+
+@sio.event
+async def disconnect(sid):
+    flask_app.disconnect_socket(sid)
+    log.debug('Client disconnected')
+
+
+@sio.on('start_camera')
+async def start_camera(sid, data):
+    flask_app.handle_start_camera(data)
+
+
+@sio.on('subscribe_camera')
+async def subscribe_camera(sid, data):
+    leave, join = flask_app.subscribe_viewer(sid, data)
+    for room in leave:
+        await sio.leave_room(sid, room)
+    for room in join:
+        await sio.enter_room(sid, room)
+
+
+@sio.on('unsubscribe_camera')
+async def unsubscribe_camera(sid, data):
+    for room in flask_app.hub.unsubscribe(sid, data.get('camera_id')):
+        await sio.leave_room(sid, room)
+
+
+async def startup():
+    flask_app.get_engine().attach(asyncio.get_running_loop())
+    flask_app.start_detection()
+
+
+asgi_app = socketio.ASGIApp(
+    sio,
+    other_asgi_app=WSGIMiddleware(flask_app.app, workers=Config.ASYNC_HTTP_WORKERS),
+    on_startup=startup
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("=" * 60)
+    print("SmartSurveil Backend Starting (asyncio runtime)...")
+    print("=" * 60)
+    print(f"Server running on http://localhost:{Config.PORT}")
+    print("Press CTRL+C to stop the server")
+    print("=" * 60)
+
+    uvicorn.run(asgi_app, host='0.0.0.0', port=Config.PORT)
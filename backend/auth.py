@@ -0,0 +1,82 @@
+"""
+Authentication helpers
+
+Verified JWTs are cached so repeated requests with the same token (the
+dashboard polls the API) skip signature verification until the token expires.
+
+Password hashing runs on a small bounded pool rather than the request
+thread, and login/register are rate limited per client IP and per username
+(ratelimit.RateLimiter), so a burst of logins can't starve detection and streaming of CPU.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+import jwt
+
+from config import Config
+
+
+class AuthBusy(Exception):
+    """Too many password hashes are already queued"""
+
+
+_hash_pool = ThreadPoolExecutor(Config.BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+_hash_slots = threading.BoundedSemaphore(Config.BCRYPT_WORKERS + Config.BCRYPT_MAX_PENDING)
+
+
+def _run_hashing(func, *args):
+    """Run a bcrypt call on the hashing pool; raises AuthBusy if the queue is full"""
+    if not _hash_slots.acquire(blocking=False):
+        raise AuthBusy()
+    try:
+        return _hash_pool.submit(func, *args).result()
+    finally:
+        _hash_slots.release()
+
+
+def hash_password(password):
+    """bcrypt hash of a password at the configured cost"""
+    salt = bcrypt.gensalt(rounds=Config.BCRYPT_ROUNDS)
+    return _run_hashing(bcrypt.hashpw, password.encode('utf-8'), salt)
+
+
+def check_password(password, password_hash):
+    """Whether a password matches a stored bcrypt hash"""
+    return _run_hashing(bcrypt.checkpw, password.encode('utf-8'), password_hash)
+
+
+class TokenCache:
+    """LRU cache of verified tokens -> (user_id, expiry)"""
+
+    def __init__(self, secret_key, capacity=None):
+        self.secret_key = secret_key
+        self.capacity = capacity or Config.TOKEN_CACHE_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(self, token):
+        """Return the token's user_id; raises jwt.InvalidTokenError if invalid or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                user_id, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(token)
+                    return user_id
+                del self._entries[token]
+
+        data = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+        user_id = data['user_id']
+        # Tokens without an expiry are still re-verified now and then
+        expires_at = data.get('exp', now + 300)
+
+        with self._lock:
+            self._entries[token] = (user_id, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return user_id
@@ -0,0 +1,261 @@
+"""
+Cluster (worker) mode
+
+Several backend nodes share the camera set. Each node heartbeats into a
+membership store; cameras are assigned to live nodes with a consistent
+hash ring, so a node joining or leaving only moves the cameras it gains or
+loses. Every node runs a ClusterCoordinator that keeps the ring current;
+the engine's reconciler then runs only the cameras the ring gives this node.
+
+Viewer demand (which cameras/quality tiers someone is watching) is shared
+through the same store, so the node running a camera encodes the tiers
+that viewers connected to other nodes asked for.
+
+Membership stores:
+- sqlite: the shared database file (several local processes, no extra services)
+- redis:  a Redis server (nodes on different hosts)
+- memory: in-process stand-in (single process, testing)
+"""
+import bisect
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from config import Config
+from streaming import Tier
+
+log = logging.getLogger(__name__)
+
+
+def _hash(value):
+    return int(hashlib.md5(str(value).encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes, replicas=None):
+        self.replicas = replicas or Config.CLUSTER_VNODES
+        self.nodes = sorted(nodes)
+        self._ring = sorted(
+            (_hash(f'{node}#{i}'), node)
+            for node in self.nodes for i in range(self.replicas)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    def node_for(self, key):
+        """Node that owns a key (None if the ring is empty)"""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+class MemoryMembership:
+    """In-process membership store"""
+
+    def __init__(self):
+        self._nodes = {}
+        self._demand = {}
+        self._lock = threading.Lock()
+
+    def heartbeat(self, node_id, ttl):
+        with self._lock:
+            self._nodes[node_id] = time.time() + ttl
+
+    def leave(self, node_id):
+        with self._lock:
+            self._nodes.pop(node_id, None)
+            self._demand.pop(node_id, None)
+
+    def live_nodes(self):
+        now = time.time()
+        with self._lock:
+            return sorted(node for node, expires in self._nodes.items() if expires > now)
+
+    def publish_demand(self, node_id, demand):
+        with self._lock:
+            self._demand[node_id] = set(demand)
+
+    def remote_demand(self, node_id):
+        live = set(self.live_nodes())
+        with self._lock:
+            return {item for node, demand in self._demand.items()
+                    if node != node_id and node in live for item in demand}
+
+
+class SQLiteMembership:
+    """Membership kept in the shared SQLite database"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def heartbeat(self, node_id, ttl):
+        conn = self.db.get_connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO cluster_nodes (node_id, expires_at) VALUES (?, ?)',
+            (node_id, time.time() + ttl)
+        )
+        conn.commit()
+        conn.close()
+
+    def leave(self, node_id):
+        conn = self.db.get_connection()
+        conn.execute('DELETE FROM cluster_nodes WHERE node_id = ?', (node_id,))
+        conn.execute('DELETE FROM stream_demand WHERE node_id = ?', (node_id,))
+        conn.commit()
+        conn.close()
+
+    def publish_demand(self, node_id, demand):
+        conn = self.db.get_connection()
+        conn.execute('DELETE FROM stream_demand WHERE node_id = ?', (node_id,))
+        conn.executemany(
+            'INSERT INTO stream_demand (node_id, camera_id, width, quality, fps) VALUES (?, ?, ?, ?, ?)',
+            [(node_id, camera_id, *tier) for camera_id, tier in demand]
+        )
+        conn.commit()
+        conn.close()
+
+    def remote_demand(self, node_id):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT d.camera_id, d.width, d.quality, d.fps
+            FROM stream_demand d
+            JOIN cluster_nodes n ON n.node_id = d.node_id
+            WHERE d.node_id != ? AND n.expires_at > ?
+        ''', (node_id, time.time()))
+        demand = {(row['camera_id'], Tier(row['width'], row['quality'], row['fps']))
+                  for row in cursor.fetchall()}
+        conn.close()
+        return demand
+
+    def live_nodes(self):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT node_id FROM cluster_nodes WHERE expires_at > ? ORDER BY node_id',
+                       (time.time(),))
+        nodes = [row['node_id'] for row in cursor.fetchall()]
+        conn.close()
+        return nodes
+
+
+class RedisMembership:
+    """Membership kept in Redis as expiring keys"""
+
+    PREFIX = 'smartsurveil:node:'
+    DEMAND_PREFIX = 'smartsurveil:demand:'
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def heartbeat(self, node_id, ttl):
+        self.client.set(self.PREFIX + node_id, 1, px=int(ttl * 1000))
+
+    def leave(self, node_id):
+        self.client.delete(self.PREFIX + node_id, self.DEMAND_PREFIX + node_id)
+
+    def live_nodes(self):
+        keys = self.client.scan_iter(match=self.PREFIX + '*')
+        return sorted(key.decode('utf-8')[len(self.PREFIX):] for key in keys)
+
+    def publish_demand(self, node_id, demand):
+        payload = json.dumps([[camera_id, *tier] for camera_id, tier in demand])
+        self.client.set(self.DEMAND_PREFIX + node_id, payload, px=int(Config.CLUSTER_NODE_TTL * 1000))
+
+    def remote_demand(self, node_id):
+        demand = set()
+        for node in self.live_nodes():
+            if node == node_id:
+                continue
+            payload = self.client.get(self.DEMAND_PREFIX + node)
+            for camera_id, *tier in json.loads(payload or '[]'):
+                demand.add((camera_id, Tier(*tier)))
+        return demand
+
+
+def create_membership(db):
+    """Build the membership store selected by Config.CLUSTER_BACKEND"""
+    if Config.CLUSTER_BACKEND == 'redis':
+        return RedisMembership(Config.REDIS_URL)
+    if Config.CLUSTER_BACKEND == 'memory':
+        return MemoryMembership()
+    return SQLiteMembership(db)
+
+
+class ClusterCoordinator:
+    """Keeps this node's camera workers in line with its share of the ring"""
+
+    def __init__(self, engine, membership, node_id=None):
+        self.engine = engine
+        self.membership = membership
+        self.node_id = node_id or Config.NODE_ID
+        self.ring = HashRing([])
+        self.owned = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def owns(self, camera_id):
+        """Whether this node should run a camera"""
+        return self.ring.node_for(camera_id) == self.node_id
+
+    def active_camera_ids(self):
+        conn = self.engine.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM cameras WHERE is_active = 1')
+        camera_ids = [row['id'] for row in cursor.fetchall()]
+        conn.close()
+        return camera_ids
+
+    def rebalance(self):
+        """Heartbeat, refresh the ring and have the engine reconcile when our share changes"""
+        self.membership.heartbeat(self.node_id, Config.CLUSTER_NODE_TTL)
+        nodes = self.membership.live_nodes()
+        if nodes != self.ring.nodes:
+            log.info("Live nodes: %s", ', '.join(nodes))
+            self.ring = HashRing(nodes)
+
+        owned = {camera_id for camera_id in self.active_camera_ids() if self.owns(camera_id)}
+        if owned != self.owned:
+            # The engine's reconciler starts/stops the workers
+            for camera_id in sorted(owned - self.owned):
+                log.info("%s took camera %s", self.node_id, camera_id, extra={'camera_id': camera_id})
+            for camera_id in sorted(self.owned - owned):
+                log.info("%s released camera %s", self.node_id, camera_id, extra={'camera_id': camera_id})
+            self.owned = owned
+            self.engine.request_reconcile()
+
+        # Share what our viewers watch; learn what viewers on other nodes watch
+        self.membership.publish_demand(self.node_id, self.engine.hub.local_demand())
+        self.engine.hub.set_remote_demand(self.membership.remote_demand(self.node_id))
+
+    def status(self, camera_ids):
+        """Current assignment for a set of cameras"""
+        return {
+            'node_id': self.node_id,
+            'nodes': self.ring.nodes,
+            'assignments': {camera_id: self.ring.node_for(camera_id) for camera_id in camera_ids}
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.rebalance()
+            except Exception as e:
+                log.error("Rebalance failed: %s", e)
+            self._stop.wait(Config.CLUSTER_HEARTBEAT_INTERVAL)
+
+    def start(self):
+        """Join the cluster and start rebalancing in the background"""
+        self.engine.owner_filter = self.owns
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        log.info("Node %s joined (%s membership)", self.node_id, Config.CLUSTER_BACKEND)
+
+    def stop(self):
+        """Leave the cluster so peers pick up this node's cameras right away"""
+        self._stop.set()
+        self.membership.leave(self.node_id)
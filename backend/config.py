@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,6 +9,17 @@ class Config:
 
     # Security
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
+    TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 1024))  # Verified JWTs kept in memory
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))  # Cost factor for new password hashes
+    BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', 2))  # Concurrent password hashes
+    BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', 32))  # Queued hashes before answering 503
+    # Token buckets on /api/login and /api/register (requests per minute, burst size)
+    AUTH_RATE_PER_IP = float(os.getenv('AUTH_RATE_PER_IP', 20))
+    AUTH_BURST_PER_IP = int(os.getenv('AUTH_BURST_PER_IP', 10))
+    AUTH_RATE_PER_USERNAME = float(os.getenv('AUTH_RATE_PER_USERNAME', 5))
+    AUTH_BURST_PER_USERNAME = int(os.getenv('AUTH_BURST_PER_USERNAME', 5))
+    # Users allowed on /api/admin/* (comma-separated usernames)
+    ADMIN_USERNAMES = [name.strip() for name in os.getenv('ADMIN_USERNAMES', '').split(',') if name.strip()]
 
     # Database
     DATABASE_PATH = 'smartsurveil.db'
@@ -21,25 +33,159 @@ class Config:
     # YOLOv8 Model Configuration
     MODEL_NAME = 'yolov8n.pt'  # Auto-downloads from Ultralytics
     CONFIDENCE_THRESHOLD = 0.5
+    INFERENCE_SIZES = (320, 416, 512, 640)  # Automatic per-ROI model input sizes (multiples of 32)
 
     # Detection Settings
     PERSON_CLASS_ID = 0  # COCO dataset person class
     DETECTION_INTERVAL = 10  # seconds between alerts (reduced for testing)
+    CONFIRM_MAX_FRAMES = 30  # Upper bound on a camera's confirm_frames (K-of-M alert confirmation)
+    VERIFY_INFERENCE_SIZE = 640  # Model input size for the verification pass on candidate regions
+    VERIFY_PADDING = 0.25  # Context added around candidate boxes, as a fraction of their size
 
     # Frame Processing
     FRAME_WIDTH = 640
     FRAME_HEIGHT = 480
 
+    # Capture / Decode
+    CAPTURE_WIDTH = int(os.getenv('CAPTURE_WIDTH', 0))  # 0 = camera native resolution
+    CAPTURE_HEIGHT = int(os.getenv('CAPTURE_HEIGHT', 0))
+    # Passed to the FFmpeg backend as OPENCV_FFMPEG_CAPTURE_OPTIONS (key;value|key;value)
+    FFMPEG_CAPTURE_OPTIONS = os.getenv('FFMPEG_CAPTURE_OPTIONS', 'rtsp_transport;tcp')
+    HW_DECODE = os.getenv('HW_DECODE', 'true').lower() == 'true'  # Use any available hardware decoder
+    IDLE_FRAME_STRIDE = 5  # While detection is paused and nobody watches, convert only every Nth decoded frame
+
+    # Tiled inference (wide-area cameras)
+    TILED_FRAME_WIDTH = 1920  # Detection resolution for tiled cameras
+    TILE_SIZE = 640  # Tile edge in pixels, also the model input size
+    TILE_OVERLAP = 0.2
+    TILE_MERGE_THRESHOLD = 0.6  # Intersection-over-smaller above which boxes across tiles merge
+    TILE_FULL_SCAN_INTERVAL = 30  # Frames between scans of every tile regardless of motion
+    MOTION_THRESHOLD = 25  # Grey-level change counted as motion
+    MOTION_MIN_AREA = 0.002  # Fraction of a tile that must change to mark it active
+
+    # Detection cache (reuse the last result while the ROI looks unchanged)
+    DETECTION_CACHE = os.getenv('DETECTION_CACHE', 'true').lower() == 'true'
+    DETECTION_CACHE_HASH_SIZE = 24  # dHash grid (24 -> 576-bit hash of a 25x24 thumbnail)
+    DETECTION_CACHE_HASH_MARGIN = 3  # Grey-level steps ignored as noise when hashing
+    DETECTION_CACHE_MAX_DISTANCE = 4  # Differing hash bits still counted as the same scene
+    DETECTION_CACHE_MAX_AGE = 2.0  # Seconds a cached result may be reused
+    DETECTION_CACHE_REFRESH_FRAMES = 15  # Run the model at least every N frames regardless
+
     # Storage
     ALERT_IMAGES_PATH = 'alerts'
 
+    # History export (GET /api/logs/export)
+    EXPORT_BATCH_SIZE = 500  # Rows per query
+    EXPORT_CHUNK_SIZE = 64 * 1024  # Bytes per chunk of the response
+    EXPORT_MAX_CONCURRENT = int(os.getenv('EXPORT_MAX_CONCURRENT', 2))  # Exports running at once
+
+    # Detection journal (every frame's detections, see journal.py)
+    JOURNAL = os.getenv('JOURNAL', 'false').lower() == 'true'  # ~100 bytes per frame: ~85 MB/camera/day at 10 fps
+    JOURNAL_PATH = 'journal'
+    JOURNAL_MAX_BOXES = 8  # Boxes kept per frame (most confident first); the count is always exact
+    JOURNAL_FLUSH_INTERVAL = 1.0  # Seconds between flushes to the file
+    JOURNAL_RETENTION_DAYS = 30  # Day files kept per camera (0 = forever)
+    JOURNAL_MAX_RECORDS = 5000  # Records one API request returns at most
+    JOURNAL_MAX_DAYS = 7  # Longest range one API request scans; longer ones keep their last N days
+
+    # Occupancy heatmaps
+    OCCUPANCY_PATH = 'occupancy'
+    OCCUPANCY_GRID_WIDTH = 64  # Grid cells across the frame
+    OCCUPANCY_GRID_HEIGHT = 48
+    OCCUPANCY_WINDOWS = {'hour': 3600, 'day': 86400, 'week': 604800}  # Window name -> half-life (seconds)
+    OCCUPANCY_SAVE_INTERVAL = 60  # Seconds between saves of a camera's grid
+
+    # Replay of recorded footage (replay.py, /api/replay)
+    REPLAY_PATH = os.getenv('REPLAY_PATH', 'recordings')  # Footage the API may replay; sources are relative to it
+    REPLAY_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov')
+    REPLAY_WORKERS = int(os.getenv('REPLAY_WORKERS', max(1, (os.cpu_count() or 2) // 2)))  # Worker processes
+    REPLAY_NICE = 10  # Niceness of worker processes, so live cameras keep priority
+    REPLAY_SAMPLE_FPS = 5  # Frames analysed per second of footage
+    REPLAY_SEGMENT_SECONDS = 30  # Footage per work item
+    REPLAY_MATCH_WINDOW = 10  # Seconds apart a replayed and a real alert still count as the same
+    REPLAY_MAX_JOBS = 20  # Finished jobs kept per user
+
+    # Profiling (/api/admin/profile)
+    PROFILE_MAX_SECONDS = 60  # Longest profile a request may ask for
+    PROFILE_SAMPLE_INTERVAL = 0.01  # Seconds between stack samples (100 Hz)
+    PROFILE_TOP_FUNCTIONS = 25  # Functions listed per stage in a camera profile
+    PROFILE_GRACE_SECONDS = 5  # Extra wait for a camera worker to finish its last profiled stage
+
+    # Alert sinks (see sinks.py); a sink is enabled by setting its URL/host
+    ALERT_WEBHOOK_URL = os.getenv('ALERT_WEBHOOK_URL', '')  # e.g. https://vms.example.com/hooks/smartsurveil
+    ALERT_WEBHOOK_TOKEN = os.getenv('ALERT_WEBHOOK_TOKEN', '')  # Sent as "Authorization: Bearer ..."
+    ALERT_WEBHOOK_POOL_SIZE = 2  # Keep-alive connections kept open
+    ALERT_MQTT_HOST = os.getenv('ALERT_MQTT_HOST', '')
+    ALERT_MQTT_PORT = int(os.getenv('ALERT_MQTT_PORT', 1883))
+    ALERT_MQTT_TOPIC = os.getenv('ALERT_MQTT_TOPIC', 'smartsurveil/alerts')  # Alerts go to <topic>/<camera_id>
+    ALERT_MQTT_USERNAME = os.getenv('ALERT_MQTT_USERNAME', '')
+    ALERT_MQTT_PASSWORD = os.getenv('ALERT_MQTT_PASSWORD', '')
+    ALERT_SINK_TIMEOUT = 5  # Seconds a delivery may take before it counts as failed
+    ALERT_SINK_BATCH_SIZE = 50  # Alerts per request at most
+    ALERT_SINK_BATCH_WAIT = 0.05  # Seconds to wait after an alert for more to batch with it
+    ALERT_SINK_MAX_PENDING = 1000  # Alerts waiting in memory per sink before they go to disk
+    ALERT_SINK_QUEUE_PATH = 'alert_queue'  # Retry queue of failed batches
+    ALERT_SINK_RETRY_INTERVAL = 5  # First retry delay; doubles while the sink keeps failing
+    ALERT_SINK_RETRY_MAX_DELAY = 300
+    ALERT_SINK_MAX_AGE = 86400  # Seconds before an undelivered batch is dropped
+
+    # Logging (see logs.py)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()  # DEBUG logs every detection and suppressed alert
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text | json (one object per line)
+    LOG_QUEUE_SIZE = 10000  # Records waiting for the writer thread before new ones are dropped
+    LOG_RATE_PER_MINUTE = 60  # Records per message template and camera once the burst is spent
+    LOG_RATE_BURST = 10
+
+    # Server
+    PORT = int(os.getenv('PORT', 5000))
+
     # WebSocket
     SOCKETIO_CORS_ALLOWED_ORIGINS = "*"
+    # Message queue shared by all nodes so any node can serve any viewer (e.g. redis://localhost:6379/0)
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+
+    # Cluster (worker mode)
+    CLUSTER_MODE = os.getenv('CLUSTER_MODE', 'false').lower() == 'true'
+    CLUSTER_BACKEND = os.getenv('CLUSTER_BACKEND', 'sqlite')  # sqlite | redis | memory
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    NODE_ID = os.getenv('NODE_ID', f'{socket.gethostname()}-{os.getpid()}')
+    CLUSTER_HEARTBEAT_INTERVAL = 2  # seconds between heartbeats/rebalances
+    CLUSTER_NODE_TTL = 6  # seconds without a heartbeat before a node's cameras move
+    CLUSTER_VNODES = 64  # virtual nodes per node on the hash ring
 
     # Camera Settings
+    BULK_MAX_CAMERAS = 1000  # Cameras per /api/cameras/bulk request
+    RECONCILE_INTERVAL = 2  # Seconds between syncs of camera workers with the database
     CAMERA_RECONNECT_ATTEMPTS = 3
     CAMERA_RECONNECT_DELAY = 2
 
     # Performance
     USE_GPU = False  # Set to True if CUDA available
+    # Concurrent calls into the shared model, handed out fairly by the inference scheduler.
+    # Keep at 1 unless each slot has its own model: YOLO predicts are not thread-safe.
+    INFERENCE_SLOTS = int(os.getenv('INFERENCE_SLOTS', 1))
+    INFERENCE_SHARE_WINDOW = 10  # Seconds of history behind each camera's share of inference time
+
+    # Load shedding: stream fps -> JPEG quality -> motion-only idle cameras -> low-priority detection rate
+    OVERLOAD_CHECK_INTERVAL = 1  # Seconds between load checks
+    OVERLOAD_LOOP_LAG = float(os.getenv('OVERLOAD_LOOP_LAG', 0.25))  # Seconds of scheduling delay counted as overload
+    OVERLOAD_QUEUE_DEPTH = int(os.getenv('OVERLOAD_QUEUE_DEPTH', 4))  # Cameras waiting for inference counted as overload
+    OVERLOAD_ESCALATE_CHECKS = 3  # Overloaded checks in a row before stepping down a stage
+    OVERLOAD_RECOVER_CHECKS = 10  # Calm checks in a row before stepping back up
+    OVERLOAD_STREAM_FPS = 5
+    OVERLOAD_JPEG_QUALITY = 50
+    OVERLOAD_IDLE_AFTER = 30  # Seconds without a person before a camera without viewers counts as idle
+    OVERLOAD_LOW_PRIORITY = 0  # Cameras at or below this inference_priority get their detection rate cut
+    OVERLOAD_DETECTION_STRIDE = 3  # Low-priority cameras run the model on every Nth frame
     STREAM_FPS = 30
+
+    # Viewer quality tiers (requests are snapped down to these levels)
+    STREAM_WIDTHS = (320, 480, 640)
+    STREAM_QUALITIES = (50, 70, 85)
+    STREAM_FPS_LEVELS = (1, 2, 5, 10, 15, 30)
+    HEADLESS_SAMPLE_INTERVAL = 300  # Headless cameras still annotate and encode 1 frame in N to measure the saving
+
+    # Asyncio runtime (python asgi.py)
+    ASYNC_DECODE_WORKERS = int(os.getenv('ASYNC_DECODE_WORKERS', 16))  # Concurrent blocking frame reads
+    ASYNC_IO_WORKERS = int(os.getenv('ASYNC_IO_WORKERS', 8))  # DB, encoding and email
+    ASYNC_HTTP_WORKERS = int(os.getenv('ASYNC_HTTP_WORKERS', 8))  # Threads serving the Flask API
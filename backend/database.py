@@ -1,6 +1,6 @@
 import sqlite3
 from datetime import datetime
-import bcrypt
+from auth import hash_password, check_password
 from config import Config
 
 class Database:
@@ -47,21 +47,38 @@ class Database:
                 roi_height INTEGER DEFAULT 480,
                 confidence_threshold REAL DEFAULT 0.5,
                 alert_interval INTEGER DEFAULT 30,
+                substream_url TEXT,
+                capture_width INTEGER DEFAULT 0,
+                capture_height INTEGER DEFAULT 0,
+                inference_size INTEGER DEFAULT 0,
+                tiled_inference BOOLEAN DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         ''')
         
         # Add new columns to existing tables (migration)
-        try:
-            cursor.execute('ALTER TABLE cameras ADD COLUMN confidence_threshold REAL DEFAULT 0.5')
-        except:
-            pass  # Column already exists
-        
-        try:
-            cursor.execute('ALTER TABLE cameras ADD COLUMN alert_interval INTEGER DEFAULT 30')
-        except:
-            pass  # Column already exists
+        camera_columns = [
+            'confidence_threshold REAL DEFAULT 0.5',
+            'alert_interval INTEGER DEFAULT 30',
+            'substream_url TEXT',
+            'capture_width INTEGER DEFAULT 0',
+            'capture_height INTEGER DEFAULT 0',
+            'inference_size INTEGER DEFAULT 0',
+            'tiled_inference BOOLEAN DEFAULT 0',
+            'headless BOOLEAN DEFAULT 0',
+            'inference_priority INTEGER DEFAULT 0',
+            'inference_weight REAL DEFAULT 1.0',
+            'inference_max_share REAL DEFAULT 1.0',
+            'confirm_hits INTEGER DEFAULT 1',  # 1 of 1: alert on the first frame, as before
+            'confirm_frames INTEGER DEFAULT 1',
+            'verify_alerts BOOLEAN DEFAULT 0',
+        ]
+        for column in camera_columns:
+            try:
+                cursor.execute(f'ALTER TABLE cameras ADD COLUMN {column}')
+            except:
+                pass  # Column already exists
 
         # Intrusion logs table
         cursor.execute('''
@@ -75,15 +92,113 @@ class Database:
             )
         ''')
 
+        # Analytics rollups, kept up to date by log_intrusion (UTC buckets)
+        for table, bucket in (('intrusion_hourly', 'hour'), ('intrusion_daily', 'day')):
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    camera_id INTEGER NOT NULL,
+                    {bucket} TEXT NOT NULL,
+                    alerts INTEGER NOT NULL DEFAULT 0,
+                    persons INTEGER NOT NULL DEFAULT 0,
+                    peak_persons INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (camera_id, {bucket})
+                )
+            ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS intrusion_hour_of_week (
+                camera_id INTEGER NOT NULL,
+                weekday INTEGER NOT NULL,
+                hour INTEGER NOT NULL,
+                alerts INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (camera_id, weekday, hour)
+            )
+        ''')
+
+        # Time-based detection profiles (armed windows, night thresholds, ...)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS camera_schedules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                camera_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                days TEXT NOT NULL DEFAULT '0,1,2,3,4,5,6',
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL,
+                armed BOOLEAN DEFAULT 1,
+                confidence_threshold REAL,
+                alert_interval INTEGER,
+                detection_fps REAL,
+                priority INTEGER DEFAULT 0,
+                FOREIGN KEY (camera_id) REFERENCES cameras (id)
+            )
+        ''')
+
+        # Cluster membership (worker mode with the sqlite backend)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cluster_nodes (
+                node_id TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stream_demand (
+                node_id TEXT NOT NULL,
+                camera_id INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                quality INTEGER NOT NULL,
+                fps INTEGER NOT NULL
+            )
+        ''')
+
+        # Per-user lookups (camera lists, log queries)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_cameras_user ON cameras (user_id)')
+
+        # Databases created before the rollups existed: build them once from the raw log
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM intrusion_daily)')
+        if not cursor.fetchone()[0]:
+            self._rollup(cursor, 'SELECT camera_id, detection_count, timestamp FROM intrusion_logs')
+
         conn.commit()
         conn.close()
 
+    def _rollup(self, cursor, source, params=()):
+        """Fold intrusion_logs rows selected by `source` into the rollup tables"""
+        cursor.execute(f'''
+            INSERT INTO intrusion_hourly (camera_id, hour, alerts, persons, peak_persons)
+            SELECT camera_id, strftime('%Y-%m-%d %H:00', timestamp), COUNT(*),
+                   SUM(detection_count), MAX(detection_count)
+            FROM ({source})
+            GROUP BY 1, 2
+            ON CONFLICT (camera_id, hour) DO UPDATE SET
+                alerts = alerts + excluded.alerts,
+                persons = persons + excluded.persons,
+                peak_persons = MAX(peak_persons, excluded.peak_persons)
+        ''', params)
+        cursor.execute(f'''
+            INSERT INTO intrusion_daily (camera_id, day, alerts, persons, peak_persons)
+            SELECT camera_id, date(timestamp), COUNT(*), SUM(detection_count), MAX(detection_count)
+            FROM ({source})
+            GROUP BY 1, 2
+            ON CONFLICT (camera_id, day) DO UPDATE SET
+                alerts = alerts + excluded.alerts,
+                persons = persons + excluded.persons,
+                peak_persons = MAX(peak_persons, excluded.peak_persons)
+        ''', params)
+        cursor.execute(f'''
+            INSERT INTO intrusion_hour_of_week (camera_id, weekday, hour, alerts)
+            SELECT camera_id, CAST(strftime('%w', timestamp) AS INTEGER),
+                   CAST(strftime('%H', timestamp) AS INTEGER), COUNT(*)
+            FROM ({source})
+            GROUP BY 1, 2, 3
+            ON CONFLICT (camera_id, weekday, hour) DO UPDATE SET
+                alerts = alerts + excluded.alerts
+        ''', params)
+
     def create_user(self, username, email, password):
         """Create new user"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        password_hash = hash_password(password)
 
         try:
             cursor.execute(
@@ -107,7 +222,7 @@ class Database:
         user = cursor.fetchone()
         conn.close()
 
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password_hash']):
+        if user and check_password(password, user['password_hash']):
             return {'success': True, 'user': dict(user)}
         return {'success': False, 'error': 'Invalid credentials'}
 
@@ -125,6 +240,26 @@ class Database:
         conn.close()
         return camera_id
 
+    def user_owns_camera(self, user_id, camera_id):
+        """Whether a camera exists and belongs to the user (single primary-key lookup)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT 1 FROM cameras WHERE id = ? AND user_id = ?', (camera_id, user_id))
+        owned = cursor.fetchone() is not None
+        conn.close()
+        return owned
+
+    def get_user(self, user_id):
+        """Get user by ID (without the password hash)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT id, username, email, created_at FROM users WHERE id = ?', (user_id,))
+        user = cursor.fetchone()
+        conn.close()
+        return dict(user) if user else None
+
     def get_user_cameras(self, user_id):
         """Get all cameras for user"""
         conn = self.get_connection()
@@ -159,6 +294,18 @@ class Database:
         conn.commit()
         conn.close()
 
+    def set_headless(self, camera_id, headless):
+        """Switch a camera between detection-only and streaming mode"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            'UPDATE cameras SET headless = ? WHERE id = ?',
+            (headless, camera_id)
+        )
+        conn.commit()
+        conn.close()
+
     def update_roi(self, camera_id, x, y, width, height):
         """Update ROI for camera"""
         conn = self.get_connection()
@@ -173,6 +320,58 @@ class Database:
         conn.commit()
         conn.close()
 
+    def get_all_cameras(self):
+        """Every camera (desired state for the worker reconciler)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT * FROM cameras')
+        cameras = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return cameras
+
+    def get_all_schedules(self):
+        """Every schedule profile (loaded into the engine's schedule index)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT * FROM camera_schedules ORDER BY camera_id, id')
+        schedules = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return schedules
+
+    def get_camera_schedules(self, camera_id):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT * FROM camera_schedules WHERE camera_id = ? ORDER BY id', (camera_id,))
+        schedules = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return schedules
+
+    def replace_camera_schedules(self, camera_id, schedules):
+        """Replace a camera's schedule profiles in one transaction"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('DELETE FROM camera_schedules WHERE camera_id = ?', (camera_id,))
+            cursor.executemany(
+                '''INSERT INTO camera_schedules
+                   (camera_id, name, days, start_time, end_time, armed,
+                    confidence_threshold, alert_interval, detection_fps, priority)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                [(camera_id, s['name'], s['days'], s['start_time'], s['end_time'], s['armed'],
+                  s['confidence_threshold'], s['alert_interval'], s['detection_fps'], s['priority'])
+                 for s in schedules]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
     def get_camera(self, camera_id):
         """Get camera by ID"""
         conn = self.get_connection()
@@ -188,17 +387,80 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        # Delete associated intrusion logs first (foreign key constraint)
-        cursor.execute('DELETE FROM intrusion_logs WHERE camera_id = ?', (camera_id,))
-        
-        # Delete the camera
-        cursor.execute('DELETE FROM cameras WHERE id = ?', (camera_id,))
-        
+        deleted_count = self._delete_cameras(cursor, [camera_id])
+
         conn.commit()
-        deleted_count = cursor.rowcount
         conn.close()
         return deleted_count > 0
 
+    def _delete_cameras(self, cursor, camera_ids):
+        """Delete cameras with their logs and rollups; returns the number of cameras deleted"""
+        placeholders = ','.join('?' * len(camera_ids))
+
+        # Delete associated intrusion logs first (foreign key constraint)
+        for table in ('intrusion_logs', 'intrusion_hourly', 'intrusion_daily', 'intrusion_hour_of_week',
+                      'camera_schedules'):
+            cursor.execute(f'DELETE FROM {table} WHERE camera_id IN ({placeholders})', camera_ids)
+
+        cursor.execute(f'DELETE FROM cameras WHERE id IN ({placeholders})', camera_ids)
+        return cursor.rowcount
+
+    def owned_camera_ids(self, user_id, camera_ids):
+        """The subset of camera_ids that belong to the user"""
+        if not camera_ids:
+            return set()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            f'SELECT id FROM cameras WHERE user_id = ? AND id IN ({",".join("?" * len(camera_ids))})',
+            (user_id, *camera_ids)
+        )
+        owned = {row['id'] for row in cursor.fetchall()}
+        conn.close()
+        return owned
+
+    def bulk_update_cameras(self, user_id, add, update, delete):
+        """Add, update and delete many cameras in one transaction
+
+        add is a list of {column: value} dicts, update a list of
+        (camera_id, {column: value}) pairs and delete a list of camera ids;
+        column names must already be validated. Returns (added ids, updated
+        ids, deleted ids). Nothing is written if any statement fails.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        added = []
+
+        try:
+            for fields in add:
+                columns = ['user_id', *fields]
+                cursor.execute(
+                    f'INSERT INTO cameras ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                    (user_id, *fields.values())
+                )
+                added.append(cursor.lastrowid)
+
+            for camera_id, fields in update:
+                if fields:
+                    assignments = ', '.join(f'{column} = ?' for column in fields)
+                    cursor.execute(
+                        f'UPDATE cameras SET {assignments} WHERE id = ? AND user_id = ?',
+                        (*fields.values(), camera_id, user_id)
+                    )
+
+            if delete:
+                self._delete_cameras(cursor, list(delete))
+
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return added, [camera_id for camera_id, _ in update], list(delete)
+
     def log_intrusion(self, camera_id, image_path, detection_count):
         """Log intrusion detection"""
         conn = self.get_connection()
@@ -208,8 +470,11 @@ class Database:
             'INSERT INTO intrusion_logs (camera_id, image_path, detection_count) VALUES (?, ?, ?)',
             (camera_id, image_path, detection_count)
         )
-        conn.commit()
         log_id = cursor.lastrowid
+        # Update the analytics rollups in the same transaction
+        self._rollup(cursor, 'SELECT camera_id, detection_count, timestamp FROM intrusion_logs WHERE id = ?',
+                     (log_id,))
+        conn.commit()
         conn.close()
         return log_id
 
@@ -231,16 +496,67 @@ class Database:
         conn.close()
         return logs
 
-    def update_advanced_settings(self, camera_id, confidence_threshold, alert_interval):
-        """Update advanced detection settings for camera"""
+    def get_camera_logs(self, camera_id, start, end):
+        """Intrusion logs of one camera between two UTC timestamps, oldest first"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT * FROM intrusion_logs
+            WHERE camera_id = ? AND timestamp >= ? AND timestamp <= ?
+            ORDER BY timestamp
+        ''', (camera_id, start, end))
+
+        logs = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return logs
+
+    def update_advanced_settings(self, camera_id, confidence_threshold, alert_interval,
+                                 inference_size=None, tiled_inference=None,
+                                 confirm_hits=None, confirm_frames=None, verify_alerts=None):
+        """Update advanced detection settings for camera (None keeps the current value)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            '''UPDATE cameras 
+               SET confidence_threshold = ?, alert_interval = ?,
+                   inference_size = COALESCE(?, inference_size),
+                   tiled_inference = COALESCE(?, tiled_inference),
+                   confirm_hits = COALESCE(?, confirm_hits),
+                   confirm_frames = COALESCE(?, confirm_frames),
+                   verify_alerts = COALESCE(?, verify_alerts)
+               WHERE id = ?''',
+            (confidence_threshold, alert_interval, inference_size, tiled_inference,
+             confirm_hits, confirm_frames, verify_alerts, camera_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def update_scheduling(self, camera_id, priority, weight, max_share):
+        """Update the camera's inference priority, fair-share weight and max share"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            '''UPDATE cameras 
+               SET inference_priority = ?, inference_weight = ?, inference_max_share = ? 
+               WHERE id = ?''',
+            (priority, weight, max_share, camera_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def update_capture_settings(self, camera_id, substream_url, capture_width, capture_height):
+        """Update capture source and decode resolution for camera"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
         cursor.execute(
             '''UPDATE cameras 
-               SET confidence_threshold = ?, alert_interval = ? 
+               SET substream_url = ?, capture_width = ?, capture_height = ? 
                WHERE id = ?''',
-            (confidence_threshold, alert_interval, camera_id)
+            (substream_url, capture_width, capture_height, camera_id)
         )
         conn.commit()
         conn.close()
@@ -1,12 +1,13 @@
-
-
 # Fix for PyTorch 2.6 - Must import torch BEFORE ultralytics
 import cv2
+import logging
 import numpy as np
 import time
 from datetime import datetime
 import os
+import threading
 import warnings
+from contextlib import contextmanager
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
@@ -31,87 +32,434 @@ torch.load = original_torch_load
 from ultralytics import YOLO
 from config import Config
 
+log = logging.getLogger(__name__)
+
+
+class LetterboxBuffer:
+    """Preallocated letterbox canvases and input tensor for one inference size"""
+
+    def __init__(self, size, device, slots=1):
+        self.size = size
+        self.slots = slots
+        self.canvases = [np.full((size, size, 3), 114, dtype=np.uint8) for _ in range(slots)]
+        self.tensor = torch.zeros((slots, 3, size, size), dtype=torch.float32, device=device)
+        self.scale = [1.0] * slots
+        self.pad = [(0, 0)] * slots
+        self._content = [None] * slots
+
+    def fill(self, image, allow_upscale=False, slot=0):
+        """Letterbox image into a slot's canvas and refresh that slot of the input tensor"""
+        h, w = image.shape[:2]
+        scale = min(self.size / w, self.size / h)
+        if not allow_upscale:
+            scale = min(scale, 1.0)
+
+        new_w = max(1, min(self.size, int(round(w * scale))))
+        new_h = max(1, min(self.size, int(round(h * scale))))
+        pad_x = (self.size - new_w) // 2
+        pad_y = (self.size - new_h) // 2
+
+        # Padding only needs repainting when the content box moves
+        canvas = self.canvases[slot]
+        content = (pad_x, pad_y, new_w, new_h)
+        if content != self._content[slot]:
+            canvas[:] = 114
+            self._content[slot] = content
+
+        target = canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w]
+        if (new_w, new_h) == (w, h):
+            target[:] = image
+        else:
+            cv2.resize(image, (new_w, new_h), dst=target, interpolation=cv2.INTER_AREA)
+        # Tensor inputs skip Ultralytics' own preprocessing, so hand it RGB in 0..1
+        cv2.cvtColor(target, cv2.COLOR_BGR2RGB, dst=target)
+
+        self.tensor[slot].copy_(torch.from_numpy(canvas).permute(2, 0, 1)).div_(255.0)
+
+        self.scale[slot] = new_w / w
+        self.pad[slot] = (pad_x, pad_y)
+        return self.tensor[slot:slot + 1]
+
+    def batch(self, count):
+        """First `count` slots as one batch (a view, no copy)"""
+        return self.tensor[:count]
+
+    def to_source(self, x1, y1, x2, y2, width, height, slot=0):
+        """Map a box from canvas coordinates back to the source image"""
+        pad_x, pad_y = self.pad[slot]
+        scale = self.scale[slot]
+        x1 = int(max(0, min(width, (x1 - pad_x) / scale)))
+        y1 = int(max(0, min(height, (y1 - pad_y) / scale)))
+        x2 = int(max(0, min(width, (x2 - pad_x) / scale)))
+        y2 = int(max(0, min(height, (y2 - pad_y) / scale)))
+        return x1, y1, x2, y2
+
+
+class MotionGate:
+    """Coarse frame-difference motion mask used to skip idle tiles"""
+
+    def __init__(self, width=160):
+        self.width = width
+        self.previous = None
+        self.mask = None
+        self.scale = 1.0
+        self.frames_since_full_scan = 0
+
+    def update(self, image):
+        """Feed the next ROI crop; returns False when every tile should run this frame"""
+        h, w = image.shape[:2]
+        small_h = max(1, int(h * self.width / w))
+        gray = cv2.cvtColor(cv2.resize(image, (self.width, small_h)), cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        previous, self.previous = self.previous, gray
+        self.frames_since_full_scan += 1
+
+        # First frame, ROI change or periodic full scan (keeps stationary people detected)
+        if previous is None or previous.shape != gray.shape or \
+                self.frames_since_full_scan >= Config.TILE_FULL_SCAN_INTERVAL:
+            self.mask = None
+            self.frames_since_full_scan = 0
+            return False
+
+        self.mask = cv2.absdiff(gray, previous) > Config.MOTION_THRESHOLD
+        self.scale = self.width / w
+        return True
+
+    def is_active(self, x1, y1, x2, y2):
+        """Whether enough of a region (ROI coordinates) changed since the last frame"""
+        if self.mask is None:
+            return True
+        top, left = int(y1 * self.scale), int(x1 * self.scale)
+        region = self.mask[top:max(int(y2 * self.scale), top + 1),
+                           left:max(int(x2 * self.scale), left + 1)]
+        return region.size > 0 and region.mean() >= Config.MOTION_MIN_AREA
+
+
+def dhash(image, size=None, margin=None):
+    """Difference hash of an image: rising horizontal gradients on a small greyscale thumbnail
+
+    Gradients within `margin` grey levels count as flat, so sensor noise
+    in featureless areas (walls, night sky) doesn't flip bits.
+    """
+    size = size or Config.DETECTION_CACHE_HASH_SIZE
+    margin = Config.DETECTION_CACHE_HASH_MARGIN if margin is None else margin
+    gray = cv2.cvtColor(cv2.resize(image, (size + 1, size), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    gray = gray.astype(np.int16)
+    return np.packbits(gray[:, 1:] - gray[:, :-1] > margin)
+
+
+def hash_distance(a, b):
+    """Number of differing bits between two hashes"""
+    return int(np.unpackbits(np.bitwise_xor(a, b)).sum())
+
+
+class DetectionCache:
+    """Last model result for one camera, reused while its ROI looks the same
+
+    A lookup hits while the ROI's dHash is within DETECTION_CACHE_MAX_DISTANCE
+    bits of the hash the result was computed on, the result is younger than
+    DETECTION_CACHE_MAX_AGE and fewer than DETECTION_CACHE_REFRESH_FRAMES
+    frames have reused it. `settings` (ROI, threshold, ...) must match exactly.
+    """
+
+    def __init__(self):
+        self.image_hash = None
+        self.settings = None
+        self.detections = None
+        self.computed_at = 0
+        self.hits = 0
+
+    def lookup(self, image_hash, settings, now=None):
+        """Cached detections for a frame, or None if the model has to run"""
+        now = now or time.time()
+        if self.detections is None or settings != self.settings or \
+                now - self.computed_at > Config.DETECTION_CACHE_MAX_AGE or \
+                self.hits >= Config.DETECTION_CACHE_REFRESH_FRAMES or \
+                hash_distance(image_hash, self.image_hash) > Config.DETECTION_CACHE_MAX_DISTANCE:
+            return None
+        self.hits += 1
+        return [dict(det) for det in self.detections]
+
+    def store(self, image_hash, settings, detections, now=None):
+        self.image_hash = image_hash
+        self.settings = settings
+        self.detections = [dict(det) for det in detections]
+        self.computed_at = now or time.time()
+        self.hits = 0
+
+
+def tile_grid(width, height, tile, overlap):
+    """Overlapping tile rectangles (x1, y1, x2, y2) covering a width x height image"""
+    step = max(1, int(tile * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile:
+            return [0]
+        positions = list(range(0, length - tile + 1, step))
+        if positions[-1] + tile < length:
+            positions.append(length - tile)
+        return positions
+
+    return [(x, y, min(x + tile, width), min(y + tile, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def merge_detections(detections, threshold):
+    """Greedy NMS on intersection-over-smaller, so halves of a person cut by a tile border merge"""
+    if len(detections) < 2:
+        return detections
+
+    boxes = np.array([d['bbox'] for d in detections], dtype=np.float32)
+    scores = np.array([d['confidence'] for d in detections], dtype=np.float32)
+    areas = np.maximum(boxes[:, 2] - boxes[:, 0], 1) * np.maximum(boxes[:, 3] - boxes[:, 1], 1)
+
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        ix = np.maximum(0, np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]))
+        iy = np.maximum(0, np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]))
+        overlap = (ix * iy) / np.minimum(areas[best], areas[rest])
+        order = rest[overlap < threshold]
+
+    return [detections[i] for i in keep]
+
+
+def select_inference_size(roi_w, roi_h, requested=0):
+    """Pick the model input size for an ROI (requested=0 means automatic)"""
+    if requested:
+        # Model stride is 32
+        return max(32, int(np.ceil(requested / 32)) * 32)
+
+    longest = max(roi_w, roi_h)
+    for size in Config.INFERENCE_SIZES:
+        if size >= longest:
+            return size
+    return Config.INFERENCE_SIZES[-1]
+
+
 class IntrusionDetector:
     """Human detection using YOLOv8 from Ultralytics"""
 
     def __init__(self):
-        print("Loading YOLOv8 model...")
+        log.info("Loading YOLOv8 model...")
     
         # Temporarily patch for loading
         torch.load = patched_torch_load
         try:
             self.model = YOLO(Config.MODEL_NAME)
-            print("YOLOv8 model loaded successfully!")
+            log.info("YOLOv8 model loaded successfully!")
         finally:
             torch.load = original_torch_load
     
         self.person_class_id = Config.PERSON_CLASS_ID
         self.confidence_threshold = Config.CONFIDENCE_THRESHOLD
+        self.device = 'cuda' if Config.USE_GPU else 'cpu'
+
+        # Free letterbox buffer sets ({size: LetterboxBuffer}); a model call checks one out,
+        # so there are about as many as concurrent inferences (INFERENCE_SLOTS), not cameras
+        self._buffer_sets = []
+        self._buffer_lock = threading.Lock()
     
         os.makedirs(Config.ALERT_IMAGES_PATH, exist_ok=True)
 
-    def detect_persons_in_roi(self, frame, roi, confidence_threshold=None):
-        """Detect persons in region of interest"""
-        x, y, w, h = roi['x'], roi['y'], roi['width'], roi['height']
-        
-        # Use provided threshold or fall back to default
-        conf_threshold = confidence_threshold if confidence_threshold is not None else self.confidence_threshold
+    @contextmanager
+    def letterbox_buffers(self):
+        """Check out a set of preallocated buffers for one model call
 
+        At most INFERENCE_SLOTS sets are kept; extra ones made for calls
+        outside the scheduler (alert verification, replay) are dropped.
+        """
+        with self._buffer_lock:
+            buffers = self._buffer_sets.pop() if self._buffer_sets else {}
+        try:
+            yield buffers
+        finally:
+            with self._buffer_lock:
+                if len(self._buffer_sets) < Config.INFERENCE_SLOTS:
+                    self._buffer_sets.append(buffers)
+
+    def letterbox_buffer(self, buffers, size, slots=1):
+        """The checked-out set's buffer for an inference size (created on first use)"""
+        if size not in buffers or buffers[size].slots < slots:
+            buffers[size] = LetterboxBuffer(size, self.device, slots)
+        return buffers[size]
+
+    def clamp_roi(self, frame, roi):
+        """Clamp ROI to the frame; an unset ROI (0,0,0,0) means the entire frame"""
+        x, y, w, h = roi['x'], roi['y'], roi['width'], roi['height']
         frame_h, frame_w = frame.shape[:2]
-        
-        # If ROI is not set or invalid (0,0,0,0), use the entire frame
+
         if w <= 0 or h <= 0:
-            x, y, w, h = 0, 0, frame_w, frame_h
-        else:
-            # Clamp ROI to frame boundaries
-            x = max(0, min(x, frame_w - 1))
-            y = max(0, min(y, frame_h - 1))
-            w = min(w, frame_w - x)
-            h = min(h, frame_h - y)
+            return 0, 0, frame_w, frame_h
+
+        x = max(0, min(x, frame_w - 1))
+        y = max(0, min(y, frame_h - 1))
+        w = min(w, frame_w - x)
+        h = min(h, frame_h - y)
+        return x, y, w, h
+
+    def find_persons(self, roi_frame, conf_threshold, inference_size=0):
+        """Run the model on an ROI crop; boxes are returned in ROI coordinates"""
+        h, w = roi_frame.shape[:2]
+        size = select_inference_size(w, h, inference_size)
+        with self.letterbox_buffers() as buffers:
+            buffer = self.letterbox_buffer(buffers, size)
+            input_tensor = buffer.fill(roi_frame, allow_upscale=bool(inference_size))
+
+            results = self.model.predict(
+                input_tensor,
+                imgsz=size,
+                conf=conf_threshold,
+                classes=[self.person_class_id],
+                verbose=False,
+                device=self.device
+            )
+
+            detections = []
+
+            if len(results) > 0:
+                result = results[0]
+                boxes = result.boxes
+
+                for box in boxes:
+                    class_id = int(box.cls[0])
+                    confidence = float(box.conf[0])
+
+                    if class_id == self.person_class_id and confidence >= conf_threshold:
+                        x1, y1, x2, y2 = buffer.to_source(*box.xyxy[0].tolist(), w, h)
+                        detections.append({
+                            'bbox': [x1, y1, x2, y2],
+                            'confidence': confidence
+                        })
+
+        return detections
+
+    def find_persons_tiled(self, roi_frame, conf_threshold, motion_gate=None):
+        """Run the model on overlapping tiles of an ROI crop in one batch"""
+        h, w = roi_frame.shape[:2]
+        tile = Config.TILE_SIZE
+        all_tiles = tile_grid(w, h, tile, Config.TILE_OVERLAP)
+
+        tiles = all_tiles
+        if motion_gate is not None:
+            motion_gate.update(roi_frame)
+            tiles = [t for t in all_tiles if motion_gate.is_active(*t)]
+        if not tiles:
+            return []
+
+        with self.letterbox_buffers() as buffers:
+            buffer = self.letterbox_buffer(buffers, tile, slots=len(all_tiles))
+            for slot, (x1, y1, x2, y2) in enumerate(tiles):
+                buffer.fill(roi_frame[y1:y2, x1:x2], slot=slot)
+
+            results = self.model.predict(
+                buffer.batch(len(tiles)),
+                imgsz=tile,
+                conf=conf_threshold,
+                classes=[self.person_class_id],
+                verbose=False,
+                device=self.device
+            )
+
+            detections = []
+            for slot, (result, (tx1, ty1, tx2, ty2)) in enumerate(zip(results, tiles)):
+                for box in result.boxes:
+                    class_id = int(box.cls[0])
+                    confidence = float(box.conf[0])
+
+                    if class_id == self.person_class_id and confidence >= conf_threshold:
+                        x1, y1, x2, y2 = buffer.to_source(*box.xyxy[0].tolist(), tx2 - tx1, ty2 - ty1,
+                                                          slot=slot)
+                        detections.append({
+                            'bbox': [x1 + tx1, y1 + ty1, x2 + tx1, y2 + ty1],
+                            'confidence': confidence
+                        })
+
+        return merge_detections(detections, Config.TILE_MERGE_THRESHOLD)
+
+    def find_persons_in_roi(self, frame, roi, confidence_threshold=None, inference_size=0,
+                            source_frame=None, motion_gate=None):
+        """Detect persons in region of interest without drawing anything
+
+        Boxes are relative to the ROI. inference_size=0 picks one from the ROI
+        size; with a higher-resolution source_frame the ROI is detected there
+        in tiled mode, and only tiles the motion gate marks active are run.
+        """
+        # Use provided threshold or fall back to default
+        conf_threshold = confidence_threshold if confidence_threshold is not None else self.confidence_threshold
 
+        x, y, w, h = self.clamp_roi(frame, roi)
         roi_frame = frame[y:y+h, x:x+w]
 
         if roi_frame.size == 0:
-            return 0, frame, None
-
-        results = self.model.predict(
-            roi_frame,
-            conf=conf_threshold,
-            classes=[self.person_class_id],
-            verbose=False,
-            device='cuda' if Config.USE_GPU else 'cpu'
-        )
-
-        person_count = 0
-        detections = []
-
-        if len(results) > 0:
-            result = results[0]
-            boxes = result.boxes
-
-            for box in boxes:
-                class_id = int(box.cls[0])
-                confidence = float(box.conf[0])
-
-                if class_id == self.person_class_id and confidence >= conf_threshold:
-                    person_count += 1
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    detections.append({
-                        'bbox': [x1, y1, x2, y2],
-                        'confidence': confidence
-                    })
-        
-        if person_count > 0:
-            print(f"[DEBUG] Detected {person_count} person(s) with confidences: {[d['confidence'] for d in detections]}")
+            return []
+
+        if source_frame is not None:
+            # ROI is set on the streamed frame; scale it up to the source resolution
+            scale = source_frame.shape[1] / frame.shape[1]
+            sx, sy, sw, sh = (int(round(v * scale)) for v in (x, y, w, h))
+            detections = self.find_persons_tiled(source_frame[sy:sy+sh, sx:sx+sw], conf_threshold, motion_gate)
+            for det in detections:
+                det['bbox'] = [int(v / scale) for v in det['bbox']]
+        else:
+            detections = self.find_persons(roi_frame, conf_threshold, inference_size)
+
+        if detections:
+            log.debug("Detected %d person(s) with confidences: %s",
+                      len(detections), [d['confidence'] for d in detections])
+
+        return detections
+
+    def detect_persons_in_roi(self, frame, roi, confidence_threshold=None, inference_size=0,
+                              source_frame=None, motion_gate=None):
+        """Detect persons in region of interest and draw the results
+
+        Returns (person_count, annotated_frame, alert_image).
+        """
+        detections = self.find_persons_in_roi(frame, roi, confidence_threshold, inference_size,
+                                               source_frame, motion_gate)
+        person_count = len(detections)
 
         annotated_frame = self.annotate_frame(frame.copy(), roi, detections, person_count)
 
         alert_image = None
         if person_count > 0:
-            alert_image = self.create_alert_image(roi_frame, detections, person_count)
+            alert_image = self.create_alert_image(self.roi_crop(frame, roi), detections, person_count)
 
         return person_count, annotated_frame, alert_image
 
+    def verify_persons(self, frame, roi, detections, conf_threshold, source_frame=None):
+        """Second, higher-resolution pass over just the region around candidate boxes
+
+        Boxes are relative to the ROI of `frame`. The region is cut from
+        source_frame (the same view at a higher resolution) when given and
+        upscaled to VERIFY_INFERENCE_SIZE. Returns the persons found there.
+        """
+        x, y, w, h = self.clamp_roi(frame, roi)
+        x1 = min(det['bbox'][0] for det in detections)
+        y1 = min(det['bbox'][1] for det in detections)
+        x2 = max(det['bbox'][2] for det in detections)
+        y2 = max(det['bbox'][3] for det in detections)
+        pad = int(max(x2 - x1, y2 - y1) * Config.VERIFY_PADDING)
+        x1, y1 = x + max(0, x1 - pad), y + max(0, y1 - pad)
+        x2, y2 = x + min(w, x2 + pad), y + min(h, y2 + pad)
+
+        image = source_frame if source_frame is not None else frame
+        scale = image.shape[1] / frame.shape[1]
+        region = image[int(y1 * scale):int(y2 * scale), int(x1 * scale):int(x2 * scale)]
+        if region.size == 0:
+            return []
+        return self.find_persons(region, conf_threshold, Config.VERIFY_INFERENCE_SIZE)
+
+    def roi_crop(self, frame, roi):
+        """The part of the frame inside the (clamped) ROI"""
+        x, y, w, h = self.clamp_roi(frame, roi)
+        return frame[y:y+h, x:x+w]
+
     def annotate_frame(self, frame, roi, detections, person_count):
         """Draw ROI and detections on frame"""
         x, y, w, h = roi['x'], roi['y'], roi['width'], roi['height']
@@ -175,58 +523,135 @@ class IntrusionDetector:
 
     def preprocess_frame(self, frame):
         """Preprocess frame for detection"""
-        if frame is None:
-            return None
+        return resize_to_width(frame, Config.FRAME_WIDTH)
 
-        frame_h, frame_w = frame.shape[:2]
 
-        if frame_w > Config.FRAME_WIDTH:
-            aspect_ratio = frame_h / frame_w
-            new_width = Config.FRAME_WIDTH
-            new_height = int(new_width * aspect_ratio)
-            frame = cv2.resize(frame, (new_width, new_height))
+def resize_to_width(frame, max_width):
+    """Downscale frame to max_width keeping aspect ratio (never upscales)"""
+    if frame is None:
+        return None
 
-        return frame
+    frame_h, frame_w = frame.shape[:2]
+
+    if frame_w > max_width:
+        aspect_ratio = frame_h / frame_w
+        new_width = max_width
+        new_height = int(new_width * aspect_ratio)
+        frame = cv2.resize(frame, (new_width, new_height))
+
+    return frame
+
+
+# OPENCV_FFMPEG_CAPTURE_OPTIONS is process-wide, so captures are opened one at a time
+_ffmpeg_options_lock = threading.Lock()
 
 
 class CameraStream:
     """Handle camera stream capture"""
 
-    def __init__(self, camera_url):
+    def __init__(self, camera_url, capture_width=0, capture_height=0):
         self.camera_url = camera_url
+        self.capture_width = capture_width or 0
+        self.capture_height = capture_height or 0
+        self.idle = False
         self.cap = None
         self.is_running = False
+        self.retry_at = 0.0  # After a failed reconfigure: when to try connecting again
+
+    def is_device(self):
+        """Local capture devices (webcams) are addressed by index"""
+        return isinstance(self.camera_url, int)
+
+    def _open_ffmpeg(self):
+        """Open a network/file source through the FFmpeg backend"""
+        params = []
+        if Config.HW_DECODE:
+            params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+
+        with _ffmpeg_options_lock:
+            previous = os.environ.get('OPENCV_FFMPEG_CAPTURE_OPTIONS')
+            os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = Config.FFMPEG_CAPTURE_OPTIONS
+            try:
+                cap = cv2.VideoCapture(self.camera_url, cv2.CAP_FFMPEG, params)
+            finally:
+                if previous is None:
+                    del os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS']
+                else:
+                    os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = previous
+
+        if not cap.isOpened():
+            # OpenCV builds without FFmpeg: let OpenCV pick a backend
+            cap = cv2.VideoCapture(self.camera_url)
+        return cap
 
     def connect(self):
         """Connect to camera stream"""
         try:
-            if self.camera_url == '0' or self.camera_url == 0:
-                self.camera_url = 0
-
-            self.cap = cv2.VideoCapture(self.camera_url)
+            if isinstance(self.camera_url, str) and self.camera_url.isdigit():
+                self.camera_url = int(self.camera_url)
+
+            if self.is_device():
+                self.cap = cv2.VideoCapture(self.camera_url)
+                if self.capture_width and self.capture_height:
+                    # Devices scale in hardware, so we never decode the full sensor size
+                    self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.capture_width)
+                    self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.capture_height)
+            else:
+                self.cap = self._open_ffmpeg()
             self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
 
             if self.cap.isOpened():
                 self.is_running = True
-                print(f"Connected to camera: {self.camera_url}")
+                log.info("Connected to camera: %s", self.camera_url)
                 return True
             return False
         except Exception as e:
-            print(f"Error connecting to camera: {e}")
+            log.warning("Error connecting to camera: %s", e)
             return False
 
     def read_frame(self):
         """Read frame from camera"""
         if self.cap and self.cap.isOpened():
+            if self.idle:
+                # grab() demuxes and decodes but skips colour conversion and the copy out
+                for _ in range(Config.IDLE_FRAME_STRIDE - 1):
+                    if not self.cap.grab():
+                        return None
             ret, frame = self.cap.read()
             if ret and frame is not None:
                 return frame
         return None
 
+    def reconfigure(self, camera_url, capture_width=0, capture_height=0):
+        """Reconnect if the source or capture resolution changed"""
+        if isinstance(camera_url, str) and camera_url.isdigit():
+            camera_url = int(camera_url)
+        capture_width = capture_width or 0
+        capture_height = capture_height or 0
+        if (camera_url, capture_width, capture_height) == \
+                (self.camera_url, self.capture_width, self.capture_height):
+            # Unchanged; if switching to it failed, retry every CAMERA_RECONNECT_DELAY seconds
+            if self.is_running or time.monotonic() < self.retry_at:
+                return self.is_running
+
+        self.release()
+        self.camera_url = camera_url
+        self.capture_width = capture_width
+        self.capture_height = capture_height
+        if self.connect():
+            return True
+        self.retry_at = time.monotonic() + Config.CAMERA_RECONNECT_DELAY
+        return False
+
+    def set_idle(self, idle):
+        """Only convert every IDLE_FRAME_STRIDE-th frame while nobody needs full rate"""
+        self.idle = idle
+
     def release(self):
         """Release camera connection"""
         if self.cap:
             self.cap.release()
+            self.cap = None
         self.is_running = False
 
     def __del__(self):
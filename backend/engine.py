@@ -0,0 +1,708 @@
+import asyncio
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from config import Config
+from detection import CameraStream, DetectionCache, MotionGate, dhash, resize_to_width
+from journal import DetectionJournal
+from metrics import metrics
+from occupancy import OccupancyStore
+from overload import OverloadController
+from scheduler import InferenceScheduler
+from schedules import ScheduleIndex
+from streaming import make_tier
+from sinks import AlertSinks
+
+log = logging.getLogger(__name__)
+
+
+def send_email_alert(camera_name, image_path, detection_count):
+    """Send email alert with image"""
+    try:
+        if not Config.EMAIL_ADDRESS or not Config.EMAIL_PASSWORD:
+            log.info("Email not configured. Skipping email alert.")
+            return
+
+        msg = MIMEMultipart()
+        msg['From'] = Config.EMAIL_ADDRESS
+        msg['To'] = Config.EMAIL_ADDRESS
+        msg['Subject'] = f"SmartSurveil Alert - {camera_name}"
+
+        body = f"""
+        INTRUSION DETECTED!
+
+        Camera: {camera_name}
+        Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        Persons Detected: {detection_count}
+
+        Please check your dashboard for more details.
+        """
+        msg.attach(MIMEText(body, 'plain'))
+
+        with open(image_path, 'rb') as f:
+            img = MIMEImage(f.read())
+            img.add_header('Content-Disposition', 'attachment', filename='intrusion.jpg')
+            msg.attach(img)
+
+        server = smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT)
+        server.starttls()
+        server.login(Config.EMAIL_ADDRESS, Config.EMAIL_PASSWORD)
+        server.send_message(msg)
+        server.quit()
+
+        log.info("Alert email sent for camera %s", camera_name)
+    except Exception as e:
+        log.error("Error sending email: %s", e)
+
+
+def frame_pause(camera, started):
+    """Seconds to sleep after a frame: ~30 fps, or the active schedule profile's rate"""
+    fps = camera.get('detection_fps')
+    if not fps:
+        return 0.033
+    return max(0.033, 1.0 / fps - (time.monotonic() - started))
+
+
+def capture_source(camera):
+    """Pick the decode source for a camera: sub-stream first, then the main URL"""
+    return (
+        camera.get('substream_url') or camera['url'],
+        camera.get('capture_width') or Config.CAPTURE_WIDTH,
+        camera.get('capture_height') or Config.CAPTURE_HEIGHT
+    )
+
+
+class CameraState:
+    """Per-camera state carried from one frame to the next"""
+
+    def __init__(self):
+        self.last_detection_time = 0
+        self.motion_gate = MotionGate()
+        self.detection_was_enabled = None  # Track detection state changes
+        self.schedule_profile = None
+        self.last_detections = []
+        self.last_person_time = 0
+        self.idle_gate = MotionGate()  # Motion check for idle cameras under overload
+        self.shed_frames = 0
+        self.detection_cache = DetectionCache()
+        self.recent_hits = deque(maxlen=1)  # Person / no person over the last confirm_frames frames
+
+
+class DetectionJob:
+    """One frame on its way through detection"""
+
+    def __init__(self, frame, source_frame, roi, raw_frame=None):
+        self.frame = frame
+        self.source_frame = source_frame
+        self.raw_frame = raw_frame  # Frame as decoded, for the alert verification pass
+        self.roi = roi
+        self.detections = []
+        self.skip_reason = None  # Set when the overload controller sheds this frame
+        self.cached = False  # Detections were reused from the camera's detection cache
+        self.image_hash = None
+        self.cache_settings = None
+
+    @property
+    def needs_model(self):
+        return not self.skip_reason and not self.cached
+
+
+class CameraEngine:
+    """Runs intrusion detection for cameras, one worker thread per camera
+
+    Worker lifecycle is declarative: reconcile() compares the cameras in the
+    database with the running workers and starts, stops or reconfigures
+    them. Only the reconciler starts and stops workers. Each worker owns its
+    capture handle and releases it itself when asked to stop. Workers read
+    camera settings from a snapshot the reconciler pushes, not from the
+    database.
+    """
+
+    def __init__(self, db, detector, emit, hub):
+        self.db = db
+        self.detector = detector
+        self.emit = emit
+        self.hub = hub
+        self.occupancy = OccupancyStore()
+        self.journal = DetectionJournal()
+        self.sinks = AlertSinks()
+        self.scheduler = InferenceScheduler()
+        self.overload = OverloadController(self)
+        self.schedules = ScheduleIndex()
+        self.active_streams = {}  # Connected captures, owned by their worker
+        self.stream_threads = {}
+        self.configs = {}  # camera_id -> settings snapshot pushed by the reconciler
+        self.stop_events = {}
+        self.profiles = {}  # camera_id -> CameraProfile while GET /api/admin/profile/cameras/{id} runs
+        self.owner_filter = None  # Set in cluster mode: only run cameras this node owns
+        self._reconcile_lock = threading.Lock()
+        self._reconcile_requested = threading.Event()
+        self._reconciler = None
+
+    def may_run(self, camera_id):
+        return self.owner_filter is None or self.owner_filter(camera_id)
+
+    def start_camera(self, camera_id):
+        """Start a worker for a camera unless one is already running"""
+        thread = self.stream_threads.get(camera_id)
+        if thread is not None and thread.is_alive():
+            return False
+
+        self.stop_events[camera_id] = threading.Event()
+        thread = threading.Thread(target=self.run_camera, args=(camera_id,), name=f'camera-{camera_id}')
+        thread.daemon = True
+        thread.start()
+        self.stream_threads[camera_id] = thread
+        return True
+
+    def running_camera_ids(self):
+        """Cameras with a live worker (including ones still connecting)"""
+        return {camera_id for camera_id, thread in list(self.stream_threads.items()) if thread.is_alive()}
+
+    def stop_camera(self, camera_id):
+        """Ask a camera's worker to stop; it releases its capture on its own thread"""
+        stop = self.stop_events.get(camera_id)
+        if stop is None or stop.is_set() or camera_id not in self.running_camera_ids():
+            return False
+        stop.set()
+        return True
+
+    def should_stop(self, camera_id):
+        stop = self.stop_events.get(camera_id)
+        return stop is None or stop.is_set() or camera_id not in self.configs
+
+    def reconcile(self):
+        """Bring running workers in line with the database; idempotent
+
+        Returns (started ids, stopped ids).
+        """
+        with self._reconcile_lock:
+            cameras = self.db.get_all_cameras()
+            desired = {camera['id']: camera for camera in cameras
+                       if camera['is_active'] and self.may_run(camera['id'])}
+            self.schedules.load(self.db.get_all_schedules())
+
+            # Push fresh settings before starting anything, so new workers see them
+            for camera_id, camera in desired.items():
+                self.configs[camera_id] = camera
+            for camera_id in set(self.configs) - set(desired):
+                del self.configs[camera_id]
+
+            running = self.running_camera_ids()
+            started = [camera_id for camera_id in sorted(set(desired) - running) if self.start_camera(camera_id)]
+            stopped = [camera_id for camera_id in sorted(running - set(desired)) if self.stop_camera(camera_id)]
+            return started, stopped
+
+    def request_reconcile(self):
+        """Reconcile soon (after a camera was added or changed)"""
+        self._reconcile_requested.set()
+
+    def _reconcile_loop(self):
+        while True:
+            self._reconcile_requested.wait(Config.RECONCILE_INTERVAL)
+            self._reconcile_requested.clear()
+            try:
+                started, stopped = self.reconcile()
+                for camera_id in started:
+                    log.info("Started worker for camera %s", camera_id, extra={'camera_id': camera_id})
+                for camera_id in stopped:
+                    log.info("Stopping worker for camera %s", camera_id, extra={'camera_id': camera_id})
+            except Exception as e:
+                log.error("Reconcile failed: %s", e)
+
+    def start_reconciler(self):
+        """Reconcile every RECONCILE_INTERVAL seconds, or sooner when requested
+
+        Also starts the overload controller that watches the workers' load
+        and the alert sinks.
+        """
+        self.sinks.start()
+        if self._reconciler is None:
+            self._reconciler = threading.Thread(target=self._reconcile_loop, daemon=True)
+            self._reconciler.start()
+            self.overload.start()
+
+    def shutdown(self):
+        """Stop every worker and the alert sinks, and save the occupancy grids (process exit)"""
+        for camera_id in self.running_camera_ids():
+            self.stop_camera(camera_id)
+        self.sinks.stop()
+        # Grids are otherwise saved only every OCCUPANCY_SAVE_INTERVAL
+        self.occupancy.save_all()
+
+    def start_all_cameras(self):
+        """Start all active cameras on backend startup"""
+        log.info("Starting all active cameras for autonomous detection...")
+        self.sinks.start()  # Before the first worker can raise an alert
+
+        started, _ = self.reconcile()
+        cameras = {camera['id']: camera for camera in self.db.get_all_cameras()}
+        for camera_id, camera in sorted(cameras.items()):
+            if camera_id in started:
+                log.info("Started camera: %s (ID: %s)", camera['name'], camera_id, extra={'camera_id': camera_id})
+            elif not camera['is_active']:
+                log.info("Skipped inactive camera: %s (ID: %s)", camera['name'], camera_id,
+                         extra={'camera_id': camera_id})
+
+        log.info("Total cameras started: %d/%d", len(started), len(cameras))
+        self.start_reconciler()
+
+    def current_settings(self, camera_id, camera, state):
+        """Snapshot settings with the active schedule profile applied"""
+        settings = self.schedules.apply(camera_id, camera)
+        profile = settings.get('schedule_profile')
+        if profile != state.schedule_profile:
+            log.info("Camera %s schedule profile: %s", camera['name'], profile or 'default',
+                     extra={'camera_id': camera_id})
+            state.schedule_profile = profile
+            metrics.set('schedule_armed', int(bool(settings['detection_enabled'])), camera_id)
+        return settings
+
+    def prepare_frame(self, camera_id, camera, frame, state):
+        """Preprocess a frame and decide whether the model runs on it
+
+        Returns (frame, job); job is None when detection is disabled.
+        """
+        metrics.incr('frames_processed', camera_id=camera_id)
+        raw_frame = frame
+        source_frame = None
+        if camera.get('tiled_inference'):
+            # Keep a high-resolution copy so far-away people survive for tiled detection
+            source_frame = resize_to_width(frame, Config.TILED_FRAME_WIDTH)
+        frame = self.detector.preprocess_frame(frame)
+
+        if not camera['detection_enabled']:
+            # Only print message when detection state changes
+            if state.detection_was_enabled != False:
+                log.info("Detection disabled for camera %s", camera['name'], extra={'camera_id': camera_id})
+                state.detection_was_enabled = False
+            return frame, None
+
+        # Print message when detection is re-enabled
+        if state.detection_was_enabled != True:
+            log.info("Detection enabled for camera %s", camera['name'], extra={'camera_id': camera_id})
+            state.detection_was_enabled = True
+
+        roi = {
+            'x': camera['roi_x'],
+            'y': camera['roi_y'],
+            'width': camera['roi_width'],
+            'height': camera['roi_height']
+        }
+        job = DetectionJob(frame, source_frame, roi, raw_frame)
+        roi_frame = self.detector.roi_crop(frame, roi)
+        if self.overload.level:
+            job.skip_reason = self.overload.skip_reason(camera_id, camera, state, roi_frame)
+            if job.skip_reason:
+                metrics.incr(f'{job.skip_reason}_skipped_frames', camera_id=camera_id)
+        if Config.DETECTION_CACHE and not job.skip_reason and roi_frame.size:
+            self.lookup_detection_cache(camera_id, camera, state, job, roi_frame)
+        return frame, job
+
+    def lookup_detection_cache(self, camera_id, camera, state, job, roi_frame):
+        """Reuse the camera's last detections if its ROI hasn't visibly changed"""
+        job.image_hash = dhash(roi_frame)
+        job.cache_settings = (
+            tuple(job.roi.values()), camera.get('confidence_threshold'),
+            camera.get('inference_size'), camera.get('tiled_inference')
+        )
+        cached = state.detection_cache.lookup(job.image_hash, job.cache_settings)
+        # Moving average of hits (1) and misses (0) = recent hit rate
+        metrics.observe('detection_cache_hit_rate', 0.0 if cached is None else 1.0, camera_id)
+        if cached is None:
+            metrics.incr('detection_cache_misses', camera_id=camera_id)
+        else:
+            metrics.incr('detection_cache_hits', camera_id=camera_id)
+            job.detections = cached
+            job.cached = True
+
+    def run_detection(self, camera, job, state):
+        """Run the model on a prepared frame; the caller holds an inference slot"""
+        # Use per-camera settings for detection
+        camera_confidence = camera.get('confidence_threshold', Config.CONFIDENCE_THRESHOLD)
+        job.detections = self.detector.find_persons_in_roi(
+            job.frame, job.roi, confidence_threshold=camera_confidence,
+            inference_size=camera.get('inference_size') or 0,
+            source_frame=job.source_frame, motion_gate=state.motion_gate
+        )
+        if job.image_hash is not None:
+            state.detection_cache.store(job.image_hash, job.cache_settings, job.detections)
+
+    def finish_frame(self, camera_id, camera, job, state):
+        """Record and draw a frame's detections and persist any alert
+
+        Frames the overload controller skipped are drawn with the last
+        detections and never raise alerts. An alert needs confirm_hits
+        frames with people among the last confirm_frames the model ran on
+        (cache hits don't count), and, with
+        verify_alerts, a second look by the model at the candidate region.
+        """
+        frame, roi = job.frame, job.roi
+        detections = state.last_detections if job.skip_reason else job.detections
+        person_count = len(detections)
+        if not job.skip_reason:
+            state.last_detections = detections
+            if detections:
+                state.last_person_time = time.time()
+            confirm_frames = camera.get('confirm_frames') or 1
+            if state.recent_hits.maxlen != confirm_frames:
+                state.recent_hits = deque(state.recent_hits, maxlen=confirm_frames)
+            if not job.cached:
+                # A cache hit repeats the last model result; counting it would let one false positive confirm itself
+                state.recent_hits.append(person_count > 0)
+            origin = self.detector.clamp_roi(frame, roi)[:2]
+            self.occupancy.record(camera_id, frame.shape, origin, detections)
+            if Config.JOURNAL:
+                self.journal.append(camera_id, detections, origin, job.cached)
+
+        if camera.get('headless') and not self.hub.has_viewers(camera_id):
+            # Credit what annotating and encoding this frame would have cost
+            metrics.incr('headless_frames', camera_id=camera_id)
+            if metrics.get('headless_frames', camera_id) % Config.HEADLESS_SAMPLE_INTERVAL == 1:
+                # Measure this camera's costs now and then (at the top tier), so the saving isn't a guess
+                with metrics.cpu_timer('annotate_cpu', camera_id):
+                    sample = self.detector.annotate_frame(frame.copy(), roi, detections, person_count)
+                self.hub.render(camera_id, sample, [make_tier()])
+            saved = metrics.average('annotate_cpu', camera_id) + metrics.average('encode_cpu', camera_id)
+            metrics.incr('cpu_saved_seconds', saved, camera_id=camera_id)
+            output_frame = None
+        else:
+            with metrics.cpu_timer('annotate_cpu', camera_id):
+                output_frame = self.detector.annotate_frame(frame.copy(), roi, detections, person_count)
+
+        if person_count == 0 or job.skip_reason:
+            return output_frame, None
+
+        current_time = time.time()
+        time_since_last = current_time - state.last_detection_time
+        log.debug("Person detected! Count: %d, Time since last alert: %.1fs", person_count, time_since_last,
+                  extra={'camera_id': camera_id})
+
+        # K-of-M confirmation: one noisy frame doesn't raise an alert
+        confirm_hits = min(camera.get('confirm_hits') or 1, state.recent_hits.maxlen)
+        hits = sum(state.recent_hits)
+        if hits < confirm_hits:
+            log.debug("Alert pending confirmation - %d/%d hits in last %d frames",
+                      hits, confirm_hits, state.recent_hits.maxlen, extra={'camera_id': camera_id})
+            metrics.incr('unconfirmed_frames', camera_id=camera_id)
+            return output_frame, None
+
+        # Use per-camera alert interval
+        camera_alert_interval = camera.get('alert_interval', Config.DETECTION_INTERVAL)
+        if time_since_last <= camera_alert_interval:
+            log.debug("Alert suppressed - waiting %.1fs more", camera_alert_interval - time_since_last,
+                      extra={'camera_id': camera_id})
+            return output_frame, None
+
+        if camera.get('verify_alerts'):
+            # Second look at higher resolution on just the candidate region
+            camera_confidence = camera.get('confidence_threshold', Config.CONFIDENCE_THRESHOLD)
+            with self.scheduler.slot(camera_id, camera):
+                verified = self.detector.verify_persons(frame, roi, detections, camera_confidence, job.raw_frame)
+            if not verified:
+                log.info("Alert rejected by verification for camera %s", camera['name'], extra={'camera_id': camera_id})
+                metrics.incr('alerts_rejected', camera_id=camera_id)
+                # Collect K fresh hits before verifying again
+                state.recent_hits.clear()
+                return output_frame, None
+            metrics.incr('alerts_verified', camera_id=camera_id)
+
+        state.last_detection_time = current_time
+        log.info("Sending alert for camera %s", camera['name'], extra={'camera_id': camera_id})
+
+        alert_image = self.detector.create_alert_image(self.detector.roi_crop(frame, roi), detections, person_count)
+        image_path = self.detector.save_alert_image(alert_image, camera_id)
+        log_id = self.db.log_intrusion(camera_id, image_path, person_count)
+
+        alert = {
+            'camera_id': camera_id,
+            'camera_name': camera['name'],
+            'person_count': person_count,
+            'timestamp': datetime.now().isoformat(),
+            'log_id': log_id,
+            'image_path': image_path
+        }
+        return output_frame, alert
+
+    def process_frame(self, camera_id, camera, frame, state):
+        """Run detection on one frame and persist any alert
+
+        Returns the frame to stream and the alert payload (None if no alert
+        was raised). In headless mode the frame is None unless someone is
+        watching: nothing is drawn, and the alert image is only rendered when
+        an alert is persisted. Blocking: runs on the camera's worker.
+        """
+        frame, job = self.staged(camera_id, 'prepare', self.prepare_frame, camera_id, camera, frame, state)
+        if job is None:
+            return frame, None
+        if job.needs_model:
+            # Wait for the camera's turn on the shared model (see scheduler.py)
+            with self.scheduler.slot(camera_id, camera):
+                self.staged(camera_id, 'detect', self.run_detection, camera, job, state)
+        return self.staged(camera_id, 'finish', self.finish_frame, camera_id, camera, job, state)
+
+    def staged(self, camera_id, stage, func, *args):
+        """Call func(*args) as a pipeline stage, under cProfile while the camera is being profiled"""
+        profile = self.profiles.get(camera_id)
+        if profile is None:
+            return func(*args)
+        with profile.stage(stage):
+            return func(*args)
+
+    def notify(self, event, payload):
+        """Broadcast a status event to every connected client (any thread)"""
+        try:
+            self.emit(event, payload)
+        except Exception as e:
+            log.warning("Could not emit %s: %s", event, e)
+
+    def loop_lag(self):
+        """Scheduling delay of the runtime beyond what the overload controller sees itself"""
+        return 0.0
+
+    def alert_event(self, alert):
+        """WebSocket payload for an alert"""
+        return {key: value for key, value in alert.items() if key != 'image_path'}
+
+    def dispatch_alert(self, alert):
+        """Send email, WebSocket and sink notifications for a persisted alert"""
+        self.sinks.publish(alert)
+        threading.Thread(
+            target=send_email_alert,
+            args=(alert['camera_name'], alert['image_path'], alert['person_count'])
+        ).start()
+
+        # Emit to frontend if clients are connected (optional)
+        try:
+            self.emit('intrusion_detected', self.alert_event(alert))
+            log.debug("Alert sent via WebSocket for log_id: %s", alert['log_id'],
+                      extra={'camera_id': alert['camera_id']})
+        except Exception as e:
+            log.debug("No WebSocket clients connected, alert logged: %s", alert['log_id'],
+                      extra={'camera_id': alert['camera_id']})
+
+    def run_camera(self, camera_id):
+        """Process camera stream and detect intrusions"""
+        camera = self.configs.get(camera_id)
+        if not camera:
+            return
+
+        stream = CameraStream(*capture_source(camera))
+        if not stream.connect():
+            log.warning("Failed to connect to camera %s", camera_id, extra={'camera_id': camera_id})
+            return
+
+        self.active_streams[camera_id] = stream
+        state = CameraState()
+        snapshot = camera
+
+        try:
+            while not self.should_stop(camera_id):
+                started = time.monotonic()
+                snapshot = self.configs.get(camera_id, snapshot)
+                camera = self.current_settings(camera_id, snapshot, state)
+
+                # Pick up sub-stream / capture resolution changes without restarting the thread
+                stream.reconfigure(*capture_source(camera))
+                # Full rate while someone watches, even with detection off
+                stream.set_idle(not camera['detection_enabled'] and not self.hub.has_viewers(camera_id))
+
+                frame = stream.read_frame()
+                if frame is None:
+                    time.sleep(0.1)
+                    continue
+
+                frame, alert = self.process_frame(camera_id, camera, frame, state)
+                metrics.observe('frame_latency', time.monotonic() - started, camera_id)
+                if alert:
+                    self.dispatch_alert(alert)
+
+                # Only encode for tiers that subscribed viewers asked for
+                if frame is not None:
+                    messages = self.staged(camera_id, 'encode', self.hub.render,
+                                           camera_id, frame, self.hub.due_tiers(camera_id))
+                    for room, payload in messages:
+                        self.emit(f'camera_frame_{camera_id}', payload, to=room)
+
+                time.sleep(frame_pause(camera, started))
+
+        finally:
+            stream.release()
+            self.scheduler.forget(camera_id)
+            self.journal.close(camera_id)
+            if self.active_streams.get(camera_id) is stream:
+                del self.active_streams[camera_id]
+
+
+class AsyncCameraEngine(CameraEngine):
+    """Runs camera workers as coroutines on a single event loop
+
+    Capture, inference and blocking I/O are offloaded to bounded executors,
+    so the thread count stays fixed however many cameras are running.
+    `emit` must be a coroutine function (e.g. socketio.AsyncServer.emit).
+    """
+
+    def __init__(self, db, detector, emit, hub):
+        super().__init__(db, detector, emit, hub)
+        self.loop = None
+        self.tasks = {}
+        self._pending = set()  # Spawns queued with call_soon_threadsafe
+        self.decode_executor = ThreadPoolExecutor(Config.ASYNC_DECODE_WORKERS, thread_name_prefix='decode')
+        self.inference_executor = ThreadPoolExecutor(self.scheduler.slots, thread_name_prefix='inference')
+        self.io_executor = ThreadPoolExecutor(Config.ASYNC_IO_WORKERS, thread_name_prefix='io')
+        self._probe_sent = None  # When the pending loop-lag probe was scheduled
+        self._probe_lag = 0.0
+
+    def attach(self, loop):
+        """Bind to the event loop the workers run on"""
+        self.loop = loop
+
+    def _spawn(self, camera_id):
+        self._pending.discard(camera_id)
+        task = self.tasks.get(camera_id)
+        if task is not None and not task.done():
+            return
+        self.tasks[camera_id] = self.loop.create_task(self.run_camera(camera_id))
+
+    def start_camera(self, camera_id):
+        """Schedule a camera worker; safe to call from any thread"""
+        task = self.tasks.get(camera_id)
+        if task is not None and not task.done():
+            return False
+        if camera_id in self._pending:
+            return False
+        self._pending.add(camera_id)
+        self.stop_events[camera_id] = threading.Event()
+        self.loop.call_soon_threadsafe(self._spawn, camera_id)
+        return True
+
+    def running_camera_ids(self):
+        """Cameras with a live or scheduled worker (including ones still connecting)"""
+        running = {camera_id for camera_id, task in list(self.tasks.items()) if not task.done()}
+        return running | self._pending
+
+    async def run_blocking(self, executor, func, *args):
+        return await self.loop.run_in_executor(executor, func, *args)
+
+    def notify(self, event, payload):
+        """Broadcast a status event to every connected client (any thread)"""
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.emit(event, payload), self.loop)
+
+    def _probe_done(self, sent):
+        self._probe_lag = time.monotonic() - sent
+        self._probe_sent = None
+
+    def loop_lag(self):
+        """How late the event loop ran the last probe callback; sends the next one"""
+        if self.loop is None:
+            return 0.0
+        now = time.monotonic()
+        if self._probe_sent is not None:
+            # Previous probe still hasn't run
+            return max(self._probe_lag, now - self._probe_sent)
+        self._probe_sent = now
+        self.loop.call_soon_threadsafe(self._probe_done, now)
+        return self._probe_lag
+
+    async def acquire_slot(self, camera_id, camera):
+        """Wait for the camera's turn on the shared model without blocking the loop"""
+        granted = self.loop.create_future()
+        request = self.scheduler.submit(
+            camera_id, camera, on_grant=lambda: self.loop.call_soon_threadsafe(granted.set_result, None)
+        )
+        try:
+            await granted
+        except asyncio.CancelledError:
+            self.scheduler.cancel(request)
+            raise
+        return request
+
+    async def dispatch_alert(self, alert):
+        """Send email, WebSocket and sink notifications for a persisted alert"""
+        self.sinks.publish(alert)
+        # Email delivery is fire-and-forget on the I/O pool
+        self.loop.run_in_executor(
+            self.io_executor, send_email_alert,
+            alert['camera_name'], alert['image_path'], alert['person_count']
+        )
+        await self.emit('intrusion_detected', self.alert_event(alert))
+        log.debug("Alert sent via WebSocket for log_id: %s", alert['log_id'], extra={'camera_id': alert['camera_id']})
+
+    async def run_camera(self, camera_id):
+        """Process camera stream and detect intrusions"""
+        camera = self.configs.get(camera_id)
+        if not camera:
+            return
+
+        stream = CameraStream(*capture_source(camera))
+        if not await self.run_blocking(self.decode_executor, stream.connect):
+            log.warning("Failed to connect to camera %s", camera_id, extra={'camera_id': camera_id})
+            return
+
+        self.active_streams[camera_id] = stream
+        state = CameraState()
+        snapshot = camera
+
+        try:
+            while not self.should_stop(camera_id):
+                started = time.monotonic()
+                snapshot = self.configs.get(camera_id, snapshot)
+                camera = self.current_settings(camera_id, snapshot, state)
+
+                await self.run_blocking(self.decode_executor, stream.reconfigure, *capture_source(camera))
+                # Full rate while someone watches, even with detection off
+                stream.set_idle(not camera['detection_enabled'] and not self.hub.has_viewers(camera_id))
+
+                frame = await self.run_blocking(self.decode_executor, stream.read_frame)
+                if frame is None:
+                    await asyncio.sleep(0.1)
+                    continue
+
+                frame, job = await self.run_blocking(
+                    self.io_executor, self.staged, camera_id, 'prepare',
+                    self.prepare_frame, camera_id, camera, frame, state
+                )
+                alert = None
+                if job is not None:
+                    if job.needs_model:
+                        # Queue for the model here rather than in the executor, so the
+                        # scheduler (not the executor's FIFO) decides which camera goes next
+                        request = await self.acquire_slot(camera_id, camera)
+                        start = time.monotonic()
+                        try:
+                            await self.run_blocking(self.inference_executor, self.staged, camera_id, 'detect',
+                                                    self.run_detection, camera, job, state)
+                        finally:
+                            self.scheduler.release(request, time.monotonic() - start)
+                    frame, alert = await self.run_blocking(
+                        self.io_executor, self.staged, camera_id, 'finish',
+                        self.finish_frame, camera_id, camera, job, state
+                    )
+                metrics.observe('frame_latency', time.monotonic() - started, camera_id)
+                if alert:
+                    await self.dispatch_alert(alert)
+
+                tiers = self.hub.due_tiers(camera_id) if frame is not None else []
+                if tiers:
+                    messages = await self.run_blocking(self.io_executor, self.staged, camera_id, 'encode',
+                                                       self.hub.render, camera_id, frame, tiers)
+                    for room, payload in messages:
+                        await self.emit(f'camera_frame_{camera_id}', payload, to=room)
+
+                await asyncio.sleep(frame_pause(camera, started))
+
+        finally:
+            await self.run_blocking(self.decode_executor, stream.release)
+            self.scheduler.forget(camera_id)
+            self.journal.close(camera_id)
+            if self.active_streams.get(camera_id) is stream:
+                del self.active_streams[camera_id]
@@ -0,0 +1,162 @@
+"""
+Streaming export of intrusion history
+
+Rows are read in keyset-paginated batches (WHERE id > last id), each in its
+own short query, so an export of any size holds one batch in memory and
+never keeps a read transaction open against the detection workers' writes.
+Output is generated chunk by chunk for a chunked HTTP response.
+"""
+import csv
+import io
+import json
+import os
+import zipfile
+
+from config import Config
+
+CSV_FIELDS = ['id', 'camera_id', 'camera_name', 'timestamp', 'detection_count', 'image_path']
+
+
+def iter_logs(db, user_id, camera_id=None, start=None, end=None):
+    """Yield the user's intrusion logs, oldest first, one batch query at a time"""
+    conditions = ['c.user_id = ?']
+    params = [user_id]
+    if camera_id is not None:
+        conditions.append('il.camera_id = ?')
+        params.append(camera_id)
+    if start:
+        conditions.append('il.timestamp >= ?')
+        params.append(start)
+    if end:
+        conditions.append('il.timestamp < ?')
+        params.append(end)
+
+    sql = f'''
+        SELECT il.id, il.camera_id, c.name AS camera_name, il.timestamp,
+               il.detection_count, il.image_path
+        FROM intrusion_logs il
+        JOIN cameras c ON il.camera_id = c.id
+        WHERE {' AND '.join(conditions)} AND il.id > ?
+        ORDER BY il.id
+        LIMIT ?
+    '''
+
+    last_id = 0
+    while True:
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(sql, (*params, last_id, Config.EXPORT_BATCH_SIZE))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+
+        yield from rows
+        if len(rows) < Config.EXPORT_BATCH_SIZE:
+            return
+        last_id = rows[-1]['id']
+
+
+def _batched(lines, size=None):
+    """Join small pieces into chunks of roughly `size` bytes"""
+    size = size or Config.EXPORT_CHUNK_SIZE
+    chunk = []
+    length = 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield b''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield (json.dumps(row) + '\n').encode('utf-8')
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def stream_ndjson(rows):
+    return _batched(ndjson_lines(rows))
+
+
+def stream_csv(rows):
+    return _batched(csv_lines(rows))
+
+
+class _Drain:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def stream_zip(make_rows):
+    """ZIP with the alert images under images/ and events.ndjson
+
+    make_rows() is called twice (images, then events) so neither pass has
+    to hold the history in memory. Images go first so each event's `image`
+    names a file that is really in the archive (None if it was missing).
+    """
+    drain = _Drain()
+    archive = zipfile.ZipFile(drain, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def image_name(row):
+        # Alert file names only have one-second resolution; prefix the log id
+        return f"images/{row['id']}_{os.path.basename(row['image_path'] or '')}"
+
+    def archived(name):
+        try:
+            archive.getinfo(name)
+            return True
+        except KeyError:
+            return False
+
+    for row in make_rows():
+        if row['image_path'] and os.path.isfile(row['image_path']):
+            try:
+                # JPEGs don't compress; store them as-is
+                archive.write(row['image_path'], image_name(row), compress_type=zipfile.ZIP_STORED)
+            except OSError:
+                pass  # Deleted by retention since the check
+        if drain.size >= Config.EXPORT_CHUNK_SIZE:
+            yield drain.take()
+
+    with archive.open('events.ndjson', 'w', force_zip64=True) as events:
+        for row in make_rows():
+            name = image_name(row)
+            row['image'] = name if archived(name) else None
+            events.write((json.dumps(row) + '\n').encode('utf-8'))
+            if drain.size >= Config.EXPORT_CHUNK_SIZE:
+                yield drain.take()
+
+    archive.close()
+    yield drain.take()
@@ -0,0 +1,264 @@
+"""
+Per-frame detection journal
+
+Every detection result (model runs and detection cache reuses; frames
+skipped under overload are not) is appended to a per-camera binary file
+of fixed-width records, one file per UTC day:
+
+    journal/camera_{id}/2024-05-01.bin
+
+A file is a 16-byte header (magic, record size, max boxes) followed by
+records of RECORD_DTYPE: timestamp, person count, flags and up to
+JOURNAL_MAX_BOXES boxes (frame coordinates, int16) with their scores
+(float16), the most confident first. About 100 bytes per frame with the
+default 8 boxes, written with one buffered append and no index to update.
+That is roughly 85 MB per camera per day at 10 fps, so the journal is off
+unless JOURNAL=true.
+
+Reading memory-maps each day's file as a numpy structured array and finds
+a time range with searchsorted on the timestamp column, so a range scan
+touches only the pages it returns.
+"""
+import logging
+import os
+import shutil
+import struct
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from config import Config
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'SSJ1'
+HEADER = struct.Struct('<4sHH8x')  # magic, record size, max boxes, reserved
+FLAG_CACHED = 1  # Result reused from the detection cache
+
+
+def record_dtype(max_boxes):
+    return np.dtype([
+        ('timestamp', '<f8'),
+        ('count', '<u1'),
+        ('flags', '<u1'),
+        ('boxes', '<i2', (max_boxes, 4)),
+        ('scores', '<f2', (max_boxes,)),
+    ])
+
+
+RECORD_DTYPE = record_dtype(Config.JOURNAL_MAX_BOXES)
+
+
+def day_of(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+
+class JournalWriter:
+    """Appends one camera's records to the current day's file"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.day = None
+        self.file = None
+        self.flushed_at = 0.0
+        self._record = np.zeros(1, dtype=RECORD_DTYPE)
+
+    def _open(self, day):
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{day}.bin')
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, RECORD_DTYPE.itemsize, Config.JOURNAL_MAX_BOXES))
+        self.day = day
+
+    def append(self, timestamp, detections, origin=(0, 0), flags=0):
+        day = day_of(timestamp)
+        if day != self.day:
+            self._open(day)
+
+        record = self._record[0]
+        detections = sorted(detections, key=lambda d: d['confidence'], reverse=True)
+        kept = detections[:Config.JOURNAL_MAX_BOXES]
+        record['timestamp'] = timestamp
+        record['count'] = min(len(detections), 255)
+        record['flags'] = flags
+        record['boxes'] = 0
+        record['scores'] = 0
+        if kept:
+            ox, oy = origin
+            boxes = np.array([d['bbox'] for d in kept], dtype=np.int32) + (ox, oy, ox, oy)
+            record['boxes'][:len(kept)] = boxes
+            record['scores'][:len(kept)] = [d['confidence'] for d in kept]
+        self.file.write(self._record.tobytes())
+
+        if timestamp - self.flushed_at >= Config.JOURNAL_FLUSH_INTERVAL:
+            self.flush()
+            self.flushed_at = timestamp
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.day = None
+
+
+class DetectionJournal:
+    """Writers per camera, plus the range-scan reader"""
+
+    def __init__(self, path=None):
+        self.path = path or Config.JOURNAL_PATH
+        self._writers = {}
+        self._lock = threading.Lock()
+        self._pruned_day = None
+
+    def camera_path(self, camera_id):
+        return os.path.join(self.path, f'camera_{camera_id}')
+
+    def append(self, camera_id, detections, origin=(0, 0), cached=False, timestamp=None):
+        """Record one frame's detections (boxes relative to the ROI at `origin`)
+
+        Called from the camera's worker only, so writers aren't shared.
+        """
+        timestamp = timestamp or time.time()
+        writer = self._writers.get(camera_id)
+        if writer is None:
+            with self._lock:
+                writer = self._writers.setdefault(camera_id, JournalWriter(self.camera_path(camera_id)))
+        day = writer.day
+        try:
+            writer.append(timestamp, detections, origin, FLAG_CACHED if cached else 0)
+        except (OSError, ValueError) as e:
+            # ValueError: the file was closed under us (camera deleted)
+            log.warning("Could not write detection journal: %s", e, extra={'camera_id': camera_id})
+            return
+        if writer.day != day:
+            try:
+                self.prune(writer.day)
+            except OSError as e:
+                log.warning("Could not prune detection journal: %s", e)
+
+    def flush(self, camera_id):
+        writer = self._writers.get(camera_id)
+        if writer is not None:
+            writer.flush()
+
+    def close(self, camera_id):
+        """Close the camera's file (its worker stopped)"""
+        with self._lock:
+            writer = self._writers.pop(camera_id, None)
+        if writer is not None:
+            writer.close()
+
+    def discard(self, camera_id):
+        """Delete a camera's journal (camera deleted)"""
+        self.close(camera_id)
+        shutil.rmtree(self.camera_path(camera_id), ignore_errors=True)
+
+    def prune(self, today):
+        """Delete day files older than JOURNAL_RETENTION_DAYS (once per day)"""
+        if not Config.JOURNAL_RETENTION_DAYS or today == self._pruned_day:
+            return
+        self._pruned_day = today
+        cutoff = (datetime.strptime(today, '%Y-%m-%d') -
+                  timedelta(days=Config.JOURNAL_RETENTION_DAYS)).strftime('%Y-%m-%d')
+        if not os.path.isdir(self.path):
+            return
+        for directory in os.listdir(self.path):
+            directory = os.path.join(self.path, directory)
+            if not os.path.isdir(directory):
+                continue  # Stray files (.DS_Store, ...)
+            for name in os.listdir(directory):
+                if name.endswith('.bin') and name[:-4] < cutoff:
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except OSError:
+                        pass
+
+    def open_day(self, camera_id, day):
+        """Memory-mapped records of one day file (empty array if there is none)"""
+        path = os.path.join(self.camera_path(camera_id), f'{day}.bin')
+        if not os.path.exists(path):
+            return np.empty(0, dtype=RECORD_DTYPE)
+        with open(path, 'rb') as f:
+            magic, record_size, max_boxes = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a detection journal")
+        dtype = record_dtype(max_boxes)
+        if dtype.itemsize != record_size:
+            raise ValueError(f"{path}: unexpected record size {record_size}")
+        # Whole records only: the writer may be mid-append
+        count = (os.path.getsize(path) - HEADER.size) // record_size
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', offset=HEADER.size, shape=(count,))
+
+    def day_slices(self, camera_id, start, end):
+        """Memory-mapped records with start <= timestamp < end, one view per day file
+
+        Callers bound the range (the API to JOURNAL_MAX_DAYS): every day in
+        it is looked up.
+        """
+        self.flush(camera_id)
+        day = datetime.fromtimestamp(start, timezone.utc).date()
+        last = datetime.fromtimestamp(max(start, end - 1e-6), timezone.utc).date()
+        while day <= last:
+            records = self.open_day(camera_id, day.isoformat())
+            if len(records):
+                timestamps = records['timestamp']
+                first, stop = np.searchsorted(timestamps, [start, end], side='left')
+                if stop > first:
+                    yield records[first:stop]
+            day += timedelta(days=1)
+
+    def read_range(self, camera_id, start, end, limit=None):
+        """Records with start <= timestamp < end (Unix seconds), oldest first
+
+        With `limit`, stops once it has limit + 1 records (so callers can
+        tell the range was truncated). Arrays are views into memory-mapped
+        files where the result falls in one day; otherwise they are
+        concatenated.
+        """
+        parts = []
+        collected = 0
+        for records in self.day_slices(camera_id, start, end):
+            if limit is not None:
+                records = records[:limit + 1 - collected]
+            parts.append(records)
+            collected += len(records)
+            if limit is not None and collected > limit:
+                break
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def summarize_range(self, camera_id, start, end):
+        """(frames, frames with persons, max persons) over a range, a day at a time"""
+        frames = with_persons = max_persons = 0
+        for records in self.day_slices(camera_id, start, end):
+            counts = records['count']
+            frames += len(counts)
+            with_persons += int(np.count_nonzero(counts))
+            max_persons = max(max_persons, int(counts.max()))
+        return frames, with_persons, max_persons
+
+
+def to_dicts(records):
+    """Journal records as JSON-friendly dicts"""
+    result = []
+    for record in records:
+        kept = min(int(record['count']), len(record['scores']))
+        result.append({
+            'timestamp': datetime.fromtimestamp(float(record['timestamp']), timezone.utc).isoformat(),
+            'count': int(record['count']),
+            'cached': bool(record['flags'] & FLAG_CACHED),
+            'boxes': record['boxes'][:kept].tolist(),
+            'scores': [round(float(score), 3) for score in record['scores'][:kept]],
+        })
+    return result
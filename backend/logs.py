@@ -0,0 +1,139 @@
+"""
+Structured, rate-limited logging
+
+Modules log through the standard `logging` module (logging.getLogger(__name__)),
+with the camera in `extra={'camera_id': ...}`. setup_logging() puts one
+non-blocking handler on the root logger:
+
+- Per-key rate limiting: each message template, per camera, may log
+  LOG_RATE_BURST records and then LOG_RATE_PER_MINUTE; the rest are dropped
+  and counted, and the next record that gets through carries `suppressed`.
+- A bounded queue: the calling thread only filters and enqueues; formatting
+  and writing happen on a listener thread. If the queue is full the record
+  is dropped (counted as `log_records_dropped`) rather than blocking a camera.
+- JSON lines (LOG_FORMAT=json) with camera_id and any other extra fields,
+  or plain text.
+
+Records below LOG_LEVEL are discarded by the logger before any of this, so
+per-frame debug messages cost one level check when debug logging is off.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+from ratelimit import RateLimiter
+from config import Config
+from metrics import metrics
+
+# LogRecord attributes that aren't extra fields
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per (logger, message template, camera)"""
+
+    def __init__(self, rate=None, burst=None):
+        super().__init__()
+        self.limiter = RateLimiter(rate or Config.LOG_RATE_PER_MINUTE, burst or Config.LOG_RATE_BURST)
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, 'key', None) or (record.name, record.msg, getattr(record, 'camera_id', None))
+        allowed, _ = self.limiter.allow(key)
+        with self._lock:
+            if not allowed:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                metrics.incr('log_records_suppressed')
+                return False
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the listener thread"""
+
+    def prepare(self, record):
+        # The stock prepare() formats the message here, on the caller's thread
+        record = logging.makeLogRecord(vars(record))
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr('log_records_dropped')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and extra fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text with the camera and suppressed count appended"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        camera_id = getattr(record, 'camera_id', None)
+        if camera_id is not None:
+            line += f' [camera {camera_id}]'
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            line += f' ({suppressed} similar suppressed)'
+        return line
+
+
+def setup_logging(level=None, log_format=None):
+    """Route the root logger through the rate limit and the queue; idempotent"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if (log_format or Config.LOG_FORMAT) == 'json' else TextFormatter())
+
+    handler = DroppingQueueHandler(queue.Queue(Config.LOG_QUEUE_SIZE))
+    handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level or Config.LOG_LEVEL)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Flush queued records (at exit)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,80 @@
+"""
+Runtime metrics
+
+Process-wide counters, gauges and CPU-time averages, optionally per camera.
+Counters only go up; averages are exponentially weighted so they follow the
+current load. Served by GET /api/metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and moving averages"""
+
+    def __init__(self, smoothing=0.1):
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, camera_id) -> total
+        self._gauges = {}  # (name, camera_id) -> value
+        self._averages = {}  # (name, camera_id) -> EWMA
+        self.started_at = time.time()
+
+    def incr(self, name, value=1, camera_id=None):
+        key = (name, camera_id)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, camera_id=None):
+        with self._lock:
+            self._gauges[(name, camera_id)] = value
+
+    def observe(self, name, value, camera_id=None):
+        """Fold a sample into the camera's average and the process-wide one"""
+        with self._lock:
+            for key in {(name, camera_id), (name, None)}:
+                previous = self._averages.get(key)
+                if previous is None:
+                    self._averages[key] = value
+                else:
+                    self._averages[key] = previous + self.smoothing * (value - previous)
+
+    def average(self, name, camera_id=None, default=0.0):
+        """Camera average, falling back to the process-wide one"""
+        with self._lock:
+            value = self._averages.get((name, camera_id))
+            if value is None:
+                value = self._averages.get((name, None), default)
+            return value
+
+    def get(self, name, camera_id=None, default=0):
+        with self._lock:
+            return self._counters.get((name, camera_id), self._gauges.get((name, camera_id), default))
+
+    @contextmanager
+    def cpu_timer(self, name, camera_id=None):
+        """Observe the CPU seconds the calling thread spends in the block"""
+        start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.thread_time() - start, camera_id)
+
+    def snapshot(self, camera_ids=None):
+        """Metrics as nested dicts; camera_ids limits the per-camera section"""
+        with self._lock:
+            items = [('counters', self._counters), ('gauges', self._gauges), ('averages', self._averages)]
+            result = {'uptime': time.time() - self.started_at, 'cameras': {}}
+            for section, values in items:
+                result[section] = {}
+                for (name, camera_id), value in values.items():
+                    if camera_id is None:
+                        result[section][name] = value
+                    elif camera_ids is None or camera_id in camera_ids:
+                        camera = result['cameras'].setdefault(camera_id, {})
+                        camera.setdefault(section, {})[name] = value
+            return result
+
+
+metrics = Metrics()
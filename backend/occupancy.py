@@ -0,0 +1,170 @@
+"""
+Spatial occupancy heatmaps
+
+Each camera keeps a low-resolution grid over the frame that accumulates
+where people stand (the bottom of their boxes) in person-seconds. Several
+windows with different half-lives decay side by side. Updates are a few
+numpy operations on the whole grid, however many people are in view.
+Grids are saved to disk periodically and rendered as PNG overlays.
+"""
+import logging
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from config import Config
+
+log = logging.getLogger(__name__)
+
+FOOTPRINT = 0.25  # Bottom fraction of a person box counted as standing area
+MAX_FRAME_WEIGHT = 1.0  # Seconds credited for one frame at most (after gaps/pauses)
+
+
+class OccupancyGrid:
+    """Decaying occupancy counts for one camera, one layer per window"""
+
+    def __init__(self, half_lives, width=None, height=None):
+        self.half_lives = np.asarray(half_lives, dtype=np.float32)
+        self.width = width or Config.OCCUPANCY_GRID_WIDTH
+        self.height = height or Config.OCCUPANCY_GRID_HEIGHT
+        self.data = np.zeros((len(self.half_lives), self.height, self.width), dtype=np.float32)
+        self.updated_at = time.time()
+        self.last_added = None
+
+    def decay(self, now):
+        """Bring every window up to `now`"""
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.data *= (0.5 ** (elapsed / self.half_lives))[:, None, None]
+            self.updated_at = now
+
+    def add(self, boxes, now):
+        """Accumulate footprints of normalized [x1, y1, x2, y2] boxes (N x 4)"""
+        self.decay(now)
+        weight = MAX_FRAME_WEIGHT if self.last_added is None else min(now - self.last_added, MAX_FRAME_WEIGHT)
+        self.last_added = now
+        if len(boxes) == 0 or weight <= 0:
+            return
+
+        boxes = np.asarray(boxes, dtype=np.float32)
+        top = boxes[:, 3] - (boxes[:, 3] - boxes[:, 1]) * FOOTPRINT
+        x1 = np.clip(np.floor(boxes[:, 0] * self.width), 0, self.width - 1).astype(np.intp)
+        x2 = np.clip(np.ceil(boxes[:, 2] * self.width), x1 + 1, self.width).astype(np.intp)
+        y1 = np.clip(np.floor(top * self.height), 0, self.height - 1).astype(np.intp)
+        y2 = np.clip(np.ceil(boxes[:, 3] * self.height), y1 + 1, self.height).astype(np.intp)
+
+        # Paint all rectangles at once: corner deltas + 2D prefix sum
+        delta = np.zeros((self.height + 1, self.width + 1), dtype=np.float32)
+        np.add.at(delta, (y1, x1), weight)
+        np.add.at(delta, (y1, x2), -weight)
+        np.add.at(delta, (y2, x1), -weight)
+        np.add.at(delta, (y2, x2), weight)
+        self.data += delta.cumsum(axis=0).cumsum(axis=1)[:self.height, :self.width]
+
+    def save(self, path):
+        """Write the grid as a compressed .npz (atomic replace)"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, data=self.data.astype(np.float16), half_lives=self.half_lives,
+                                updated_at=np.float64(self.updated_at))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, half_lives):
+        """Read a saved grid; layers are matched to the configured windows by half-life"""
+        grid = cls(half_lives)
+        with np.load(path) as saved:
+            data = saved['data'].astype(np.float32)
+            if data.shape[1:] == grid.data.shape[1:]:
+                for i, half_life in enumerate(saved['half_lives']):
+                    matches = np.flatnonzero(grid.half_lives == half_life)
+                    if matches.size:
+                        grid.data[matches[0]] = data[i]
+            grid.updated_at = float(saved['updated_at'])
+        return grid
+
+
+class OccupancyStore:
+    """Occupancy grids for all cameras, saved under Config.OCCUPANCY_PATH"""
+
+    def __init__(self, path=None):
+        self.path = path or Config.OCCUPANCY_PATH
+        self.windows = list(Config.OCCUPANCY_WINDOWS)
+        self.half_lives = [Config.OCCUPANCY_WINDOWS[name] for name in self.windows]
+        self._grids = {}
+        self._saved_at = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def file_path(self, camera_id):
+        return os.path.join(self.path, f'camera_{camera_id}.npz')
+
+    def _load(self, camera_id):
+        path = self.file_path(camera_id)
+        if os.path.exists(path):
+            try:
+                return OccupancyGrid.load(path, self.half_lives)
+            except Exception as e:
+                log.warning("Could not read occupancy grid for camera %s: %s", camera_id, e,
+                            extra={'camera_id': camera_id})
+        return OccupancyGrid(self.half_lives)
+
+    def grid(self, camera_id, reload=False):
+        """The camera's grid; reload=True re-reads it from disk (another node runs the camera)"""
+        with self._lock:
+            if reload or camera_id not in self._grids:
+                self._grids[camera_id] = self._load(camera_id)
+            return self._grids[camera_id]
+
+    def record(self, camera_id, frame_shape, roi_offset, detections, now=None):
+        """Add one frame's detections (boxes relative to the ROI at roi_offset)"""
+        now = now or time.time()
+        frame_h, frame_w = frame_shape[:2]
+        ox, oy = roi_offset
+        boxes = [
+            [(x1 + ox) / frame_w, (y1 + oy) / frame_h, (x2 + ox) / frame_w, (y2 + oy) / frame_h]
+            for x1, y1, x2, y2 in (det['bbox'] for det in detections)
+        ]
+
+        grid = self.grid(camera_id)
+        with self._lock:
+            grid.add(boxes, now)
+            due = now - self._saved_at.get(camera_id, 0) >= Config.OCCUPANCY_SAVE_INTERVAL
+            if due:
+                self._saved_at[camera_id] = now
+                grid.save(self.file_path(camera_id))
+
+    def save_all(self):
+        """Save every loaded grid (engine shutdown)"""
+        with self._lock:
+            for camera_id, grid in self._grids.items():
+                grid.save(self.file_path(camera_id))
+
+    def discard(self, camera_id):
+        """Forget a camera's grid (camera deleted)"""
+        with self._lock:
+            self._grids.pop(camera_id, None)
+            self._saved_at.pop(camera_id, None)
+        try:
+            os.remove(self.file_path(camera_id))
+        except FileNotFoundError:
+            pass
+
+    def render_png(self, camera_id, window, width, height, reload=False):
+        """Colour-mapped BGRA PNG of one window, transparent where nobody has been"""
+        grid = self.grid(camera_id, reload)
+        with self._lock:
+            grid.decay(time.time())
+            layer = grid.data[self.windows.index(window)].copy()
+
+        peak = float(layer.max())
+        normalized = (layer / peak * 255).astype(np.uint8) if peak > 0 else np.zeros_like(layer, dtype=np.uint8)
+        normalized = cv2.resize(normalized, (width, height), interpolation=cv2.INTER_LINEAR)
+
+        overlay = cv2.cvtColor(cv2.applyColorMap(normalized, cv2.COLORMAP_JET), cv2.COLOR_BGR2BGRA)
+        overlay[:, :, 3] = normalized
+        _, buffer = cv2.imencode('.png', overlay)
+        return buffer.tobytes()
@@ -0,0 +1,128 @@
+"""
+Load shedding under overload
+
+The OverloadController samples loop lag and the inference queue depth once
+per OVERLOAD_CHECK_INTERVAL. While either stays above its threshold it
+steps down one stage at a time; once both have been well below for a
+while it steps back up, one stage at a time. Stages are cumulative:
+
+1. stream_fps: cap every viewer tier at OVERLOAD_STREAM_FPS
+2. jpeg_quality: cap JPEG quality at OVERLOAD_JPEG_QUALITY
+3. motion_only: idle cameras (no viewers, nobody seen lately) run the
+   model only when their ROI changes
+4. detection_rate: low-priority cameras run the model on every
+   OVERLOAD_DETECTION_STRIDE-th frame
+
+Every step is counted in metrics, printed, and emitted as an `overload`
+WebSocket event.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from config import Config
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+STAGES = ('normal', 'stream_fps', 'jpeg_quality', 'motion_only', 'detection_rate')
+STREAM_FPS, JPEG_QUALITY, MOTION_ONLY, DETECTION_RATE = range(1, 5)
+
+
+class OverloadController:
+    """Steps degradation up and down with the load"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.level = 0
+        self.history = deque(maxlen=50)
+        self._hot = 0  # Consecutive checks over a threshold
+        self._calm = 0  # Consecutive checks well under both thresholds
+        self._thread = None
+
+    @property
+    def stage(self):
+        return STAGES[self.level]
+
+    def check(self, loop_lag, queue_depth):
+        """Fold in one sample; returns the (possibly new) level"""
+        metrics.set('loop_lag', loop_lag)
+        if loop_lag > Config.OVERLOAD_LOOP_LAG or queue_depth > Config.OVERLOAD_QUEUE_DEPTH:
+            self._hot += 1
+            self._calm = 0
+        elif loop_lag < Config.OVERLOAD_LOOP_LAG / 2 and queue_depth <= Config.OVERLOAD_QUEUE_DEPTH / 2:
+            self._calm += 1
+            self._hot = 0
+        else:
+            # In between: hold the current level
+            self._hot = self._calm = 0
+
+        if self._hot >= Config.OVERLOAD_ESCALATE_CHECKS and self.level < len(STAGES) - 1:
+            self.set_level(self.level + 1, loop_lag, queue_depth)
+        elif self._calm >= Config.OVERLOAD_RECOVER_CHECKS and self.level > 0:
+            self.set_level(self.level - 1, loop_lag, queue_depth)
+        return self.level
+
+    def set_level(self, level, loop_lag=0.0, queue_depth=0):
+        """Apply a degradation level and report the step"""
+        direction = 'down' if level > self.level else 'up'
+        self.level = level
+        self._hot = self._calm = 0
+
+        self.engine.hub.fps_cap = Config.OVERLOAD_STREAM_FPS if level >= STREAM_FPS else None
+        self.engine.hub.quality_cap = Config.OVERLOAD_JPEG_QUALITY if level >= JPEG_QUALITY else None
+
+        metrics.set('overload_level', level)
+        metrics.incr('overload_steps_down' if direction == 'down' else 'overload_steps_up')
+        event = {
+            'level': level,
+            'stage': STAGES[level],
+            'direction': direction,
+            'loop_lag': round(loop_lag, 3),
+            'queue_depth': queue_depth,
+            'timestamp': datetime.now().isoformat()
+        }
+        self.history.append(event)
+        log.warning("Overload: stepped %s to level %d (%s), loop lag %.3fs, inference queue %d",
+                    direction, level, STAGES[level], loop_lag, queue_depth)
+        self.engine.notify('overload', event)
+
+    def skip_reason(self, camera_id, camera, state, roi_frame):
+        """Why the model should not run on this frame ('motion' / 'rate'), or None"""
+        if self.level >= DETECTION_RATE and \
+                (camera.get('inference_priority') or 0) <= Config.OVERLOAD_LOW_PRIORITY:
+            state.shed_frames += 1
+            if state.shed_frames % Config.OVERLOAD_DETECTION_STRIDE:
+                return 'rate'
+
+        if self.level >= MOTION_ONLY and roi_frame.size and \
+                time.time() - state.last_person_time > Config.OVERLOAD_IDLE_AFTER and \
+                not self.engine.hub.has_viewers(camera_id):
+            h, w = roi_frame.shape[:2]
+            # update() is False on the first frame and on periodic full scans: run the model then
+            if state.idle_gate.update(roi_frame) and not state.idle_gate.is_active(0, 0, w, h):
+                return 'motion'
+        return None
+
+    def _run(self):
+        interval = Config.OVERLOAD_CHECK_INTERVAL
+        while True:
+            start = time.monotonic()
+            time.sleep(interval)
+            # Oversleeping means this thread was starved; the engine may know better (event loop)
+            loop_lag = max(time.monotonic() - start - interval, self.engine.loop_lag())
+            try:
+                self.check(loop_lag, self.engine.scheduler.queue_depth())
+            except Exception as e:
+                log.error("Overload check failed: %s", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def status(self):
+        """Current level and recent steps, for /api/metrics"""
+        return {'level': self.level, 'stage': self.stage, 'history': list(self.history)}
@@ -0,0 +1,159 @@
+"""
+In-process profiling
+
+sample_stacks() is a sampling profiler: a background thread reads every
+thread's current stack (sys._current_frames) at a fixed interval and
+counts identical stacks. Sampling costs a few microseconds per thread per
+tick and nothing in between, so it is safe on a busy production process.
+The result is in collapsed-stack format ("thread;outer;...;inner count"
+per line), which flamegraph.pl, speedscope and inferno read directly.
+
+CameraProfile runs cProfile on one camera's worker, with one profile per
+pipeline stage (prepare, detect, finish, encode), for a time-boxed window.
+cProfile is deterministic and slows the profiled calls down, so it is
+limited to one camera at a time.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from config import Config
+
+STAGES = ('prepare', 'detect', 'finish', 'encode')
+
+_busy = threading.Lock()  # One profile (sampling or cProfile) at a time
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already running"""
+
+
+def code_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds, interval=None, thread_prefix=None):
+    """Sample every thread's stack for `seconds`; returns collapsed-stack text
+
+    thread_prefix limits sampling to threads whose name starts with it
+    (e.g. 'camera-' for threaded workers). Raises ProfilerBusy.
+    """
+    interval = interval or Config.PROFILE_SAMPLE_INTERVAL
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        own = threading.get_ident()
+        counts = Counter()
+        labels = {}  # Code object -> label; the same few hundred functions recur every tick
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()
+                     if not thread_prefix or thread.name.startswith(thread_prefix)}
+            frames = sys._current_frames()
+            if thread_prefix:
+                # Skip other threads before walking their stacks
+                frames = {ident: frames[ident] for ident in names if ident in frames}
+            frames.pop(own, None)
+            for ident, frame in frames.items():
+                name = names.get(ident, f'thread-{ident}')
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = code_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(name)
+                counts[';'.join(reversed(stack))] += 1
+            time.sleep(interval)
+        return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+    finally:
+        _busy.release()
+
+
+class CameraProfile:
+    """cProfile of one camera's pipeline stages over a time-boxed window"""
+
+    def __init__(self, camera_id, seconds):
+        self.camera_id = camera_id
+        self.deadline = time.monotonic() + seconds
+        self.profiles = {stage: cProfile.Profile() for stage in STAGES}
+        self.frames = 0
+        self.done = threading.Event()
+
+    @contextmanager
+    def stage(self, name):
+        """Profile the block as `name`; runs on whichever thread executes the stage"""
+        if self.done.is_set():
+            yield
+            return
+        profile = self.profiles[name]
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this interpreter
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            if name == 'prepare':
+                self.frames += 1
+            if time.monotonic() >= self.deadline:
+                self.done.set()
+
+    def report(self, top=None):
+        """Per-stage totals and the functions with the most cumulative time"""
+        top = top or Config.PROFILE_TOP_FUNCTIONS
+        stages = {}
+        for name, profile in self.profiles.items():
+            try:
+                stats = pstats.Stats(profile, stream=io.StringIO())
+            except TypeError:
+                # Stage never ran (e.g. everything came from the detection cache)
+                stages[name] = {'total_seconds': 0.0, 'functions': []}
+                continue
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+            stages[name] = {
+                'total_seconds': round(stats.total_tt, 4),
+                'functions': [{
+                    'function': f"{func} ({os.path.basename(path)}:{line})",
+                    'calls': calls,
+                    'own_seconds': round(own, 4),
+                    'cumulative_seconds': round(cumulative, 4),
+                } for (path, line, func), (_, calls, own, cumulative, _) in rows]
+            }
+        return {'camera_id': self.camera_id, 'frames': self.frames, 'stages': stages}
+
+
+def profile_camera(engine, camera_id, seconds):
+    """Profile a running camera's stages for `seconds`; returns the report
+
+    The camera's worker enables each stage's profile itself, so the model
+    and encoding calls are measured on the threads that run them. Raises
+    ProfilerBusy.
+    """
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        profile = CameraProfile(camera_id, seconds)
+        engine.profiles[camera_id] = profile
+        try:
+            # A stalled camera never reaches the deadline itself
+            profile.done.wait(seconds + Config.PROFILE_GRACE_SECONDS)
+            profile.done.set()
+        finally:
+            engine.profiles.pop(camera_id, None)
+        report = profile.report()
+        report['seconds'] = seconds
+        return report
+    finally:
+        _busy.release()
@@ -0,0 +1,38 @@
+"""
+Token-bucket rate limiting
+
+Shared by login/register (per client IP and per username) and by logging
+(per message and camera). Kept free of other imports so either can use it
+without pulling in the other.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimiter:
+    """Token buckets per key: `rate` requests per minute with bursts up to `burst`"""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill time)
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Take a token for key; returns (allowed, seconds until the next token)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            # Forget the least recently seen clients (their buckets would be full again anyway)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        retry_after = 0 if allowed else (1 - tokens) / self.rate
+        return allowed, retry_after
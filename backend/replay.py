@@ -0,0 +1,474 @@
+"""
+Replay of recorded footage against candidate settings
+
+Runs video files through IntrusionDetector the way a camera worker would,
+with settings that override the camera's (confidence threshold, ROI,
+inference size, alert interval, K-of-M confirmation), and reports which
+alerts would have fired. With a camera and the footage's start time (UTC)
+the alerts that actually fired are loaded from intrusion_logs and compared.
+
+Footage is cut into REPLAY_SEGMENT_SECONDS segments that are analysed in
+parallel worker processes, each with its own model. Alert decisions are
+then made in order over the whole timeline in the parent.
+
+Live cameras confirm alerts over their last `confirm_frames` frames at the
+camera's frame rate, while replay looks at REPLAY_SAMPLE_FPS. K-of-M is
+scaled to the same span of time (e.g. 2 of 3 frames at 25 fps, 0.12s,
+becomes 1 of 1 sampled frame at 5 fps); the report shows the window used.
+
+Workers are spawned processes, which re-import the parent's main module
+(app.py or asgi.py). Their names start with WORKER_NAME so those modules
+can tell (in_worker_process()) and skip loading the live runtime.
+
+    python replay.py footage.mp4 --conf 0.6
+    python replay.py night1.mp4 night2.mp4 --camera 3 --start "2024-05-01 22:00:00" --confirm 2/3
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import cv2
+
+from config import Config
+from detection import IntrusionDetector, MotionGate, resize_to_width
+from logs import setup_logging
+
+log = logging.getLogger(__name__)
+
+# Camera settings a replay can override
+SETTINGS = ('confidence_threshold', 'alert_interval', 'confirm_hits', 'confirm_frames', 'inference_size',
+            'tiled_inference', 'roi_x', 'roi_y', 'roi_width', 'roi_height')
+DEFAULT_SETTINGS = {
+    'confidence_threshold': Config.CONFIDENCE_THRESHOLD,
+    'alert_interval': Config.DETECTION_INTERVAL,
+    'confirm_hits': 1,
+    'confirm_frames': 1,
+    'inference_size': 0,
+    'tiled_inference': False,
+    'roi_x': 0, 'roi_y': 0, 'roi_width': 0, 'roi_height': 0,
+}
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+WORKER_NAME = 'replay-worker'
+
+_detector = None  # One model per worker process
+
+
+class _WorkerProcess(multiprocessing.context.SpawnProcess):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Set before the child imports anything, so in_worker_process() works at import time
+        self.name = f'{WORKER_NAME}-{self.name}'
+
+
+class _WorkerContext(multiprocessing.context.SpawnContext):
+    Process = _WorkerProcess
+
+
+def in_worker_process():
+    """True in a replay worker, including while it re-imports the parent's main module"""
+    return multiprocessing.current_process().name.startswith(WORKER_NAME)
+
+
+def _init_worker():
+    global _detector
+    import torch
+    # Processes are the parallelism; keep each model to one thread, below live cameras
+    torch.set_num_threads(1)
+    try:
+        os.nice(Config.REPLAY_NICE)
+    except (AttributeError, OSError):
+        pass
+    _detector = IntrusionDetector()
+
+
+def video_info(path):
+    """(fps, frame count) of a video file; raises ValueError if it can't be opened"""
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ValueError(f"Cannot open video '{path}'")
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        return fps, int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        capture.release()
+
+
+def plan_segments(sources, sample_fps):
+    """Split footage into work items: (path, first frame, end frame, step, fps, offset of the file)
+
+    Returns (segments, total duration in seconds).
+    """
+    segments = []
+    offset = 0.0
+    for path in sources:
+        fps, frame_count = video_info(path)
+        step = max(1, round(fps / sample_fps))
+        length = max(step, int(Config.REPLAY_SEGMENT_SECONDS * fps))
+        for first in range(0, frame_count, length):
+            segments.append((path, first, min(first + length, frame_count), step, fps, offset))
+        offset += frame_count / fps
+    return segments, offset
+
+
+def sampled_frames(first, end, step):
+    """Frames of [first, end) that are analysed (every step-th frame of the file)"""
+    return len(range(first + (-first) % step, end, step))
+
+
+def analyze_segment(path, first, end, step, settings):
+    """Worker: [(frame index, persons, best confidence)] for the sampled frames of a segment"""
+    roi = {'x': settings['roi_x'], 'y': settings['roi_y'],
+           'width': settings['roi_width'], 'height': settings['roi_height']}
+    motion_gate = MotionGate()
+    samples = []
+
+    capture = cv2.VideoCapture(path)
+    try:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+        for index in range(first, end):
+            if index % step:
+                # Skipped frames are only demuxed, not decoded to BGR
+                if not capture.grab():
+                    break
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+            source_frame = resize_to_width(frame, Config.TILED_FRAME_WIDTH) if settings['tiled_inference'] else None
+            frame = _detector.preprocess_frame(frame)
+            detections = _detector.find_persons_in_roi(
+                frame, roi, confidence_threshold=settings['confidence_threshold'],
+                inference_size=settings['inference_size'] or 0,
+                source_frame=source_frame, motion_gate=motion_gate
+            )
+            samples.append((index, len(detections), max((d['confidence'] for d in detections), default=0.0)))
+    finally:
+        capture.release()
+    return samples
+
+
+def scaled_confirmation(settings, sample_fps, live_fps):
+    """(hits, frames) over sampled frames covering the time live K-of-M covers"""
+    confirm_frames = settings['confirm_frames'] or 1
+    confirm_hits = min(settings['confirm_hits'] or 1, confirm_frames)
+    if sample_fps >= live_fps:
+        return confirm_hits, confirm_frames
+    frames = max(1, round(confirm_frames * sample_fps / live_fps))
+    hits = min(frames, max(1, round(confirm_hits * frames / confirm_frames)))
+    return hits, frames
+
+
+def simulate_alerts(samples, settings, confirmation=None):
+    """Alerts the live engine would raise from (offset, persons) samples in time order
+
+    confirmation: (hits, frames) to use instead of the settings' K-of-M.
+    """
+    confirm_frames = settings['confirm_frames'] or 1
+    confirm_hits = min(settings['confirm_hits'] or 1, confirm_frames)
+    if confirmation is not None:
+        confirm_hits, confirm_frames = confirmation
+    recent = deque(maxlen=confirm_frames)
+    last_alert = None
+    alerts = []
+    for offset, persons in samples:
+        recent.append(persons > 0)
+        if persons == 0 or sum(recent) < confirm_hits:
+            continue
+        if last_alert is not None and offset - last_alert <= settings['alert_interval']:
+            continue
+        last_alert = offset
+        alerts.append({'offset': round(offset, 2), 'person_count': persons})
+    return alerts
+
+
+def compare_alerts(replayed, actual, window=None):
+    """Pair replayed and actual alerts that are within `window` seconds of each other"""
+    window = Config.REPLAY_MATCH_WINDOW if window is None else window
+    unmatched = list(actual)
+    matched = []
+    only_replay = []
+    for alert in replayed:
+        best = min(unmatched, key=lambda a: abs(a['offset'] - alert['offset']), default=None)
+        if best is not None and abs(best['offset'] - alert['offset']) <= window:
+            unmatched.remove(best)
+            matched.append({'replay': alert, 'actual': best})
+        else:
+            only_replay.append(alert)
+    return {'matched': matched, 'only_replay': only_replay, 'only_actual': unmatched}
+
+
+def run_replay(sources, settings, sample_fps=None, start=None, actual=None, workers=None,
+               progress=None, cancelled=None):
+    """Replay footage; returns the report dict
+
+    start: datetime (UTC) of the first frame, used to timestamp alerts.
+    actual: alerts that really fired, as [{'offset', 'person_count', ...}].
+    progress(done, total) is called as sampled frames complete;
+    cancelled() returning True stops the replay (raises RuntimeError).
+    """
+    settings = {**DEFAULT_SETTINGS, **{k: v for k, v in settings.items() if v is not None}}
+    sample_fps = sample_fps or Config.REPLAY_SAMPLE_FPS
+    segments, duration = plan_segments(sources, sample_fps)
+    total = sum(sampled_frames(first, end, step) for _, first, end, step, _, _ in segments)
+    done = 0
+    samples = []
+    started = time.perf_counter()
+
+    # Spawn: forking a process with torch threads can deadlock
+    with ProcessPoolExecutor(workers or Config.REPLAY_WORKERS, mp_context=_WorkerContext(),
+                             initializer=_init_worker) as pool:
+        futures = {pool.submit(analyze_segment, path, first, end, step, settings): (fps, offset)
+                   for path, first, end, step, fps, offset in segments}
+        for future in as_completed(futures):
+            if cancelled and cancelled():
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise RuntimeError('Replay cancelled')
+            fps, offset = futures[future]
+            segment = future.result()
+            samples.extend((offset + index / fps, persons, confidence) for index, persons, confidence in segment)
+            done += len(segment)
+            if progress:
+                progress(done, total)
+
+    samples.sort()
+    # Frame rate the live camera would have run at (the footage's own)
+    live_fps = sum(end - first for _, first, end, _, _, _ in segments) / duration if duration else sample_fps
+    confirmation = scaled_confirmation(settings, sample_fps, live_fps)
+    replayed = simulate_alerts([(offset, persons) for offset, persons, _ in samples], settings, confirmation)
+    if start is not None:
+        for alert in replayed:
+            alert['timestamp'] = (start + timedelta(seconds=alert['offset'])).strftime(TIME_FORMAT)
+
+    report = {
+        'settings': settings,
+        'sample_fps': sample_fps,
+        'footage_fps': round(live_fps, 2),
+        'confirmation': {
+            'hits': confirmation[0],
+            'frames': confirmation[1],
+            'window_seconds': round(confirmation[1] / min(sample_fps, live_fps), 3),
+        },
+        'frames_analyzed': len(samples),
+        'frames_with_persons': sum(1 for _, persons, _ in samples if persons),
+        'duration': round(duration, 2),
+        'elapsed': round(time.perf_counter() - started, 2),
+        'would_fire': replayed,
+    }
+    if actual is not None:
+        report['actual'] = actual
+        report.update(compare_alerts(replayed, actual))
+    return report
+
+
+def actual_alerts(db, camera_id, start, duration):
+    """Alerts the camera really raised during the footage, as offsets from start"""
+    end = start + timedelta(seconds=duration)
+    rows = db.get_camera_logs(camera_id, start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT))
+    return [{
+        'offset': round((datetime.strptime(row['timestamp'], TIME_FORMAT) - start).total_seconds(), 2),
+        'person_count': row['detection_count'],
+        'timestamp': row['timestamp'],
+        'log_id': row['id'],
+    } for row in rows]
+
+
+def footage_duration(sources):
+    """Total length in seconds of the video files played back to back"""
+    return sum(frame_count / fps for fps, frame_count in map(video_info, sources))
+
+
+def camera_settings(camera, overrides):
+    """Camera's stored settings with the candidate overrides on top"""
+    settings = {key: camera.get(key) for key in SETTINGS if camera.get(key) is not None}
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    return settings
+
+
+class ReplayJob:
+    """A queued or running replay started through the API"""
+
+    def __init__(self, user_id, camera, sources, overrides, start, sample_fps):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.camera = camera
+        self.sources = sources
+        self.overrides = overrides
+        self.start = start
+        self.sample_fps = sample_fps
+        self.status = 'queued'
+        self.frames_done = 0
+        self.frames_total = 0
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.created_at = datetime.now().isoformat()
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'camera_id': self.camera['id'],
+            'sources': [os.path.basename(path) for path in self.sources],
+            'status': self.status,
+            'progress': round(self.frames_done / self.frames_total, 4) if self.frames_total else 0.0,
+            'frames_done': self.frames_done,
+            'frames_total': self.frames_total,
+            'created_at': self.created_at,
+            'error': self.error,
+            'result': self.result,
+        }
+
+
+class ReplayManager:
+    """Runs API replay jobs one at a time on a background thread"""
+
+    def __init__(self, db):
+        self.db = db
+        self.jobs = {}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def resolve_source(self, name):
+        """Absolute path of a file under REPLAY_PATH; raises ValueError outside it or if missing"""
+        root = os.path.realpath(Config.REPLAY_PATH)
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            raise ValueError(f"Unknown recording '{name}'")
+        return path
+
+    def list_sources(self):
+        """Video files available for replay, relative to REPLAY_PATH"""
+        root = Config.REPLAY_PATH
+        if not os.path.isdir(root):
+            return []
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), root)
+            for directory, _, names in os.walk(root) for name in names
+            if os.path.splitext(name)[1].lower() in Config.REPLAY_EXTENSIONS
+        )
+
+    def submit(self, user_id, camera, sources, overrides, start=None, sample_fps=None):
+        job = ReplayJob(user_id, camera, sources, overrides, start, sample_fps)
+        with self._lock:
+            finished = [j for j in self.jobs.values()
+                        if j.user_id == user_id and j.status in ('done', 'failed', 'cancelled')]
+            for old in finished[:max(0, len(finished) - Config.REPLAY_MAX_JOBS + 1)]:
+                del self.jobs[old.id]
+            self.jobs[job.id] = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id, user_id):
+        job = self.jobs.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    def cancel(self, job):
+        job.cancel_requested = True
+        if job.status == 'queued':
+            job.status = 'cancelled'
+
+    def _progress(self, job, done, total):
+        job.frames_done = done
+        job.frames_total = total
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job.status == 'cancelled':
+                continue
+            job.status = 'running'
+            try:
+                actual = None
+                if job.start is not None:
+                    actual = actual_alerts(self.db, job.camera['id'], job.start, footage_duration(job.sources))
+                job.result = run_replay(
+                    job.sources, camera_settings(job.camera, job.overrides), job.sample_fps, job.start, actual,
+                    progress=lambda done, total: self._progress(job, done, total),
+                    cancelled=lambda: job.cancel_requested
+                )
+                job.status = 'done'
+            except Exception as e:
+                job.status = 'cancelled' if job.cancel_requested else 'failed'
+                job.error = None if job.cancel_requested else str(e)
+                log.warning("Replay %s %s: %s", job.id, job.status, e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded footage against candidate detection settings')
+    parser.add_argument('sources', nargs='+', help='Video files, in order')
+    parser.add_argument('--camera', type=int, help='Start from this camera\'s settings and compare with its alerts')
+    parser.add_argument('--start', help='UTC time of the first frame, e.g. "2024-05-01 22:00:00"')
+    parser.add_argument('--conf', type=float, help='Confidence threshold')
+    parser.add_argument('--roi', help='ROI as x,y,width,height on the processed frame')
+    parser.add_argument('--alert-interval', type=int)
+    parser.add_argument('--confirm', help='K/M confirmation, e.g. 2/3')
+    parser.add_argument('--inference-size', type=int)
+    parser.add_argument('--tiled', action='store_true', default=None)
+    parser.add_argument('--sample-fps', type=float, default=Config.REPLAY_SAMPLE_FPS,
+                        help='Frames analysed per second of footage')
+    parser.add_argument('--workers', type=int, default=Config.REPLAY_WORKERS)
+    parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+    args = parser.parse_args()
+    setup_logging()
+
+    overrides = {
+        'confidence_threshold': args.conf,
+        'alert_interval': args.alert_interval,
+        'inference_size': args.inference_size,
+        'tiled_inference': args.tiled,
+    }
+    if args.roi:
+        overrides.update(zip(('roi_x', 'roi_y', 'roi_width', 'roi_height'), (int(v) for v in args.roi.split(','))))
+    if args.confirm:
+        overrides['confirm_hits'], overrides['confirm_frames'] = (int(v) for v in args.confirm.split('/'))
+
+    settings = overrides
+    start = datetime.strptime(args.start, TIME_FORMAT) if args.start else None
+    actual = None
+    if args.camera is not None:
+        from database import Database
+        db = Database()
+        camera = db.get_camera(args.camera)
+        if not camera:
+            parser.error(f'Camera {args.camera} not found')
+        settings = camera_settings(camera, overrides)
+        if start is not None:
+            actual = actual_alerts(db, args.camera, start, footage_duration(args.sources))
+
+    def show_progress(done, total):
+        print(f"\rAnalysed {done}/{total} frames ({done / total:.0%})", end='', flush=True)
+
+    report = run_replay(args.sources, settings, args.sample_fps, start, actual, args.workers, show_progress)
+    print()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['frames_analyzed']} frames over {report['duration']:.0f}s of footage "
+          f"in {report['elapsed']:.1f}s, persons in {report['frames_with_persons']}")
+    confirmation = report['confirmation']
+    print(f"Confirmation: {confirmation['hits']} of {confirmation['frames']} sampled frames "
+          f"({confirmation['window_seconds']}s of footage at {report['footage_fps']} fps)")
+    print(f"Would fire {len(report['would_fire'])} alert(s):")
+    for alert in report['would_fire']:
+        print(f"  {alert.get('timestamp', '+%.1fs' % alert['offset'])}  persons={alert['person_count']}")
+    if actual is not None:
+        print(f"Actually fired {len(actual)}: {len(report['matched'])} matched, "
+              f"{len(report['only_replay'])} new, {len(report['only_actual'])} no longer fire")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Fair-share inference scheduling
+
+Camera workers share one detection model. Instead of letting every worker
+call it at once, each takes a slot from the InferenceScheduler around its
+model call. When a slot frees up, the next camera is chosen by:
+
+1. priority class: higher `inference_priority` first (e.g. perimeter
+   cameras), so critical cameras keep their latency under overload;
+2. max share: a camera that has used more than `inference_max_share` of
+   recent inference time waits while anyone else is waiting;
+3. weighted fair queuing: within a class, the camera with the least
+   inference time used per unit of `inference_weight` goes next.
+
+Queue depth, wait time and share are recorded in metrics per camera.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from config import Config
+from metrics import metrics
+
+IDLE_AFTER = 1.0  # Seconds without a request after which a camera's saved-up credit is dropped
+
+
+def scheduling_settings(camera):
+    """(priority, weight, max_share) of a camera row, with defaults"""
+    priority = camera.get('inference_priority') or 0
+    weight = camera.get('inference_weight') or 1.0
+    max_share = camera.get('inference_max_share') or 1.0
+    return priority, max(weight, 0.01), min(max(max_share, 0.01), 1.0)
+
+
+class _Request:
+    __slots__ = ('camera_id', 'priority', 'weight', 'max_share', 'queued_at', 'granted', 'holding', 'on_grant')
+
+    def __init__(self, camera_id, priority, weight, max_share, on_grant):
+        self.camera_id = camera_id
+        self.priority = priority
+        self.weight = weight
+        self.max_share = max_share
+        self.queued_at = time.monotonic()
+        self.granted = threading.Event()
+        self.holding = False  # Set under the scheduler lock when a slot is assigned
+        self.on_grant = on_grant
+
+
+class InferenceScheduler:
+    """Hands out `slots` concurrent inference slots fairly across cameras"""
+
+    def __init__(self, slots=None, window=None):
+        self.slots = slots or Config.INFERENCE_SLOTS
+        self.window = window or Config.INFERENCE_SHARE_WINDOW
+        self._lock = threading.Lock()
+        self._free = self.slots
+        self._waiting = []
+        self._pass = {}  # camera_id -> inference seconds used / weight (virtual time)
+        self._vtime = 0.0  # Virtual time of the last grant
+        self._released_at = {}  # camera_id -> time of the camera's last release
+        self._busy = {}  # camera_id -> decayed inference seconds
+        self._busy_total = 0.0
+        self._decayed_at = time.monotonic()
+
+    def _decay(self, now):
+        factor = math.exp(-(now - self._decayed_at) / self.window)
+        self._decayed_at = now
+        self._busy_total *= factor
+        for camera_id in self._busy:
+            self._busy[camera_id] *= factor
+
+    def share(self, camera_id):
+        """Fraction of recent inference time used by the camera"""
+        with self._lock:
+            return self._share(camera_id)
+
+    def _share(self, camera_id):
+        if self._busy_total <= 0:
+            return 0.0
+        return self._busy.get(camera_id, 0.0) / self._busy_total
+
+    def _pick(self):
+        """Index of the next request to grant (lock held)"""
+        capped = [request for request in self._waiting if self._share(request.camera_id) >= request.max_share]
+        # Caps only bite under contention: a lone capped camera still gets the idle model
+        candidates = [request for request in self._waiting if request not in capped] or self._waiting
+        top = max(request.priority for request in candidates)
+        best = min((request for request in candidates if request.priority == top),
+                   key=lambda request: (self._pass.get(request.camera_id, 0.0), request.queued_at))
+        return self._waiting.index(best)
+
+    def _dispatch(self):
+        """Grant free slots to waiting requests (lock held)"""
+        granted = []
+        while self._free and self._waiting:
+            request = self._waiting.pop(self._pick())
+            self._free -= 1
+            request.holding = True
+            self._vtime = self._pass.get(request.camera_id, 0.0)
+            granted.append(request)
+        metrics.set('inference_queue_depth', len(self._waiting))
+        return granted
+
+    def _grant(self, granted):
+        now = time.monotonic()
+        for request in granted:
+            wait = now - request.queued_at
+            metrics.observe('inference_wait', wait, request.camera_id)
+            metrics.set('inference_queue_depth', 0, request.camera_id)
+            request.granted.set()
+            if request.on_grant:
+                request.on_grant()
+
+    def submit(self, camera_id, camera, on_grant=None):
+        """Queue a request for a slot; wait on request.granted or use on_grant"""
+        request = _Request(camera_id, *scheduling_settings(camera), on_grant)
+        with self._lock:
+            # A camera returning from idle doesn't get to spend credit it saved up
+            if time.monotonic() - self._released_at.get(camera_id, 0.0) > IDLE_AFTER:
+                self._pass[camera_id] = max(self._pass.get(camera_id, 0.0), self._vtime)
+            self._waiting.append(request)
+            metrics.set('inference_queue_depth',
+                        sum(1 for queued in self._waiting if queued.camera_id == camera_id), camera_id)
+            granted = self._dispatch()
+        self._grant(granted)
+        return request
+
+    def release(self, request, seconds):
+        """Return a granted slot and charge `seconds` of inference to the camera"""
+        now = time.monotonic()
+        with self._lock:
+            self._decay(now)
+            camera_id = request.camera_id
+            self._busy[camera_id] = self._busy.get(camera_id, 0.0) + seconds
+            self._busy_total += seconds
+            self._pass[camera_id] = self._pass.get(camera_id, 0.0) + seconds / request.weight
+            self._free += 1
+            self._released_at[camera_id] = now
+            request.holding = False
+            share = self._share(camera_id)
+            granted = self._dispatch()
+        metrics.set('inference_share', share, camera_id)
+        metrics.observe('inference_seconds', seconds, camera_id)
+        self._grant(granted)
+
+    def cancel(self, request):
+        """Withdraw a request whose caller gave up waiting (returns its slot if granted)"""
+        with self._lock:
+            if request in self._waiting:
+                self._waiting.remove(request)
+            holding = request.holding
+        if holding:
+            self.release(request, 0.0)
+
+    @contextmanager
+    def slot(self, camera_id, camera):
+        """Block until the camera may run inference, and hold the slot for the block"""
+        request = self.submit(camera_id, camera)
+        request.granted.wait()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(request, time.monotonic() - start)
+
+    def queue_depth(self):
+        """Requests waiting for a slot"""
+        with self._lock:
+            return len(self._waiting)
+
+    def forget(self, camera_id):
+        """Drop a stopped camera's accounting"""
+        with self._lock:
+            self._pass.pop(camera_id, None)
+            self._released_at.pop(camera_id, None)
+            self._busy_total = max(0.0, self._busy_total - self._busy.pop(camera_id, 0.0))
+
+    def status(self):
+        """Waiting cameras and recent shares, for /api/metrics"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'free': self._free,
+                'waiting': [{'camera_id': request.camera_id, 'priority': request.priority,
+                             'waited': now - request.queued_at} for request in self._waiting],
+                'shares': {camera_id: self._share(camera_id) for camera_id in self._busy}
+            }
@@ -0,0 +1,111 @@
+"""
+Time-based detection profiles
+
+A camera can have schedule profiles: weekly time windows that disarm
+detection or override its confidence threshold, alert interval and
+processing rate (e.g. armed only at night, stricter threshold after dark).
+Times are server local time; a window whose end is before its start runs
+past midnight, and equal start and end means the whole day.
+
+The ScheduleIndex flattens each camera's profiles into sorted minute-of-week
+boundaries once, when the reconciler loads them, so workers look up the
+active profile with one bisect per frame and never touch the database.
+"""
+from bisect import bisect_right
+from datetime import datetime
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+OVERRIDES = ('confidence_threshold', 'alert_interval', 'detection_fps')
+
+
+def parse_time(value):
+    """'HH:MM' -> minute of the day; raises ValueError"""
+    hours, minutes = (int(part) for part in str(value).split(':'))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time '{value}'")
+    return hours * 60 + minutes
+
+
+def parse_days(value):
+    """'0,1,2' (0 = Monday) -> sorted weekday numbers; raises ValueError"""
+    days = sorted({int(day) for day in str(value).split(',') if day.strip()})
+    if not days or not all(0 <= day <= 6 for day in days):
+        raise ValueError(f"Invalid days '{value}'")
+    return days
+
+
+def schedule_windows(schedule):
+    """Minute-of-week [start, end) intervals a schedule covers"""
+    start = parse_time(schedule['start_time'])
+    length = (parse_time(schedule['end_time']) - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+    for day in parse_days(schedule['days']):
+        begin = day * MINUTES_PER_DAY + start
+        end = begin + length
+        if end <= MINUTES_PER_WEEK:
+            yield begin, end
+        else:
+            # Sunday night into Monday morning
+            yield begin, MINUTES_PER_WEEK
+            yield 0, end - MINUTES_PER_WEEK
+
+
+class ScheduleIndex:
+    """Active schedule profile per camera, answered from memory"""
+
+    def __init__(self):
+        self._rows = None
+        self._cameras = {}  # camera_id -> (boundaries, profile per segment)
+
+    def load(self, schedules):
+        """Rebuild from schedule rows if they changed; returns True if rebuilt"""
+        if schedules == self._rows:
+            return False
+        by_camera = {}
+        for schedule in schedules:
+            by_camera.setdefault(schedule['camera_id'], []).append(schedule)
+        # Swap the whole mapping at once: workers never see a half-built index
+        self._cameras = {camera_id: self._build(rows) for camera_id, rows in by_camera.items()}
+        self._rows = schedules
+        return True
+
+    @staticmethod
+    def _build(schedules):
+        windows = [(begin, end, schedule) for schedule in schedules
+                   for begin, end in schedule_windows(schedule)]
+        points = sorted({0, MINUTES_PER_WEEK} | {begin for begin, _, _ in windows} | {end for _, end, _ in windows})
+
+        boundaries, profiles = [], []
+        for begin, end in zip(points, points[1:]):
+            active = [schedule for start, stop, schedule in windows if start <= begin < stop]
+            # Overlapping profiles: highest priority wins, then the newest
+            profile = max(active, key=lambda s: (s['priority'] or 0, s['id'])) if active else None
+            if profiles and profiles[-1] is profile:
+                continue
+            boundaries.append(begin)
+            profiles.append(profile)
+        return boundaries, profiles
+
+    def active(self, camera_id, now=None):
+        """The camera's profile in effect at `now` (local time), or None"""
+        entry = self._cameras.get(camera_id)
+        if entry is None:
+            return None
+        now = now or datetime.now()
+        minute = now.weekday() * MINUTES_PER_DAY + now.hour * 60 + now.minute
+        boundaries, profiles = entry
+        return profiles[bisect_right(boundaries, minute) - 1]
+
+    def apply(self, camera_id, camera, now=None):
+        """Camera settings with the active profile's overrides applied"""
+        profile = self.active(camera_id, now)
+        if profile is None:
+            return camera
+        settings = dict(camera)
+        # A disarmed window pauses detection; an armed one doesn't override a manual pause
+        settings['detection_enabled'] = camera['detection_enabled'] and profile['armed']
+        for key in OVERRIDES:
+            if profile[key] is not None:
+                settings[key] = profile[key]
+        settings['schedule_profile'] = profile['name']
+        return settings
@@ -0,0 +1,468 @@
+"""
+Alert sinks
+
+Besides email and the WebSocket event, persisted alerts are delivered to
+the configured sinks:
+
+- webhook: JSON POST of a batch of alerts to ALERT_WEBHOOK_URL over a small
+  pool of keep-alive HTTP connections
+- mqtt: one message per alert on ALERT_MQTT_TOPIC (QoS 1), via paho-mqtt
+
+Sinks start with the engine's reconciler (AlertSinks.start()) and stop on
+engine shutdown. Every sink has its own delivery thread. The thread waits up to
+ALERT_SINK_BATCH_WAIT after the first alert for more to batch, so one
+alert goes out within milliseconds and a burst goes out as a few requests.
+A batch that fails is written to the sink's retry queue on disk
+(ALERT_SINK_QUEUE_PATH/<sink>/, one JSON file per batch) and retried with
+exponential backoff, also after a restart, until ALERT_SINK_MAX_AGE.
+Only the worker holding the queue directory's lock replays it, so two
+processes (or engines) sharing ALERT_SINK_QUEUE_PATH never send a batch twice.
+
+New sinks subclass AlertSink and implement send(). Local stand-ins for
+testing:
+
+    python sinks.py serve-webhook --port 8099     # prints every batch it receives
+    ALERT_WEBHOOK_URL=http://localhost:8099/alerts python sinks.py test
+    mosquitto -p 1883 & mosquitto_sub -t 'smartsurveil/#' -v
+"""
+import abc
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from config import Config
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+
+class SinkError(Exception):
+    """A batch could not be delivered"""
+
+
+class AlertSink(abc.ABC):
+    """Delivers batches of alert payloads somewhere; send() raises on failure"""
+
+    name = 'sink'
+
+    @abc.abstractmethod
+    def send(self, alerts):
+        """Deliver a list of alert payloads or raise"""
+
+    def close(self):
+        pass
+
+
+class WebhookSink(AlertSink):
+    """POSTs {"alerts": [...]} to a URL, reusing keep-alive connections"""
+
+    name = 'webhook'
+
+    def __init__(self, url, token=None, pool_size=None, timeout=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Invalid webhook URL '{url}'")
+        self.url = url
+        self.path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        https = parts.scheme == 'https'
+        self.connection_class = http.client.HTTPSConnection if https else http.client.HTTPConnection
+        self.host, self.port = parts.hostname, parts.port
+        self.timeout = timeout or Config.ALERT_SINK_TIMEOUT
+        self.headers = {'Content-Type': 'application/json'}
+        if token:
+            self.headers['Authorization'] = f'Bearer {token}'
+        self._pool = queue.LifoQueue(pool_size or Config.ALERT_WEBHOOK_POOL_SIZE)
+
+    def _connection(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def send(self, alerts):
+        body = json.dumps({'alerts': alerts}).encode('utf-8')
+        # A pooled connection may have been closed by the server: retry once on a fresh one
+        for attempt in range(2):
+            connection = self._connection() if attempt == 0 else \
+                self.connection_class(self.host, self.port, timeout=self.timeout)
+            try:
+                connection.request('POST', self.path, body=body, headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                if attempt:
+                    raise SinkError(f'{self.url}: {e}')
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            if not 200 <= response.status < 300:
+                raise SinkError(f'{self.url}: HTTP {response.status}')
+            return
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class MqttSink(AlertSink):
+    """Publishes each alert as a JSON message on `topic`/<camera_id> (QoS 1)"""
+
+    name = 'mqtt'
+
+    def __init__(self, host, port=1883, topic=None, username=None, password=None, timeout=None):
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            raise RuntimeError('The MQTT sink needs paho-mqtt (pip install paho-mqtt)')
+        self.topic = (topic or Config.ALERT_MQTT_TOPIC).rstrip('/')
+        self.timeout = timeout or Config.ALERT_SINK_TIMEOUT
+        # Unique per process: a broker disconnects the older of two clients with the same id
+        client_id = f'smartsurveil-{Config.NODE_ID}-{os.getpid()}'
+        try:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        except AttributeError:
+            # paho-mqtt < 2.0
+            self.client = mqtt.Client(client_id=client_id)
+        if username:
+            self.client.username_pw_set(username, password)
+        # Connects in the background and reconnects on its own
+        self.client.connect_async(host, port)
+        self.client.loop_start()
+
+    def send(self, alerts):
+        messages = [
+            self.client.publish(f"{self.topic}/{alert['camera_id']}", json.dumps(alert), qos=1)
+            for alert in alerts
+        ]
+        deadline = time.monotonic() + self.timeout
+        for message in messages:
+            try:
+                message.wait_for_publish(max(deadline - time.monotonic(), 0.001))
+            except (RuntimeError, ValueError) as e:
+                # Not connected / queue full
+                raise SinkError(f'mqtt: {e}')
+            if not message.is_published():
+                raise SinkError('mqtt: broker did not acknowledge in time')
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class RetryQueue:
+    """Failed batches of one sink, as JSON files in a directory (oldest first)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._sequence = itertools.count()
+        self._lock_file = None
+
+    def acquire(self):
+        """Take the directory's lock without waiting; True if this queue may be replayed"""
+        if self._lock_file is not None:
+            return True
+        os.makedirs(self.path, exist_ok=True)
+        lock_file = open(os.path.join(self.path, '.lock'), 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def release(self):
+        # Closing the file drops the lock
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def put(self, alerts):
+        os.makedirs(self.path, exist_ok=True)
+        name = f'{time.time():017.6f}_{os.getpid()}_{next(self._sequence)}.json'
+        temp = os.path.join(self.path, f'.{name}')
+        with open(temp, 'w') as f:
+            json.dump(alerts, f)
+        # Rename so a crash never leaves a half-written batch behind
+        os.replace(temp, os.path.join(self.path, name))
+
+    def pending(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path) if name.endswith('.json') and not name.startswith('.'))
+
+    def load(self, name):
+        with open(os.path.join(self.path, name)) as f:
+            return json.load(f)
+
+    def remove(self, name):
+        try:
+            os.remove(os.path.join(self.path, name))
+        except OSError:
+            pass
+
+    @staticmethod
+    def created_at(name):
+        return float(name.split('_', 1)[0])
+
+
+class SinkWorker:
+    """Batches, delivers and retries alerts for one sink on its own thread"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.queue = queue.Queue(Config.ALERT_SINK_MAX_PENDING)
+        self.retries = RetryQueue(os.path.join(Config.ALERT_SINK_QUEUE_PATH, sink.name))
+        self.retry_delay = Config.ALERT_SINK_RETRY_INTERVAL
+        self.next_retry = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'sink-{sink.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Finish the batch in flight, then close the sink (pending alerts are parked on disk)"""
+        self._stop.set()
+        try:
+            self.queue.put_nowait(None)  # Wake the thread
+        except queue.Full:
+            pass
+        self._thread.join(timeout if timeout is not None else Config.ALERT_SINK_TIMEOUT + 1)
+        while True:
+            try:
+                alert = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if alert is not None:
+                self.retries.put([alert])
+        self.sink.close()
+        self.retries.release()
+
+    def put(self, alert):
+        try:
+            self.queue.put_nowait(alert)
+        except queue.Full:
+            # Delivery is stuck; don't hold alerts in memory, park them on disk
+            self.retries.put([alert])
+
+    def _batch(self, first):
+        alerts = [first]
+        deadline = time.monotonic() + Config.ALERT_SINK_BATCH_WAIT
+        while len(alerts) < Config.ALERT_SINK_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                alert = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if alert is None:
+                break
+            alerts.append(alert)
+        return alerts
+
+    def deliver(self, alerts):
+        """Send a batch; True on success"""
+        started = time.monotonic()
+        try:
+            self.sink.send(alerts)
+        except Exception as e:
+            metrics.incr(f'sink_{self.sink.name}_failures')
+            log.warning("Alert sink %s failed: %s", self.sink.name, e)
+            return False
+        metrics.incr(f'sink_{self.sink.name}_delivered', len(alerts))
+        metrics.observe(f'sink_{self.sink.name}_latency', time.monotonic() - started)
+        return True
+
+    def retry_pending(self):
+        """Resend parked batches, oldest first; stop at the first failure
+
+        Does nothing unless this worker holds the queue directory's lock.
+        """
+        if not self.retries.acquire():
+            return True
+        for name in self.retries.pending():
+            if time.time() - self.retries.created_at(name) > Config.ALERT_SINK_MAX_AGE:
+                log.warning("Dropping undelivered alert batch %s for sink %s", name, self.sink.name)
+                metrics.incr(f'sink_{self.sink.name}_expired')
+                self.retries.remove(name)
+                continue
+            try:
+                alerts = self.retries.load(name)
+            except (OSError, ValueError):
+                self.retries.remove(name)
+                continue
+            if not self.deliver(alerts):
+                return False
+            self.retries.remove(name)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self.queue.get(timeout=Config.ALERT_SINK_RETRY_INTERVAL)
+            except queue.Empty:
+                first = None
+            if first is not None:
+                alerts = self._batch(first)
+                if not self.deliver(alerts):
+                    self.retries.put(alerts)
+                    self.next_retry = time.monotonic() + self.retry_delay
+
+            if time.monotonic() >= self.next_retry:
+                if self.retry_pending():
+                    self.retry_delay = Config.ALERT_SINK_RETRY_INTERVAL
+                else:
+                    self.retry_delay = min(self.retry_delay * 2, Config.ALERT_SINK_RETRY_MAX_DELAY)
+                self.next_retry = time.monotonic() + self.retry_delay
+            metrics.set(f'sink_{self.sink.name}_backlog', len(self.retries.pending()))
+
+
+class AlertSinks:
+    """The configured sinks; publish() hands an alert to each without blocking
+
+    Nothing connects or starts a thread until start(), so an engine that is
+    built but never run (e.g. app.py's when asgi.py swaps in its own) costs
+    nothing and doesn't compete for the retry queues.
+    """
+
+    def __init__(self, sinks=None):
+        self._sinks = sinks
+        self._lock = threading.Lock()
+        self.workers = []
+        self.started = False
+
+    def start(self):
+        """Connect the sinks and start their threads; idempotent"""
+        with self._lock:
+            if self.started:
+                return
+            sinks = configured_sinks() if self._sinks is None else self._sinks
+            self.workers = [SinkWorker(sink) for sink in sinks]
+            self.started = True
+
+    def stop(self):
+        with self._lock:
+            workers, self.workers = self.workers, []
+            self.started = False
+        for worker in workers:
+            worker.stop()
+
+    def publish(self, alert):
+        if not self.workers:
+            return
+        payload = alert_payload(alert)
+        for worker in self.workers:
+            worker.put(payload)
+
+    def status(self):
+        return {worker.sink.name: {'pending': worker.queue.qsize(), 'backlog': len(worker.retries.pending())}
+                for worker in self.workers}
+
+
+def alert_payload(alert):
+    """JSON body of an alert for sinks (the image by URL path, not the local file)"""
+    payload = {key: value for key, value in alert.items() if key != 'image_path'}
+    if alert.get('image_path'):
+        payload['image_url'] = f"/api/alerts/{os.path.basename(alert['image_path'])}"
+    return payload
+
+
+def configured_sinks():
+    """Sinks enabled in Config; a sink that can't be set up is logged and skipped"""
+    factories = []
+    if Config.ALERT_WEBHOOK_URL:
+        factories.append(lambda: WebhookSink(Config.ALERT_WEBHOOK_URL, Config.ALERT_WEBHOOK_TOKEN))
+    if Config.ALERT_MQTT_HOST:
+        factories.append(lambda: MqttSink(Config.ALERT_MQTT_HOST, Config.ALERT_MQTT_PORT, Config.ALERT_MQTT_TOPIC,
+                                          Config.ALERT_MQTT_USERNAME, Config.ALERT_MQTT_PASSWORD))
+    sinks = []
+    for factory in factories:
+        try:
+            sinks.append(factory())
+        except (ValueError, RuntimeError) as e:
+            log.error("Alert sink disabled: %s", e)
+    return sinks
+
+
+class _WebhookStandIn(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like a real receiver
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        alerts = json.loads(body).get('alerts', [])
+        print(f"{datetime.now().isoformat(timespec='milliseconds')} received {len(alerts)} alert(s) "
+              f"on {self.path}: {json.dumps(alerts)}", flush=True)
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Alert sink tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve-webhook', help='Local webhook receiver that prints what it gets')
+    serve.add_argument('--port', type=int, default=8099)
+    serve.add_argument('--status', type=int, default=200, help='HTTP status to answer (e.g. 503 to test retries)')
+
+    test = subparsers.add_parser('test', help='Send test alerts through the configured sinks')
+    test.add_argument('--count', type=int, default=1)
+
+    args = parser.parse_args()
+    if args.command == 'serve-webhook':
+        server = ThreadingHTTPServer(('127.0.0.1', args.port), _WebhookStandIn)
+        server.status = args.status
+        print(f"Webhook stand-in listening on http://127.0.0.1:{args.port}/")
+        server.serve_forever()
+        return
+
+    from logs import setup_logging
+    setup_logging()
+    sinks = AlertSinks()
+    sinks.start()
+    if not sinks.workers:
+        parser.error('No sinks configured (set ALERT_WEBHOOK_URL and/or ALERT_MQTT_HOST)')
+    for i in range(args.count):
+        sinks.publish({'camera_id': 0, 'camera_name': 'Test', 'person_count': 1,
+                       'timestamp': datetime.now().isoformat(), 'log_id': -(i + 1)})
+    time.sleep(Config.ALERT_SINK_BATCH_WAIT + Config.ALERT_SINK_TIMEOUT)
+    print(json.dumps(sinks.status()))
+    sinks.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Per-viewer frame streaming
+
+Viewers subscribe to the cameras they have on screen and ask for a max fps,
+width and JPEG quality. Requests are snapped to a small set of quality
+tiers; each tier is a Socket.IO room, and every distinct width/quality pair
+is encoded at most once per frame no matter how many viewers share it.
+"""
+import base64
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+from config import Config
+from metrics import metrics
+
+Tier = namedtuple('Tier', ['width', 'quality', 'fps'])
+
+
+def _snap(value, levels, default):
+    """Largest level not above value (smallest level if value is below all of them)"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    candidates = [level for level in levels if level <= value]
+    return max(candidates) if candidates else min(levels)
+
+
+def make_tier(max_fps=None, width=None, quality=None):
+    """Snap a viewer's request to a shared tier"""
+    return Tier(
+        width=_snap(width, Config.STREAM_WIDTHS, Config.STREAM_WIDTHS[-1]),
+        quality=_snap(quality, Config.STREAM_QUALITIES, Config.STREAM_QUALITIES[-1]),
+        fps=_snap(max_fps, Config.STREAM_FPS_LEVELS, Config.STREAM_FPS_LEVELS[-1])
+    )
+
+
+def camera_room(camera_id):
+    """Room holding every viewer of a camera"""
+    return f'camera_{camera_id}'
+
+
+def tier_room(camera_id, tier):
+    """Room holding the viewers of a camera at one tier"""
+    return f'camera_{camera_id}:{tier.width}w:{tier.quality}q:{tier.fps}fps'
+
+
+class StreamHub:
+    """Tracks camera subscriptions and renders frames once per tier"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # camera_id -> {sid: Tier}
+        self._remote = {}  # camera_id -> {Tier} wanted by viewers on other nodes
+        self._last_sent = {}  # (camera_id, Tier) -> time of last frame
+        # Caps applied to every tier while the box is overloaded (see overload.py)
+        self.fps_cap = None
+        self.quality_cap = None
+
+    def subscribe(self, sid, camera_id, max_fps=None, width=None, quality=None):
+        """Subscribe a viewer; returns (rooms to leave, rooms to join)"""
+        tier = make_tier(max_fps, width, quality)
+        with self._lock:
+            viewers = self._subscriptions.setdefault(camera_id, {})
+            previous = viewers.get(sid)
+            viewers[sid] = tier
+
+        leave = [tier_room(camera_id, previous)] if previous and previous != tier else []
+        return leave, [camera_room(camera_id), tier_room(camera_id, tier)]
+
+    def unsubscribe(self, sid, camera_id):
+        """Unsubscribe a viewer; returns rooms to leave"""
+        with self._lock:
+            viewers = self._subscriptions.get(camera_id, {})
+            tier = viewers.pop(sid, None)
+            if not viewers:
+                self._subscriptions.pop(camera_id, None)
+
+        if tier is None:
+            return []
+        return [camera_room(camera_id), tier_room(camera_id, tier)]
+
+    def disconnect(self, sid):
+        """Forget every subscription of a viewer"""
+        with self._lock:
+            for camera_id in list(self._subscriptions):
+                viewers = self._subscriptions[camera_id]
+                viewers.pop(sid, None)
+                if not viewers:
+                    del self._subscriptions[camera_id]
+
+    def tiers(self, camera_id):
+        """Distinct tiers currently wanted for a camera, on any node"""
+        with self._lock:
+            local = set(self._subscriptions.get(camera_id, {}).values())
+            return local | self._remote.get(camera_id, set())
+
+    def has_viewers(self, camera_id):
+        return bool(self.tiers(camera_id))
+
+    def local_demand(self):
+        """(camera_id, Tier) pairs wanted by viewers connected to this node"""
+        with self._lock:
+            return {(camera_id, tier)
+                    for camera_id, viewers in self._subscriptions.items()
+                    for tier in viewers.values()}
+
+    def set_remote_demand(self, demand):
+        """Replace the tiers wanted by viewers on other nodes (cluster mode)"""
+        remote = {}
+        for camera_id, tier in demand:
+            remote.setdefault(camera_id, set()).add(tier)
+        with self._lock:
+            self._remote = remote
+
+    def due_tiers(self, camera_id, now=None):
+        """Tiers whose fps budget allows a frame now (marks them as sent)"""
+        now = now or time.time()
+        fps_cap = self.fps_cap
+        due = []
+        for tier in self.tiers(camera_id):
+            key = (camera_id, tier)
+            fps = min(tier.fps, fps_cap) if fps_cap else tier.fps
+            # Small slack so a 30 fps tier isn't skipped by loop jitter
+            if now - self._last_sent.get(key, 0) >= 0.9 / fps:
+                self._last_sent[key] = now
+                due.append(tier)
+        return due
+
+    def render(self, camera_id, frame, tiers):
+        """Encode a frame for each tier; returns [(room, payload)]"""
+        timestamp = time.time()
+        frame_w = frame.shape[1]
+        quality_cap = self.quality_cap
+        encoded = {}
+        messages = []
+
+        for tier in tiers:
+            width = min(tier.width, frame_w)
+            quality = min(tier.quality, quality_cap) if quality_cap else tier.quality
+            key = (width, quality)
+            if key not in encoded:
+                with metrics.cpu_timer('encode_cpu', camera_id):
+                    image = frame
+                    if width < frame_w:
+                        height = int(frame.shape[0] * width / frame_w)
+                        image = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                    encoded[key] = base64.b64encode(buffer).decode('utf-8')
+
+            messages.append((tier_room(camera_id, tier), {
+                'frame': encoded[key],
+                'timestamp': timestamp,
+                'width': width,
+                'quality': quality
+            }))
+
+        return messages
@@ -1,7 +1,12 @@
 const API_URL = 'http://localhost:5000/api';
 const SOCKET_URL = 'http://localhost:5000';
 
+// Tile streams are small and low-rate; the server snaps these to its nearest tier
+const TILE_STREAM = { max_fps: 10, width: 480, quality: 70 };
+
 let socket;
+let cameraObserver;
+let visibleCameras = new Set();
 let cameras = [];
 let logs = [];
 let token = localStorage.getItem('token');
@@ -57,18 +62,14 @@ function setupEventListeners() {
 }
 
 function connectWebSocket() {
-    socket = io(SOCKET_URL);
+    // The token lets the server check that we own the cameras we subscribe to
+    socket = io(SOCKET_URL, { auth: { token } });
 
     socket.on('connect', () => {
         console.log('WebSocket connected');
 
-        cameras.forEach(camera => {
-            socket.emit('start_camera', { camera_id: camera.id });
-
-            socket.on(`camera_frame_${camera.id}`, (data) => {
-                updateCameraFrame(camera.id, data.frame);
-            });
-        });
+        // Subscriptions are per connection, so renew them after a reconnect
+        visibleCameras.forEach(cameraId => subscribeCamera(cameraId));
     });
 
     socket.on('disconnect', () => {
@@ -80,6 +81,45 @@ function connectWebSocket() {
     });
 }
 
+function subscribeCamera(cameraId) {
+    if (!socket || !socket.connected) return;
+
+    socket.off(`camera_frame_${cameraId}`);
+    socket.on(`camera_frame_${cameraId}`, (data) => {
+        updateCameraFrame(cameraId, data.frame);
+    });
+    socket.emit('subscribe_camera', { camera_id: cameraId, ...TILE_STREAM });
+}
+
+function unsubscribeCamera(cameraId) {
+    if (!socket) return;
+
+    socket.off(`camera_frame_${cameraId}`);
+    socket.emit('unsubscribe_camera', { camera_id: cameraId });
+}
+
+function observeCameraTiles() {
+    // Only stream the tiles that are on screen
+    if (cameraObserver) cameraObserver.disconnect();
+    visibleCameras.forEach(cameraId => unsubscribeCamera(cameraId));
+    visibleCameras = new Set();
+
+    cameraObserver = new IntersectionObserver((entries) => {
+        entries.forEach(entry => {
+            const cameraId = Number(entry.target.dataset.cameraId);
+            if (entry.isIntersecting && !visibleCameras.has(cameraId)) {
+                visibleCameras.add(cameraId);
+                subscribeCamera(cameraId);
+            } else if (!entry.isIntersecting && visibleCameras.has(cameraId)) {
+                visibleCameras.delete(cameraId);
+                unsubscribeCamera(cameraId);
+            }
+        });
+    });
+
+    document.querySelectorAll('.camera-card').forEach(card => cameraObserver.observe(card));
+}
+
 async function loadCameras() {
     try {
         const response = await fetch(`${API_URL}/cameras`, {
@@ -105,11 +145,12 @@ function renderCameras() {
 
     if (cameras.length === 0) {
         grid.innerHTML = '<p style="color: #9ca3af;">No cameras added yet. Click "Add Camera" to get started.</p>';
+        observeCameraTiles();
         return;
     }
 
     grid.innerHTML = cameras.map(camera => `
-        <div class="camera-card" id="camera-${camera.id}">
+        <div class="camera-card" id="camera-${camera.id}" data-camera-id="${camera.id}">
             <div class="camera-header">
                 <h3>${camera.name}</h3>
                 <button class="btn btn-sm" onclick="showROIModal(${camera.id})">⚙️</button>
@@ -126,6 +167,8 @@ function renderCameras() {
             </div>
         </div>
     `).join('');
+
+    observeCameraTiles();
 }
 
 function updateCameraFrame(cameraId, frameData) {
@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { Socket } from "socket.io-client";
 import { Plus, Play, Pause, Maximize2, Settings as SettingsIcon, Trash2 } from "lucide-react";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
@@ -12,6 +12,10 @@ import { useToast } from "@/hooks/use-toast";
 
 const API_URL = 'http://localhost:5000/api';
 
+// The server snaps requests to its nearest quality tier
+const TILE_STREAM = { max_fps: 10, width: 480, quality: 70 };
+const FULLSCREEN_STREAM = { max_fps: 30, width: 1280, quality: 85 };
+
 interface CameraGridProps {
   cameras: Camera[];
   socket: Socket | null;
@@ -38,47 +42,105 @@ const CameraGrid = ({ cameras, socket, onRefresh }: CameraGridProps) => {
     setPausedCameras(paused);
   }, [cameras]);
 
+  const [visibleCameras, setVisibleCameras] = useState<Set<number>>(new Set());
+  const tileRefs = useRef<Record<number, HTMLDivElement | null>>({});
+  const subscribed = useRef<Record<number, string>>({});
+
+  // Track which tiles are on screen; only those get streamed
+  useEffect(() => {
+    const observer = new IntersectionObserver((entries) => {
+      setVisibleCameras(prev => {
+        const next = new Set(prev);
+        entries.forEach(entry => {
+          const cameraId = Number((entry.target as HTMLElement).dataset.cameraId);
+          if (entry.isIntersecting) {
+            next.add(cameraId);
+          } else {
+            next.delete(cameraId);
+          }
+        });
+        return next;
+      });
+    });
+
+    cameras.forEach(camera => {
+      const tile = tileRefs.current[camera.id];
+      if (tile) observer.observe(tile);
+    });
+
+    return () => {
+      observer.disconnect();
+      setVisibleCameras(new Set());
+    };
+  }, [cameras]);
+
+  // Reconcile subscriptions with the visible tiles (and the fullscreen camera)
   useEffect(() => {
     if (!socket) return;
 
-    // Wait for socket to connect before setting up listeners
-    const setupCameraStreams = () => {
-      if (!socket.connected) {
-        console.log('Socket not connected yet, waiting...');
-        return;
+    const syncSubscriptions = () => {
+      if (!socket.connected) return;
+
+      const wanted: Record<number, typeof TILE_STREAM> = {};
+      visibleCameras.forEach(cameraId => {
+        wanted[cameraId] = TILE_STREAM;
+      });
+      if (fullscreenCamera) {
+        wanted[fullscreenCamera.id] = FULLSCREEN_STREAM;
       }
 
-      console.log('Setting up camera streams for', cameras.length, 'cameras');
+      Object.keys(subscribed.current).map(Number).forEach(cameraId => {
+        if (!wanted[cameraId]) {
+          socket.off(`camera_frame_${cameraId}`);
+          socket.emit('unsubscribe_camera', { camera_id: cameraId });
+          delete subscribed.current[cameraId];
+        }
+      });
 
-      cameras.forEach(camera => {
-        // Remove any existing listener first
-        socket.off(`camera_frame_${camera.id}`);
-        
-        // Register new listener
-        socket.on(`camera_frame_${camera.id}`, (data: { frame: string }) => {
-          setFrames(prev => ({ ...prev, [camera.id]: data.frame }));
-        });
+      Object.entries(wanted).forEach(([id, stream]) => {
+        const cameraId = Number(id);
+        const key = JSON.stringify(stream);
+        if (subscribed.current[cameraId] === key) return;
 
-        // Request camera stream
-        console.log('Requesting stream for camera', camera.id);
-        socket.emit('start_camera', { camera_id: camera.id });
+        if (subscribed.current[cameraId] === undefined) {
+          socket.on(`camera_frame_${cameraId}`, (data: { frame: string }) => {
+            setFrames(prev => ({ ...prev, [cameraId]: data.frame }));
+          });
+        }
+        socket.emit('subscribe_camera', { camera_id: cameraId, ...stream });
+        subscribed.current[cameraId] = key;
       });
     };
 
-    if (socket.connected) {
-      setupCameraStreams();
-    } else {
-      // Wait for connection
-      socket.on('connect', setupCameraStreams);
-    }
+    // Subscriptions are per connection, so renew them all after a reconnect
+    const resubscribe = () => {
+      Object.keys(subscribed.current).map(Number).forEach(cameraId => {
+        socket.off(`camera_frame_${cameraId}`);
+      });
+      subscribed.current = {};
+      syncSubscriptions();
+    };
+
+    syncSubscriptions();
+    socket.on('connect', resubscribe);
+
+    return () => {
+      socket.off('connect', resubscribe);
+    };
+  }, [socket, visibleCameras, fullscreenCamera]);
+
+  // Drop every subscription when the grid goes away
+  useEffect(() => {
+    if (!socket) return;
 
     return () => {
-      cameras.forEach(camera => {
-        socket.off(`camera_frame_${camera.id}`);
+      Object.keys(subscribed.current).map(Number).forEach(cameraId => {
+        socket.off(`camera_frame_${cameraId}`);
+        socket.emit('unsubscribe_camera', { camera_id: cameraId });
       });
-      socket.off('connect', setupCameraStreams);
+      subscribed.current = {};
     };
-  }, [socket, cameras]);
+  }, [socket]);
 
   const handleDeleteCamera = async (cameraId: number) => {
     if (!confirm('Are you sure you want to delete this camera? This will also delete all associated intrusion logs.')) return;
@@ -179,7 +241,12 @@ const CameraGrid = ({ cameras, socket, onRefresh }: CameraGridProps) => {
             : (camera.is_active ? 'online' : 'offline');
 
           return (
-          <Card key={camera.id} className="overflow-hidden hover-lift">
+          <Card
+            key={camera.id}
+            ref={(el) => { tileRefs.current[camera.id] = el; }}
+            data-camera-id={camera.id}
+            className="overflow-hidden hover-lift"
+          >
             <CardHeader className="pb-3">
               <div className="flex items-center justify-between">
                 <CardTitle className="text-base">{camera.name}</CardTitle>
@@ -4,6 +4,7 @@ import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
+import { Switch } from "@/components/ui/switch";
 import { Camera } from "@/pages/Dashboard";
 import { useToast } from "@/hooks/use-toast";
 import ROISelectorContent from "./ROISelectorContent";
@@ -25,6 +26,9 @@ const CameraSettings = ({ camera, frame, open, onOpenChange, onSuccess }: Camera
   const [streamUrl, setStreamUrl] = useState("");
   const [confidenceThreshold, setConfidenceThreshold] = useState(50);
   const [alertInterval, setAlertInterval] = useState(30);
+  const [confirmHits, setConfirmHits] = useState(1);
+  const [confirmFrames, setConfirmFrames] = useState(1);
+  const [verifyAlerts, setVerifyAlerts] = useState(false);
   const { toast } = useToast();
   const token = localStorage.getItem('token');
 
@@ -77,7 +81,10 @@ const CameraSettings = ({ camera, frame, open, onOpenChange, onSuccess }: Camera
         },
         body: JSON.stringify({
           confidence_threshold: confidenceValue,
-          alert_interval: alertInterval
+          alert_interval: alertInterval,
+          confirm_hits: confirmHits,
+          confirm_frames: confirmFrames,
+          verify_alerts: verifyAlerts
         })
       });
 
@@ -108,6 +115,9 @@ const CameraSettings = ({ camera, frame, open, onOpenChange, onSuccess }: Camera
       // Convert confidence from 0.0-1.0 to 0-100 for display
       setConfidenceThreshold(Math.round((camera.confidence_threshold || 0.5) * 100));
       setAlertInterval(camera.alert_interval || 30);
+      setConfirmHits(camera.confirm_hits || 1);
+      setConfirmFrames(camera.confirm_frames || 1);
+      setVerifyAlerts(!!camera.verify_alerts);
     }
   }, [camera]);
 
@@ -243,6 +253,49 @@ const CameraSettings = ({ camera, frame, open, onOpenChange, onSuccess }: Camera
                     </p>
                   </div>
 
+                  <div className="space-y-2">
+                    <Label>Alert Confirmation</Label>
+                    <div className="flex items-center gap-2">
+                      <Input
+                        id="confirm-hits"
+                        type="number"
+                        min="1"
+                        max={confirmFrames}
+                        value={confirmHits}
+                        onChange={(e) => setConfirmHits(Number(e.target.value))}
+                        className="w-20"
+                      />
+                      <span className="text-sm text-muted-foreground">detections in the last</span>
+                      <Input
+                        id="confirm-frames"
+                        type="number"
+                        min="1"
+                        max="30"
+                        value={confirmFrames}
+                        onChange={(e) => setConfirmFrames(Number(e.target.value))}
+                        className="w-20"
+                      />
+                      <span className="text-sm text-muted-foreground">frames</span>
+                    </div>
+                    <p className="text-xs text-muted-foreground">
+                      A person must be seen in this many recent frames before an alert is sent.
+                    </p>
+                  </div>
+
+                  <div className="space-y-2">
+                    <div className="flex items-center gap-2">
+                      <Switch
+                        id="verify-alerts"
+                        checked={verifyAlerts}
+                        onCheckedChange={setVerifyAlerts}
+                      />
+                      <Label htmlFor="verify-alerts">Verify alerts</Label>
+                    </div>
+                    <p className="text-xs text-muted-foreground">
+                      Re-check the detected area at higher resolution before alerting. Fewer false alarms, slightly more CPU.
+                    </p>
+                  </div>
+
                   <div className="space-y-2">
                     <Label>Recording</Label>
                     <p className="text-sm text-muted-foreground">
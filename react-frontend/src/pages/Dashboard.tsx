@@ -22,6 +22,9 @@ export interface Camera {
   roi_height?: number;
   confidence_threshold?: number; // 0.0-1.0 range
   alert_interval?: number;       // seconds between alerts
+  confirm_hits?: number;         // alert after K frames with people...
+  confirm_frames?: number;       // ...among the last M frames
+  verify_alerts?: boolean;       // second model pass on the candidate region
 }
 
 export interface IntrusionLog {
@@ -72,6 +75,7 @@ const Dashboard = () => {
 
   const connectWebSocket = () => {
     const newSocket = io(SOCKET_URL, {
+      auth: { token },  // Lets the server check camera ownership on subscribe
       transports: ['websocket', 'polling'],
       reconnection: true,
       reconnectionDelay: 1000,